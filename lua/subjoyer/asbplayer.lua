@@ -8,7 +8,13 @@ M.job_id = nil
 M.is_running = false
 M.is_connected = false -- Track if asbplayer client is connected
 M.message_counter = 0
-M.pending_requests = {} -- Track pending requests by messageId
+M.pending_requests = {} -- Callbacks by messageId; the bridge answers or times out each one
+M.stats = nil -- Latest asbplayer_stats event (command rate and round-trip latency)
+M.cue_tracks = nil -- Cue counts per track of the files the bridge has parsed (asbplayer_cues_loaded)
+M.spool_depth = 0 -- Mined cards the bridge holds until asbplayer acknowledges them
+M.spool_unknown = {} -- Spooled cards sent but never answered: { { messageId = ..., fields = {...} } }
+M.client_count = 0 -- Connected asbplayer clients (tabs)
+M.active_client = nil -- "ip:port" of the client commands go to
 
 M.callbacks = {
   on_connected = nil,
@@ -16,6 +22,19 @@ M.callbacks = {
   on_error = nil,
   on_ready = nil,
   on_response = nil,
+  on_cues_loaded = nil,
+  on_spool_unknown = nil,
+  on_spool_result = nil,
+}
+
+-- Commands the bridge answers itself from its cue index (no asbplayer client needed)
+local LOCAL_COMMANDS = {
+  ['next-cues'] = true,
+  ['cues-around'] = true,
+  ['list-clients'] = true,
+  ['select-client'] = true,
+  ['log'] = true,
+  ['spool-resolve'] = true,
 }
 
 -- Get script path
@@ -25,6 +44,14 @@ local function get_script_path()
   return plugin_root .. '/scripts/ws_server_8766.py'
 end
 
+-- Mining spool file passed to the bridge, or nil if spooling is off
+function M.spool_path(config)
+  if not config.asbplayer.spool then
+    return nil
+  end
+  return config.asbplayer.spool_file or (vim.fn.stdpath('data') .. '/subjoyer/mining_spool.jsonl')
+end
+
 -- Log debug message
 local function debug_log(msg, config)
   if config and config.asbplayer and config.asbplayer.debug then
@@ -45,6 +72,15 @@ local function generate_message_id()
   return 'nvim-' .. M.message_counter .. '-' .. vim.loop.now()
 end
 
+-- Fail every pending request (bridge gone; no response or timeout will come)
+local function fail_pending(reason)
+  local pending = M.pending_requests
+  M.pending_requests = {}
+  for _, request in pairs(pending) do
+    request.callback({ error = reason })
+  end
+end
+
 -- Parse JSON line
 local function parse_json(line)
   local ok, data = pcall(vim.json.decode, line)
@@ -79,14 +115,19 @@ local function handle_message(data, config)
 
   elseif data.type == 'asbplayer_connected' then
     M.is_connected = true
+    M.client_count = data.clients or 1
+    M.active_client = data.active or data.client
     debug_log('asbplayer client connected: ' .. (data.client or 'unknown'), config)
     if M.callbacks.on_connected then
       M.callbacks.on_connected(data)
     end
 
   elseif data.type == 'asbplayer_disconnected' then
-    M.is_connected = false
-    debug_log('asbplayer client disconnected', config)
+    -- Other tabs may still be connected
+    M.client_count = data.clients or 0
+    M.is_connected = M.client_count > 0
+    M.active_client = data.active
+    debug_log('asbplayer client disconnected: ' .. (data.client or 'unknown'), config)
     if M.callbacks.on_disconnected then
       M.callbacks.on_disconnected(data)
     end
@@ -103,6 +144,9 @@ local function handle_message(data, config)
         end
         -- Remove from pending
         M.pending_requests[response.messageId] = nil
+      elseif data.spooled and M.callbacks.on_spool_result then
+        -- A spooled card sent after its caller was told it is waiting
+        M.callbacks.on_spool_result(response)
       end
     end
 
@@ -111,13 +155,67 @@ local function handle_message(data, config)
       M.callbacks.on_response(response)
     end
 
+  elseif data.type == 'asbplayer_late_response' then
+    -- Answer to a command that already timed out; its caller was told then
+    debug_log('Late response: ' .. vim.inspect(data.data), config)
+    if data.spooled and M.callbacks.on_spool_result then
+      -- A card reported as unconfirmed was answered after all
+      M.callbacks.on_spool_result(data.data)
+    end
+
+  elseif data.type == 'asbplayer_timeout' then
+    -- The bridge gave up on a command (no answer in time, or too many pending)
+    local pending = M.pending_requests[data.messageId]
+    if pending then
+      M.pending_requests[data.messageId] = nil
+      if data.sent and data.command == 'mine-subtitle' then
+        -- asbplayer got the card but never answered; it may be in Anki already
+        pending.callback({ unknown = true, spooled = data.spooled })
+      elseif data.spooled then
+        -- The card stays in the spool and is sent again
+        pending.callback({ spooled = true, depth = M.spool_depth })
+      else
+        pending.callback({ error = data.reason == 'queue_full' and 'Too many pending requests' or 'Request timeout' })
+      end
+    end
+
+  elseif data.type == 'asbplayer_spooled' then
+    -- Mined while asbplayer is away; the bridge sends it once a client connects
+    M.spool_depth = data.depth
+    local pending = M.pending_requests[data.messageId]
+    if pending then
+      M.pending_requests[data.messageId] = nil
+      pending.callback({ spooled = true, depth = data.depth })
+    end
+
+  elseif data.type == 'asbplayer_spool' then
+    M.spool_depth = data.depth
+    M.spool_unknown = data.unknown or {}
+    if #M.spool_unknown > 0 and M.callbacks.on_spool_unknown then
+      M.callbacks.on_spool_unknown(M.spool_unknown)
+    end
+
+  elseif data.type == 'asbplayer_stats' then
+    M.stats = data
+
+  elseif data.type == 'asbplayer_cues_loaded' then
+    M.cue_tracks = data.tracks
+    debug_log('Cues loaded: ' .. table.concat(data.tracks or {}, ', '), config)
+    if M.callbacks.on_cues_loaded then
+      M.callbacks.on_cues_loaded(data)
+    end
+
   elseif data.type == 'asbplayer_server_shutdown' then
     M.is_running = false
     M.is_connected = false
+    M.client_count = 0
+    M.active_client = nil
     debug_log('Server shutdown: ' .. (data.reason or 'unknown'), config)
   end
 end
 
+M.handle_message = handle_message
+
 -- Send command to asbplayer via stdin
 local function send_command(command, callback)
   if not M.job_id then
@@ -127,7 +225,8 @@ local function send_command(command, callback)
     return nil
   end
 
-  if not M.is_connected then
+  local spooled = command.command == 'mine-subtitle' and require('subjoyer.config').get().asbplayer.spool
+  if not M.is_connected and not LOCAL_COMMANDS[command.command] and not spooled then
     if callback then
       callback({ error = 'asbplayer not connected' })
     end
@@ -138,21 +237,13 @@ local function send_command(command, callback)
   local message_id = generate_message_id()
   command.messageId = message_id
 
-  -- Store pending request
+  -- Store pending request (the bridge times it out, see asbplayer_timeout)
   if callback then
     M.pending_requests[message_id] = {
       command = command.command,
       callback = callback,
       timestamp = vim.loop.now()
     }
-
-    -- Timeout after 10 seconds
-    vim.defer_fn(function()
-      if M.pending_requests[message_id] then
-        M.pending_requests[message_id] = nil
-        callback({ error = 'Request timeout' })
-      end
-    end, 10000)
   end
 
   -- Send to Python process via stdin
@@ -168,7 +259,8 @@ local function send_command(command, callback)
     return nil
   end
 
-  vim.notify('[subjoyer:asbplayer] DEBUG: Sent command: ' .. json, vim.log.levels.INFO)
+  -- Look-ahead sends next-cues on every subtitle, so this is debug-only
+  debug_log('Sent command: ' .. json, require('subjoyer.config').get())
 
   return message_id
 end
@@ -208,24 +300,30 @@ function M.start(config)
     script_path,
     '--host', config.asbplayer.host,
     '--port', tostring(config.asbplayer.port),
+    '--stats-interval', tostring(config.connection.stats_interval),
+    '--max-in-flight', tostring(config.asbplayer.max_in_flight),
+    '--command-timeout', tostring(config.asbplayer.command_timeout),
+    '--log-level', (config.asbplayer.debug or config.behavior.debug) and 'debug' or config.behavior.log_level,
   }
 
+  local spool = M.spool_path(config)
+  if spool then
+    vim.list_extend(cmd, { '--spool', spool })
+  end
+
   debug_log('Starting: ' .. table.concat(cmd, ' '), config)
 
   -- Start job
   M.job_id = vim.fn.jobstart(cmd, {
-    on_stdout = function(_, data, _)
-      for _, line in ipairs(data) do
-        if line and line ~= '' then
-          local parsed, err = parse_json(line)
-          if parsed then
-            handle_message(parsed, config)
-          elseif config.asbplayer and config.asbplayer.debug then
-            debug_log('Parse error: ' .. (err or 'unknown'), config)
-          end
-        end
+    -- Large answers (cues, log) span several chunks; lines are reassembled first
+    on_stdout = require('subjoyer.daemon').line_reader(function(line)
+      local parsed, err = parse_json(line)
+      if parsed then
+        handle_message(parsed, config)
+      elseif config.asbplayer and config.asbplayer.debug then
+        debug_log('Parse error: ' .. (err or 'unknown'), config)
       end
-    end,
+    end),
 
     on_stderr = function(_, data, _)
       -- Collect stderr output but only show in debug mode
@@ -240,6 +338,7 @@ function M.start(config)
       M.is_running = false
       M.is_connected = false
       M.job_id = nil
+      fail_pending('Server stopped')
       debug_log('Server exited with code: ' .. exit_code, config)
     end,
 
@@ -254,6 +353,19 @@ function M.start(config)
     if M.callbacks.on_error then
       M.callbacks.on_error('Failed to start job')
     end
+    return
+  end
+
+  M.send_display_config(config)
+end
+
+-- Send the display config the bridge applies to the cues it pre-sends
+-- (in the daemon the relay's config is used, see websocket.send_display_config)
+function M.send_display_config(config)
+  if M.job_id then
+    local command = require('subjoyer.display').relay_config(config)
+    command.channel = nil
+    vim.fn.chansend(M.job_id, vim.json.encode(command) .. '\n')
   end
 end
 
@@ -266,9 +378,17 @@ function M.stop()
 
   M.is_running = false
   M.is_connected = false
-  M.pending_requests = {}
+  M.client_count = 0
+  M.active_client = nil
+  fail_pending('Server stopped')
+  M.stats = nil
+  M.cue_tracks = nil
+  M.spool_depth = 0
+  M.spool_unknown = {}
 end
 
+M.fail_pending = fail_pending
+
 -- Mine subtitle (create Anki note)
 function M.mine_subtitle(fields, post_mine_action, callback)
   local command = {
@@ -294,6 +414,16 @@ function M.load_subtitles(files, callback)
   return send_command(command, callback)
 end
 
+-- Load subtitle files by path; the bridge reads and encodes them (cached by path and mtime)
+function M.load_subtitle_files(paths, callback)
+  local files = {}
+  for _, path in ipairs(paths) do
+    table.insert(files, { name = vim.fn.fnamemodify(path, ':t'), path = vim.fn.fnamemodify(path, ':p') })
+  end
+
+  return M.load_subtitles(files, callback)
+end
+
 -- Seek to timestamp
 function M.seek_timestamp(timestamp_ms, callback)
   local command = {
@@ -306,6 +436,97 @@ function M.seek_timestamp(timestamp_ms, callback)
   return send_command(command, callback)
 end
 
+-- Seek to the start of the previous, current or next cue relative to timestamp_ms
+-- (looked up in the bridge's cue index and sent to asbplayer as seek-timestamp)
+function M.seek_cue(timestamp_ms, direction, track, callback)
+  local command = {
+    command = 'seek-cue',
+    body = {
+      timestamp = timestamp_ms,
+      direction = direction,
+      track = track or 0,
+    }
+  }
+
+  return send_command(command, callback)
+end
+
+-- Display-ready subtitles for the next count cue starts after timestamp_ms
+function M.next_cues(timestamp_ms, count, callback)
+  local command = {
+    command = 'next-cues',
+    body = {
+      timestamp = timestamp_ms,
+      count = count,
+    }
+  }
+
+  return send_command(command, callback)
+end
+
+-- Cues of every track from before_ms before to after_ms after timestamp_ms
+function M.cues_around(timestamp_ms, before_ms, after_ms, callback)
+  local command = {
+    command = 'cues-around',
+    body = {
+      timestamp = timestamp_ms,
+      before = before_ms,
+      after = after_ms,
+    }
+  }
+
+  return send_command(command, callback)
+end
+
+-- Connected asbplayer clients: { clients = { { client = 'ip:port', active = bool, idle = secs } } }
+function M.list_clients(callback)
+  return send_command({ command = 'list-clients' }, callback)
+end
+
+-- Send commands to one client ('ip:port'), or nil to follow the most recently active one
+function M.select_client(client, callback)
+  local command = {
+    command = 'select-client',
+    body = {
+      client = client or vim.NIL,
+    }
+  }
+
+  return send_command(command, function(response)
+    if response.body and response.body.active ~= nil then
+      M.active_client = response.body.active ~= vim.NIL and response.body.active or nil
+    end
+    if callback then
+      callback(response)
+    end
+  end)
+end
+
+-- Entries of the bridge's log buffer; level (optional) changes what it keeps from now on
+function M.log(level, callback)
+  local command = {
+    command = 'log',
+    body = {
+      level = level,
+    }
+  }
+
+  return send_command(command, callback)
+end
+
+-- Decide on a spooled card held as unknown: action 'resend' or 'discard' (it is in Anki)
+function M.resolve_spooled(card, action, callback)
+  local command = {
+    command = 'spool-resolve',
+    body = {
+      card = card,
+      action = action,
+    }
+  }
+
+  return send_command(command, callback)
+end
+
 -- Set callbacks
 function M.on(event, callback)
   if event == 'connected' then
@@ -318,6 +539,12 @@ function M.on(event, callback)
     M.callbacks.on_ready = callback
   elseif event == 'response' then
     M.callbacks.on_response = callback
+  elseif event == 'cues_loaded' then
+    M.callbacks.on_cues_loaded = callback
+  elseif event == 'spool_unknown' then
+    M.callbacks.on_spool_unknown = callback
+  elseif event == 'spool_result' then
+    M.callbacks.on_spool_result = callback
   end
 end
 
@@ -328,6 +555,12 @@ function M.status()
     is_connected = M.is_connected,
     job_id = M.job_id,
     pending_count = vim.tbl_count(M.pending_requests),
+    stats = M.stats,
+    cue_tracks = M.cue_tracks,
+    spool_depth = M.spool_depth,
+    spool_unknown = #M.spool_unknown,
+    client_count = M.client_count,
+    active_client = M.active_client,
   }
 end
 
@@ -10,6 +10,21 @@ M.defaults = {
         reconnect = true,
         reconnect_delay = 3000, -- ms
         max_reconnects = 3, -- 0 = unlimited
+        passthrough = false, -- forward extension frames verbatim (no JSON re-encode in the relay; Neovim filters subtitles)
+        liveness_timeout = 15, -- seconds without frames (heartbeats included) before the extension counts as stalled
+        stats_interval = 5, -- seconds between latency/throughput stats from the bridges (0 = off)
+        history_size = 20000, -- subtitles of the session the relay keeps for mining context (0 = off)
+        schedule_delay = 50, -- ms after the extension sent a subtitle that it is shown; absorbs jitter (0 = on arrival)
+        record = nil, -- append every frame from the extension to this file (replay: ws_client.py --replay)
+        request_timeout = 5, -- seconds before a relay query (history, search, log) fails with "Request timeout"
+    },
+
+    -- Bridge daemon (one Python process for the subtitle relay and the asbplayer bridge)
+    daemon = {
+        enabled = false,
+        persistent = false, -- keep the daemon running after Neovim exits; later sessions attach instantly
+        socket = nil, -- Unix socket of the persistent daemon (nil = stdpath("cache") .. "/subjoyer.sock")
+        transport = "stdout", -- "rpc": the daemon calls into Neovim over v:servername with msgpack (needs python msgpack)
     },
 
     -- Display settings
@@ -142,6 +157,7 @@ M.defaults = {
         hide_on_insert = false,
         follow_focus = true,
         debug = false,
+        log_level = "off", -- Bridge log buffer: "off", "error", "warning", "info" or "debug" (:SubjoyerDebug log)
     },
 
     -- Video context
@@ -157,6 +173,11 @@ M.defaults = {
         host = "127.0.0.1",
         port = 8766,
         debug = false,
+        max_in_flight = 8, -- Commands sent to asbplayer and awaiting a response at once (rest wait in order)
+        command_timeout = 10, -- Seconds before an unanswered command fails with "Request timeout"
+        lookahead_cues = 8, -- Upcoming cues of loaded subtitle files shown on the video clock (0 = off)
+        spool = true, -- Keep mined cards on disk until asbplayer acknowledges them (sent when it reconnects)
+        spool_file = nil, -- nil = stdpath("data") .. "/subjoyer/mining_spool.jsonl"
 
         -- Anki note creation
         anki = {
@@ -168,6 +189,8 @@ M.defaults = {
             post_mine_action = 0, -- 0=continue, 1=pause, 2=rewind
             context_lines_before = 1, -- Number of lines before for context
             context_lines_after = 1, -- Number of lines after for context
+            context_seconds_before = 30, -- Video time searched for lines before
+            context_seconds_after = 5, -- Video time searched for lines after
         },
     },
 
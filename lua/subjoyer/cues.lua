@@ -0,0 +1,65 @@
+-- Look-ahead over the subtitle files the asbplayer bridge has parsed
+--
+-- Each subtitle pushed by the extension re-anchors the video clock: the
+-- bridge returns the next cues (display-ready, as the relay sends them) and
+-- each is shown by a timer when the clock reaches its start, so display no
+-- longer waits for the extension's next push. Timers run at the playback
+-- rate, and the relay's video_clock events (pause, play, seek, speed)
+-- restart the schedule.
+local M = {}
+
+local asbplayer = require("subjoyer.asbplayer")
+local websocket = require("subjoyer.websocket")
+
+-- Bumped on every re-anchor; timers of an older schedule do nothing
+M.generation = 0
+
+-- Drop the scheduled cues (pause, stop, new files)
+function M.cancel()
+    M.generation = M.generation + 1
+end
+
+-- Re-anchor on a subtitle from the extension and schedule the cues after it
+function M.sync(data, config, render)
+    M.cancel()
+
+    local count = config.asbplayer and config.asbplayer.lookahead_cues or 0
+    local video = data and data.video
+    if count <= 0 or not asbplayer.cue_tracks or not video or not video.currentTime or video.paused then
+        return
+    end
+
+    local generation = M.generation
+    local anchor_ms = math.floor(video.currentTime * 1000)
+    local rate = video.playbackRate or (websocket.video_clock and websocket.video_clock.rate) or 1
+    if rate <= 0 then
+        return
+    end
+    local anchored_at = vim.loop.now()
+
+    asbplayer.next_cues(anchor_ms, count, function(response)
+        if generation ~= M.generation or response.error or not response.body then
+            return
+        end
+
+        -- The clock kept running while the bridge answered
+        local elapsed = vim.loop.now() - anchored_at
+        for _, cue in ipairs(response.body.cues or {}) do
+            local delay = math.floor((cue.at - anchor_ms) / rate - elapsed)
+            vim.defer_fn(function()
+                if generation == M.generation then
+                    render(cue.subtitle)
+                end
+            end, math.max(delay, 0))
+        end
+    end)
+end
+
+-- Re-anchor on a video_clock event from the relay (stops the schedule while paused)
+function M.follow(clock, config, render)
+    M.sync({
+        video = { currentTime = clock.currentTime, paused = clock.paused, playbackRate = clock.rate },
+    }, config, render)
+end
+
+return M
@@ -0,0 +1,407 @@
+-- Bridge daemon wrapper: one Python process hosting both the subtitle relay
+-- and the asbplayer bridge, multiplexed over a single stdin/stdout channel.
+-- In persistent mode the daemon outlives Neovim and we attach to its Unix socket.
+local M = {}
+
+local uv = vim.loop
+
+-- State
+M.job_id = nil
+M.channel = nil -- socket channel while attached to a persistent daemon
+M.reconnect_count = 0
+M.reconnect_timer = nil
+M.attach_timer = nil
+
+-- Get script path
+local function get_script_path()
+    local source = debug.getinfo(1, "S").source:sub(2)
+    local plugin_root = vim.fn.fnamemodify(source, ":h:h:h")
+    return plugin_root .. "/scripts/subjoyer_daemon.py"
+end
+
+-- Log debug message
+local function debug_log(msg)
+    local config = require("subjoyer.config").get()
+    if config.behavior and config.behavior.debug then
+        vim.notify("[subjoyer:daemon] " .. msg, vim.log.levels.INFO)
+    end
+end
+
+-- Route one event to the module that owns its channel
+local function handle_event(data, config)
+    if data.channel == "asbplayer" then
+        require("subjoyer.asbplayer").handle_message(data, config)
+    else
+        require("subjoyer.websocket").handle_message(data)
+    end
+end
+
+local function handle_line(line, config)
+    local ok, data = pcall(vim.json.decode, line)
+    if not ok or type(data) ~= "table" then
+        debug_log("Parse error: JSON parse error")
+        return
+    end
+
+    handle_event(data, config)
+end
+
+-- Called by the daemon over Neovim's RPC socket (daemon.transport = "rpc")
+-- with the events of one loop tick, already decoded from msgpack
+function M.receive(events)
+    -- Late batches from a daemon we already stopped
+    if not M.job_id then
+        return
+    end
+
+    local config = require("subjoyer.config").get()
+    for _, data in ipairs(events) do
+        handle_event(data, config)
+    end
+end
+
+-- Build a data callback that splits job/socket output into lines for on_line
+-- (also used by the standalone bridges in websocket.lua and asbplayer.lua)
+function M.line_reader(on_line, on_eof)
+    -- Output arrives in arbitrary chunks; keep the unterminated tail
+    local partial = ""
+    return function(_, data, _)
+        if on_eof and #data == 1 and data[1] == "" then
+            on_eof()
+            return
+        end
+
+        data[1] = partial .. data[1]
+        partial = table.remove(data)
+        for _, line in ipairs(data) do
+            if line ~= "" then
+                on_line(line)
+            end
+        end
+    end
+end
+
+local function event_reader(config, on_eof)
+    return M.line_reader(function(line)
+        handle_line(line, config)
+    end, on_eof)
+end
+
+-- Point both modules at the daemon job or socket channel (nil to detach)
+local function attach(channel_id)
+    local websocket = require("subjoyer.websocket")
+    websocket.job_id = channel_id
+    require("subjoyer.asbplayer").job_id = channel_id
+    if channel_id then
+        websocket.send_display_config(require("subjoyer.config").get())
+    end
+end
+
+-- Mark both subsystems as down after the daemon went away
+local function reset_state()
+    local asbplayer = require("subjoyer.asbplayer")
+    require("subjoyer.websocket").is_running = false
+    asbplayer.is_running = false
+    asbplayer.is_connected = false
+    asbplayer.fail_pending("Server stopped")
+    require("subjoyer.websocket").fail_pending("Server stopped")
+end
+
+local function report_error(msg)
+    local websocket = require("subjoyer.websocket")
+    if websocket.callbacks.on_error then
+        websocket.callbacks.on_error(msg)
+    end
+end
+
+local function socket_path(config)
+    return config.daemon.socket or (vim.fn.stdpath("cache") .. "/subjoyer.sock")
+end
+
+-- Attach to a running persistent daemon; returns false if none is listening
+local function try_attach(config)
+    local conn = {}
+    local ok, channel = pcall(vim.fn.sockconnect, "pipe", socket_path(config), {
+        on_data = event_reader(config, function()
+            -- Daemon went away (shutdown or crash) while we were attached
+            vim.schedule(function()
+                if M.channel == conn.channel then
+                    M.on_detached(config)
+                end
+            end)
+        end),
+    })
+    if not ok or channel == 0 then
+        return false
+    end
+
+    conn.channel = channel
+    M.channel = channel
+    attach(channel)
+    debug_log("Attached to daemon at " .. socket_path(config))
+    return true
+end
+
+local function stop_attach_timer()
+    if M.attach_timer then
+        M.attach_timer:stop()
+        M.attach_timer:close()
+        M.attach_timer = nil
+    end
+end
+
+-- Build daemon command line
+local function build_cmd(config)
+    local python_cmd = vim.fn.executable("python3") == 1 and "python3" or "python"
+
+    local cmd = {
+        python_cmd,
+        get_script_path(),
+        "--host",
+        config.connection.host,
+        "--port",
+        tostring(config.connection.port),
+        "--liveness-timeout",
+        tostring(config.connection.liveness_timeout),
+        "--stats-interval",
+        tostring(config.connection.stats_interval),
+        "--history-size",
+        tostring(config.connection.history_size),
+        "--schedule-delay",
+        tostring(config.connection.schedule_delay),
+        "--log-level",
+        config.behavior.debug and "debug" or config.behavior.log_level,
+    }
+
+    if config.connection.passthrough then
+        table.insert(cmd, "--passthrough")
+    end
+
+    if config.connection.record then
+        vim.list_extend(cmd, { "--record", vim.fn.expand(config.connection.record) })
+    end
+
+    if config.asbplayer and config.asbplayer.enabled then
+        vim.list_extend(cmd, {
+            "--asbplayer-host",
+            config.asbplayer.host,
+            "--asbplayer-port",
+            tostring(config.asbplayer.port),
+            "--max-in-flight",
+            tostring(config.asbplayer.max_in_flight),
+            "--command-timeout",
+            tostring(config.asbplayer.command_timeout),
+        })
+
+        local spool = require("subjoyer.asbplayer").spool_path(config)
+        if spool then
+            vim.list_extend(cmd, { "--spool", spool })
+        end
+    else
+        table.insert(cmd, "--no-asbplayer")
+    end
+
+    -- Events come back as RPC calls of M.receive() instead of stdout lines
+    if config.daemon.transport == "rpc" and not config.daemon.persistent and vim.v.servername ~= "" then
+        vim.list_extend(cmd, { "--nvim", vim.v.servername })
+    end
+
+    return cmd
+end
+
+-- Attach to the persistent daemon, spawning it first if nobody is listening
+local function start_persistent(config)
+    if try_attach(config) then
+        return
+    end
+
+    local cmd = build_cmd(config)
+    vim.list_extend(cmd, { "--persistent", "--socket", socket_path(config) })
+    debug_log("Spawning persistent daemon: " .. table.concat(cmd, " "))
+
+    -- detach: the daemon keeps running after this Neovim exits
+    if vim.fn.jobstart(cmd, { detach = true }) <= 0 then
+        report_error("Failed to start daemon job")
+        return
+    end
+
+    -- Poll until the socket accepts connections (~5s max)
+    local attempts = 0
+    M.attach_timer = uv.new_timer()
+    M.attach_timer:start(
+        50,
+        50,
+        vim.schedule_wrap(function()
+            if not M.attach_timer then
+                return
+            end
+            attempts = attempts + 1
+            if try_attach(config) then
+                stop_attach_timer()
+            elseif attempts >= 100 then
+                stop_attach_timer()
+                report_error("Could not attach to daemon at " .. socket_path(config))
+            end
+        end)
+    )
+end
+
+-- Start daemon (or attach to the persistent one)
+function M.start(config)
+    if M.job_id or M.channel or M.attach_timer then
+        debug_log("Already running")
+        return
+    end
+
+    local script_path = get_script_path()
+
+    if vim.fn.filereadable(script_path) ~= 1 then
+        report_error("Python script not found: " .. script_path)
+        return
+    end
+
+    if vim.fn.executable("python3") ~= 1 and vim.fn.executable("python") ~= 1 then
+        report_error("Python not found. Please install Python 3.7+")
+        return
+    end
+
+    if config.daemon.persistent then
+        start_persistent(config)
+        return
+    end
+
+    local cmd = build_cmd(config)
+    debug_log("Starting: " .. table.concat(cmd, " "))
+
+    M.job_id = vim.fn.jobstart(cmd, {
+        on_stdout = event_reader(config),
+
+        on_stderr = function(_, data, _)
+            for _, line in ipairs(data) do
+                if line and line ~= "" then
+                    debug_log("stderr: " .. line)
+                end
+            end
+        end,
+
+        on_exit = function(job_id, exit_code, _)
+            -- M.stop() clears job_id first, so a mismatch means we were stopped on purpose
+            local stopped = M.job_id ~= job_id
+            M.job_id = nil
+            attach(nil)
+            reset_state()
+
+            debug_log("Daemon exited with code: " .. exit_code)
+
+            if config.connection.reconnect and exit_code ~= 0 and not stopped then
+                M.schedule_reconnect(config)
+            end
+        end,
+
+        -- Commands for the asbplayer bridge
+        stdin = "pipe",
+    })
+
+    if M.job_id <= 0 then
+        M.job_id = nil
+        report_error("Failed to start daemon job")
+        return
+    end
+
+    attach(M.job_id)
+end
+
+-- Socket closed by the persistent daemon
+function M.on_detached(config)
+    M.channel = nil
+    attach(nil)
+    reset_state()
+    debug_log("Daemon connection closed")
+
+    if config.connection.reconnect then
+        M.schedule_reconnect(config)
+    end
+end
+
+-- Stop daemon (a persistent daemon is only detached from and keeps running)
+function M.stop()
+    if M.reconnect_timer then
+        M.reconnect_timer:stop()
+        M.reconnect_timer:close()
+        M.reconnect_timer = nil
+    end
+    stop_attach_timer()
+
+    if M.job_id then
+        vim.fn.jobstop(M.job_id)
+        M.job_id = nil
+    end
+
+    if M.channel then
+        local channel = M.channel
+        M.channel = nil
+        vim.fn.chanclose(channel)
+    end
+
+    -- Reset module state without touching the (already stopped) job
+    attach(nil)
+    require("subjoyer.websocket").stop()
+    require("subjoyer.asbplayer").stop()
+
+    M.reconnect_count = 0
+end
+
+-- Shut down the persistent daemon; returns true if one was running
+function M.shutdown(config)
+    if not M.channel and not try_attach(config) then
+        vim.notify("[subjoyer] No persistent daemon running", vim.log.levels.INFO)
+        return false
+    end
+
+    vim.fn.chansend(M.channel, vim.json.encode({ channel = "daemon", command = "shutdown" }) .. "\n")
+    M.stop()
+    return true
+end
+
+-- Schedule restart after an unexpected exit
+function M.schedule_reconnect(config)
+    if M.reconnect_timer then
+        return
+    end
+
+    local max_reconnects = config.connection.max_reconnects
+    if max_reconnects > 0 and M.reconnect_count >= max_reconnects then
+        debug_log(
+            string.format("Max reconnection attempts (%d) reached. Use :SubjoyerReconnect to retry.", max_reconnects)
+        )
+        return
+    end
+
+    M.reconnect_count = M.reconnect_count + 1
+    debug_log(
+        string.format("Restarting daemon in %dms (attempt %d)", config.connection.reconnect_delay, M.reconnect_count)
+    )
+
+    M.reconnect_timer = uv.new_timer()
+    M.reconnect_timer:start(config.connection.reconnect_delay, 0, function()
+        M.reconnect_timer:stop()
+        M.reconnect_timer:close()
+        M.reconnect_timer = nil
+
+        vim.schedule(function()
+            M.start(config)
+        end)
+    end)
+end
+
+-- Get status
+function M.status()
+    return {
+        is_running = M.job_id ~= nil or M.channel ~= nil,
+        persistent = M.channel ~= nil,
+        job_id = M.job_id or M.channel,
+        reconnect_count = M.reconnect_count,
+    }
+end
+
+return M
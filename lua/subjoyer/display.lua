@@ -5,44 +5,94 @@ M.current_subtitle = nil
 M.is_visible = true
 M.nui_popup = nil
 
-local function build_model_from_data(data, config)
+-- Subtitles arrive display-ready from the relay: tracks are already filtered,
+-- text is trimmed, and lines too long for a provider carry a truncated copy
+local function get_lines(data)
     if not data or not data.subtitle then
         return nil
     end
+    local lines = data.subtitle.lines or {}
+    if #lines == 0 and data.subtitle.text and data.subtitle.text ~= "" then
+        lines = { { text = data.subtitle.text, track = 0 } }
+    end
+    if #lines == 0 then
+        return nil
+    end
+    return lines
+end
 
-    local subtitle = data.subtitle
-    local items = {}
+local function track_label(line)
+    return string.format("Track %d:", line.track_num or line.track or 0)
+end
 
-    local raw_lines = subtitle.lines or {}
-    if #raw_lines == 0 and subtitle.text and subtitle.text ~= "" then
-        raw_lines = { { text = subtitle.text, track = 0 } }
-    end
+local function line_text(line, provider)
+    return line.short and line.short[provider] or line.text
+end
 
-    if #raw_lines == 0 then
-        return nil
+-- Display config for the relay (sent over the bridge's stdin)
+function M.relay_config(config)
+    return {
+        channel = "subtitle",
+        command = "display-config",
+        tracks = config.subtitle.tracks,
+        trim = config.subtitle.trim,
+        max_lengths = {
+            nui = config.nui.subtitle.max_text_length,
+            incline = config.incline.max_text_length,
+        },
+    }
+end
+
+-- The relay's display filter (DisplayFilter.prepare in display_filter.py), for the
+-- subtitles it forwards verbatim with connection.passthrough; idempotent
+function M.prepare(data, config)
+    local subtitle = data.subtitle or {}
+    local lines = subtitle.lines or {}
+    if #lines == 0 and subtitle.text and subtitle.text ~= "" then
+        lines = { { text = subtitle.text, track = 0 } }
     end
 
-    for _, line in ipairs(raw_lines) do
-        local track_num = line.track_num or line.track or 0
+    -- 'all' (or anything else) shows every track
+    local tracks = config.subtitle.tracks
+    local shown_tracks = nil
+    if type(tracks) == "number" then
+        shown_tracks = { [tracks] = true }
+    elseif type(tracks) == "table" then
+        shown_tracks = {}
+        for _, track in ipairs(tracks) do
+            shown_tracks[track] = true
+        end
+    end
+    local max_lengths = {
+        nui = config.nui.subtitle.max_text_length,
+        incline = config.incline.max_text_length,
+    }
+
+    local shown, texts = {}, {}
+    for _, line in ipairs(lines) do
+        local track = line.track_num or line.track or 0
         local text = line.text or ""
-
         if config.subtitle.trim then
-            text = text:gsub("^%s*(.-)%s*$", "%1")
+            text = vim.trim(text)
         end
-
-        if text ~= "" then
-            table.insert(items, {
-                text = text,
-                track_num = track_num,
-            })
+        if (not shown_tracks or shown_tracks[track]) and text ~= "" then
+            local item = { text = text, track_num = track }
+            for provider, length in pairs(max_lengths) do
+                if type(length) == "number" and length > 0 and vim.fn.strchars(text) > length then
+                    item.short = item.short or {}
+                    item.short[provider] = vim.fn.strcharpart(text, 0, length) .. "..."
+                end
+            end
+            table.insert(shown, item)
+            table.insert(texts, text)
         end
     end
 
-    if #items == 0 then
-        return nil
-    end
-
-    return items
+    return {
+        type = "subtitle",
+        subtitle = { text = table.concat(texts, "\n"), lines = shown },
+        video = data.video or {},
+    }
 end
 
 local function get_effective_setting(provider_val, global_val)
@@ -53,8 +103,8 @@ local function get_effective_setting(provider_val, global_val)
 end
 
 function M.format_nui(data, config)
-    local model = build_model_from_data(data, config)
-    if not model then
+    local lines = get_lines(data)
+    if not lines then
         return nil
     end
 
@@ -69,7 +119,7 @@ function M.format_nui(data, config)
         table.insert(parts, config.nui.subtitle.prefix)
     end
 
-    for i, item in ipairs(model) do
+    for i, line in ipairs(lines) do
         if i > 1 then
             table.insert(parts, config.nui.subtitle.separator)
         end
@@ -81,10 +131,10 @@ function M.format_nui(data, config)
         end
 
         if show_track_label then
-            table.insert(parts, string.format("Track %d:", item.track_num))
+            table.insert(parts, track_label(line))
         end
 
-        table.insert(parts, item.text)
+        table.insert(parts, line_text(line, "nui"))
     end
 
     if config.nui.subtitle.suffix ~= "" then
@@ -95,8 +145,8 @@ function M.format_nui(data, config)
 end
 
 function M.format_incline(data, config)
-    local model = build_model_from_data(data, config)
-    if not model then
+    local lines = get_lines(data)
+    if not lines then
         return nil
     end
 
@@ -106,7 +156,7 @@ function M.format_incline(data, config)
 
     local parts = {}
 
-    for i, item in ipairs(model) do
+    for i, line in ipairs(lines) do
         if i > 1 then
             table.insert(parts, config.incline.separator)
         end
@@ -118,14 +168,10 @@ function M.format_incline(data, config)
         end
 
         if show_track_label then
-            table.insert(parts, string.format("Track %d:", item.track_num))
+            table.insert(parts, track_label(line))
         end
 
-        local text = item.text
-        if config.incline.max_text_length and #text > config.incline.max_text_length then
-            text = text:sub(1, config.incline.max_text_length) .. "..."
-        end
-        table.insert(parts, text)
+        table.insert(parts, line_text(line, "incline"))
     end
 
     return parts
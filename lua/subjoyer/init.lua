@@ -5,12 +5,14 @@ local config = require("subjoyer.config")
 local websocket = require("subjoyer.websocket")
 local display = require("subjoyer.display")
 local asbplayer = require("subjoyer.asbplayer")
+local daemon = require("subjoyer.daemon")
+local cues = require("subjoyer.cues")
 
 -- Plugin state
 M.is_started = false
 M.asbplayer_started = false
-M.current_subtitle = nil -- Store current subtitle for mining
-M.subtitle_history = {} -- Store recent subtitles for context
+M.daemon_started = false
+M.current_subtitle = nil -- Store current subtitle for mining (context comes from the relay's history)
 
 -- Setup plugin with user configuration
 function M.setup(user_config)
@@ -81,6 +83,17 @@ function M.setup_callbacks()
     websocket.on("subtitle", function(data)
         M.handle_subtitle(data)
     end)
+
+    websocket.on("subtitle_hide", function(data)
+        M.handle_subtitle_hide(data)
+    end)
+
+    websocket.on("video_clock", function(data)
+        -- Paused, resumed, seeked or sped up: restart the look-ahead from the relay's clock
+        if M.asbplayer_started then
+            cues.follow(data, config.get(), M.show_cue)
+        end
+    end)
 end
 
 -- Setup asbplayer callbacks
@@ -119,6 +132,31 @@ function M.setup_asbplayer_callbacks()
             vim.notify("[subjoyer:asbplayer] Response: " .. vim.inspect(response), vim.log.levels.INFO)
         end
     end)
+
+    -- A card asbplayer may or may not have created is only sent again if the user says so
+    asbplayer.on("spool_unknown", function(cards)
+        M.ask_unknown_cards(cards)
+    end)
+
+    -- Outcome of a card whose mine was already reported as spooled or unconfirmed
+    asbplayer.on("spool_result", function(response)
+        if response.error then
+            vim.notify("[subjoyer] Spooled card failed: " .. response.error, vim.log.levels.ERROR)
+        else
+            vim.notify("[subjoyer] Spooled card added to Anki", vim.log.levels.INFO)
+        end
+    end)
+
+    -- New files replace the cues scheduled from the old ones
+    asbplayer.on("cues_loaded", function(data)
+        cues.cancel()
+        if cfg.asbplayer and cfg.asbplayer.debug then
+            vim.notify(
+                "[subjoyer:asbplayer] Cues indexed: " .. table.concat(data.tracks or {}, ", "),
+                vim.log.levels.INFO
+            )
+        end
+    end)
 end
 
 -- Setup autocommands
@@ -163,10 +201,9 @@ function M.handle_subtitle(data)
     -- Store current subtitle for mining
     M.current_subtitle = data
 
-    -- Store in history for context (keep last 10)
-    table.insert(M.subtitle_history, 1, data)
-    if #M.subtitle_history > 10 then
-        table.remove(M.subtitle_history)
+    -- Show the upcoming cues of loaded subtitle files on the video clock
+    if M.asbplayer_started then
+        cues.sync(data, cfg, M.show_cue)
     end
 
     -- Check if updates should be paused
@@ -178,6 +215,22 @@ function M.handle_subtitle(data)
     display.update(data, cfg)
 end
 
+-- Clear the display at the end of the subtitle on it (M.current_subtitle stays for mining)
+function M.handle_subtitle_hide(data)
+    local shown = display.current_subtitle
+    -- A look-ahead cue may already have replaced the subtitle this hide is for
+    if not shown or not shown.video or not data.video or shown.video.currentTime ~= data.video.currentTime then
+        return
+    end
+    display.update(nil, config.get())
+end
+
+-- Show a cue scheduled by the look-ahead
+function M.show_cue(data)
+    M.current_subtitle = data
+    display.update(data, config.get())
+end
+
 -- Start receiving subtitles
 function M.start()
     if M.is_started then
@@ -186,12 +239,19 @@ function M.start()
 
     local cfg = config.get()
 
-    -- Start WebSocket server for subtitle reception
-    websocket.start(cfg)
+    if cfg.daemon.enabled then
+        -- One process hosts both the subtitle relay and the asbplayer bridge
+        daemon.start(cfg)
+        M.daemon_started = true
+        M.asbplayer_started = cfg.asbplayer and cfg.asbplayer.enabled or false
+    else
+        -- Start WebSocket server for subtitle reception
+        websocket.start(cfg)
 
-    -- Start asbplayer server if enabled
-    if cfg.asbplayer and cfg.asbplayer.enabled then
-        M.start_asbplayer()
+        -- Start asbplayer server if enabled
+        if cfg.asbplayer and cfg.asbplayer.enabled then
+            M.start_asbplayer()
+        end
     end
 
     -- Show display
@@ -208,20 +268,40 @@ function M.stop()
         return
     end
 
-    -- Stop WebSocket server
-    websocket.stop()
+    if M.daemon_started then
+        daemon.stop()
+        M.daemon_started = false
+        M.asbplayer_started = false
+    else
+        -- Stop WebSocket server
+        websocket.stop()
 
-    -- Stop asbplayer server if running
-    if M.asbplayer_started then
-        M.stop_asbplayer()
+        -- Stop asbplayer server if running
+        if M.asbplayer_started then
+            M.stop_asbplayer()
+        end
     end
 
+    cues.cancel()
+
     -- Hide display
     display.hide()
 
     M.is_started = false
 end
 
+-- Shut down the persistent bridge daemon (stop only detaches from it)
+function M.shutdown_daemon()
+    if not daemon.shutdown(config.get()) or not M.daemon_started then
+        return
+    end
+
+    M.daemon_started = false
+    M.asbplayer_started = false
+    M.is_started = false
+    display.hide()
+end
+
 -- Toggle plugin on/off
 function M.toggle()
     if M.is_started then
@@ -262,9 +342,19 @@ function M.status()
         display_visible = display.is_visible == true,
         job_id = ws_status.job_id,
         reconnect_count = ws_status.reconnect_count,
+        dropped = ws_status.dropped,
+        subscribers = ws_status.subscribers,
+        lag_ms = ws_status.lag_ms,
+        extension_alive = ws_status.extension_alive,
+        stats = ws_status.stats,
     }
 end
 
+-- "p50 0.12 / p95 0.40 / max 3.10 ms" from a latency summary of the bridges
+local function format_latency(summary)
+    return string.format("p50 %.2f / p95 %.2f / max %.2f ms", summary.p50, summary.p95, summary.max)
+end
+
 -- Print status (includes asbplayer if enabled)
 function M.print_status()
     local status = M.status()
@@ -278,6 +368,39 @@ function M.print_status()
         "  Connection: " .. cfg.connection.host .. ":" .. cfg.connection.port,
     }
 
+    if status.extension_alive == false then
+        table.insert(lines, "  Extension: connected but silent (no heartbeat)")
+    end
+
+    if M.daemon_started then
+        local daemon_status = daemon.status()
+        local state = daemon_status.is_running and "running" or "stopped"
+        if daemon_status.persistent then
+            state = "attached to persistent daemon"
+        end
+        table.insert(lines, "  Bridge: daemon (" .. state .. ")")
+        if status.subscribers then
+            table.insert(lines, "  Attached editors: " .. status.subscribers)
+        end
+    end
+
+    if status.dropped > 0 then
+        table.insert(lines, "  Stale subtitles skipped: " .. status.dropped)
+    end
+
+    if status.lag_ms > 0 then
+        table.insert(lines, "  Output lag: " .. status.lag_ms .. "ms")
+    end
+
+    -- Latest stats event of the relay (sent every connection.stats_interval while frames flow)
+    if status.stats then
+        table.insert(lines, string.format("  Throughput: %.1f frames/s", status.stats.frames_per_sec))
+        table.insert(lines, "  Relay queue: " .. format_latency(status.stats.queue_ms))
+        if status.stats.write_ms then
+            table.insert(lines, "  Pipe write: " .. format_latency(status.stats.write_ms))
+        end
+    end
+
     -- Add asbplayer status if enabled
     if cfg.asbplayer and cfg.asbplayer.enabled then
         local asp_status = M.asbplayer_status()
@@ -285,9 +408,28 @@ function M.print_status()
         table.insert(lines, "asbplayer Integration:")
         table.insert(lines, "  Server: " .. (asp_status.server_running and "Running" or "Stopped"))
         table.insert(lines, "  Client: " .. (asp_status.client_connected and "Connected" or "Disconnected"))
+        if asp_status.client_count > 1 then
+            table.insert(lines, string.format("  Clients: %d (active %s)", asp_status.client_count,
+                asp_status.active_client or "none"))
+        end
         if asp_status.pending_requests > 0 then
             table.insert(lines, "  Pending: " .. asp_status.pending_requests)
         end
+        if asp_status.stats and asp_status.stats.round_trip_ms.count > 0 then
+            table.insert(lines, "  Command round trip: " .. format_latency(asp_status.stats.round_trip_ms))
+        end
+        if asp_status.stats and asp_status.stats.timeouts > 0 then
+            table.insert(lines, "  Timed out: " .. asp_status.stats.timeouts)
+        end
+        if asp_status.spool_depth > 0 then
+            table.insert(lines, "  Spooled cards: " .. asp_status.spool_depth)
+        end
+        if asp_status.spool_unknown > 0 then
+            table.insert(lines, "  Unconfirmed cards: " .. asp_status.spool_unknown)
+        end
+        if asp_status.cue_tracks then
+            table.insert(lines, "  Indexed cues: " .. table.concat(asp_status.cue_tracks, ", "))
+        end
     end
 
     vim.notify(table.concat(lines, "\n"), vim.log.levels.INFO)
@@ -295,6 +437,14 @@ end
 
 -- Reconnect
 function M.reconnect()
+    if M.daemon_started then
+        daemon.stop()
+        vim.defer_fn(function()
+            daemon.start(config.get())
+        end, 100)
+        return
+    end
+
     websocket.stop()
     vim.defer_fn(function()
         local cfg = config.get()
@@ -328,8 +478,11 @@ function M.set_track(track)
         },
     })
 
-    -- Refresh display
-    display.refresh()
+    -- The relay filters tracks; it re-sends the current subtitle with the new selection
+    websocket.send_display_config(config.get())
+    if M.asbplayer_started and not M.daemon_started then
+        asbplayer.send_display_config(config.get())
+    end
 
     vim.notify("[subjoyer] Track set to: " .. vim.inspect(parsed_track), vim.log.levels.INFO)
 end
@@ -368,9 +521,85 @@ function M.toggle_debug()
         },
     })
 
+    -- The bridges keep debug entries in their log buffer only while debug is on
+    local level = new_debug and "debug" or cfg.behavior.log_level
+    local ignore = function() end
+    if websocket.job_id then
+        websocket.log(level, ignore)
+    end
+    if M.asbplayer_started and not M.daemon_started then
+        asbplayer.log(level, ignore)
+    end
+
     vim.notify("[subjoyer] Debug: " .. (new_debug and "ON" or "OFF"), vim.log.levels.INFO)
 end
 
+-- Show the bridges' log buffers in a scratch buffer, oldest entry first
+function M.show_log()
+    local sources = {}
+    if websocket.job_id then
+        table.insert(sources, function(done)
+            websocket.log(nil, done)
+        end)
+    end
+    -- The daemon's relay answers for the whole process
+    if M.asbplayer_started and not M.daemon_started then
+        table.insert(sources, function(done)
+            asbplayer.log(nil, function(response)
+                done(response.body or response)
+            end)
+        end)
+    end
+
+    if #sources == 0 then
+        vim.notify("[subjoyer] Bridge not running", vim.log.levels.WARN)
+        return
+    end
+
+    local entries = {}
+    local remaining = #sources
+    local function collect(answer)
+        if answer.error then
+            vim.notify("[subjoyer] Reading the bridge log failed: " .. answer.error, vim.log.levels.WARN)
+        end
+        vim.list_extend(entries, answer.entries or {})
+        remaining = remaining - 1
+        if remaining > 0 then
+            return
+        end
+
+        if #entries == 0 then
+            vim.notify("[subjoyer] Log is empty (level: " .. (answer.level or "off") .. ")", vim.log.levels.INFO)
+            return
+        end
+
+        table.sort(entries, function(a, b)
+            return a.time < b.time
+        end)
+        local lines = {}
+        for _, entry in ipairs(entries) do
+            local millis = math.floor((entry.time % 1) * 1000)
+            local message = entry.message:gsub("\n", " ")
+            table.insert(lines, string.format("%s.%03d %-7s %-9s %s", os.date("%H:%M:%S", math.floor(entry.time)),
+                millis, entry.level, entry.source, message))
+        end
+
+        vim.cmd("new")
+        local buf = vim.api.nvim_get_current_buf()
+        vim.bo[buf].buftype = "nofile"
+        vim.bo[buf].bufhidden = "wipe"
+        vim.bo[buf].swapfile = false
+        vim.api.nvim_buf_set_name(buf, "subjoyer://log")
+        vim.api.nvim_buf_set_lines(buf, 0, -1, false, lines)
+        vim.bo[buf].modifiable = false
+        vim.cmd("normal! G")
+    end
+
+    for _, source in ipairs(sources) do
+        source(vim.schedule_wrap(collect))
+    end
+end
+
 -- Start asbplayer WebSocket server
 function M.start_asbplayer()
     if M.asbplayer_started then
@@ -396,11 +625,12 @@ function M.stop_asbplayer()
     end
 
     asbplayer.stop()
+    cues.cancel()
     M.asbplayer_started = false
 end
 
--- Build Anki fields from subtitle data
-local function build_anki_fields(subtitle_data, cfg)
+-- Build Anki fields from subtitle data and the history entries around it (oldest first)
+local function build_anki_fields(subtitle_data, entries, cfg)
     if not subtitle_data or not subtitle_data.subtitle then
         return nil
     end
@@ -411,23 +641,28 @@ local function build_anki_fields(subtitle_data, cfg)
     -- Get current subtitle text
     local text = subtitle_data.subtitle.text or ""
 
-    -- Build context from history
+    -- Split the history at the current line's video time
     local context_before = cfg.asbplayer.anki.context_lines_before or 1
     local context_after = cfg.asbplayer.anki.context_lines_after or 1
-    local context_lines = {}
-
-    -- Add lines before (from history)
-    for i = 2, math.min(context_before + 1, #M.subtitle_history) do
-        local prev = M.subtitle_history[i]
-        if prev and prev.subtitle and prev.subtitle.text then
-            table.insert(context_lines, 1, prev.subtitle.text)
+    local now_ms = math.floor(((subtitle_data.video or {}).currentTime or 0) * 1000)
+    local before, after = {}, {}
+    for _, entry in ipairs(entries) do
+        if entry.text ~= text then
+            table.insert(entry.time < now_ms and before or after, entry.text)
         end
     end
 
+    local context_lines = {}
+    for i = math.max(#before - context_before + 1, 1), #before do
+        table.insert(context_lines, before[i])
+    end
+
     -- Add current line
     table.insert(context_lines, ">> " .. text .. " <<")
 
-    -- Note: context_after would require future subtitles (not available yet)
+    for i = 1, math.min(context_after, #after) do
+        table.insert(context_lines, after[i])
+    end
 
     local context = table.concat(context_lines, "\n")
 
@@ -444,6 +679,48 @@ local function build_anki_fields(subtitle_data, cfg)
     return fields
 end
 
+-- Spooled cards the user already answered for, and whether a prompt is open
+local resolved_cards = {}
+local asking_card = false
+
+-- Ask whether an unconfirmed spooled card should be sent again; the next one is
+-- asked once the answer changes the spool
+function M.ask_unknown_cards(cards)
+    if asking_card then
+        return
+    end
+    for _, card in ipairs(cards) do
+        if not resolved_cards[card.messageId] then
+            local fields = {}
+            for _, value in pairs(card.fields or {}) do
+                table.insert(fields, (tostring(value):gsub("\n", " / ")))
+            end
+            local summary = table.concat(fields, " | "):sub(1, 80)
+
+            asking_card = true
+            vim.ui.select({ "resend", "discard" }, {
+                prompt = "asbplayer never confirmed this card; it may already be in Anki: " .. summary,
+                format_item = function(action)
+                    return action == "resend" and "Not in Anki - send it again" or "Already in Anki - discard it"
+                end,
+            }, function(action)
+                asking_card = false
+                if not action then
+                    -- Asked again the next time the spool changes
+                    return
+                end
+                resolved_cards[card.messageId] = true
+                asbplayer.resolve_spooled(card.messageId, action, function(response)
+                    if response.error then
+                        vim.notify("[subjoyer] Resolving spooled card failed: " .. response.error, vim.log.levels.ERROR)
+                    end
+                end)
+            end)
+            return
+        end
+    end
+end
+
 -- Mine current subtitle to Anki
 function M.mine_anki()
     local cfg = config.get()
@@ -459,8 +736,9 @@ function M.mine_anki()
         return
     end
 
+    -- With the spool on, cards mined while asbplayer is away are sent when it reconnects
     local status = asbplayer.status()
-    if not status.is_connected then
+    if not status.is_connected and not cfg.asbplayer.spool then
         vim.notify(
             "[subjoyer] asbplayer not connected. Enable WebSocket client in asbplayer extension settings.",
             vim.log.levels.ERROR
@@ -474,29 +752,189 @@ function M.mine_anki()
         return
     end
 
-    -- Build Anki fields
-    local fields = build_anki_fields(M.current_subtitle, cfg)
-    if not fields then
-        vim.notify("[subjoyer] Failed to build Anki fields", vim.log.levels.ERROR)
+    local subtitle = M.current_subtitle
+    local video = subtitle.video or {}
+    local now_ms = math.floor((video.currentTime or 0) * 1000)
+    local anki = cfg.asbplayer.anki
+
+    -- Context lines come from the relay's history around the current line
+    vim.notify("[subjoyer] Mining to Anki...", vim.log.levels.INFO)
+    websocket.history(
+        now_ms - (anki.context_seconds_before or 30) * 1000,
+        now_ms + (anki.context_seconds_after or 5) * 1000,
+        function(answer)
+            -- Without history (relay down or silent, no video time) mine the line alone
+            if answer.error then
+                vim.notify(
+                    "[subjoyer] No context lines (" .. answer.error .. "); mining the current line only",
+                    vim.log.levels.WARN
+                )
+            end
+            local entries = video.currentTime and answer.entries or {}
+
+            -- Build Anki fields
+            local fields = build_anki_fields(subtitle, entries, cfg)
+            if not fields then
+                vim.notify("[subjoyer] Failed to build Anki fields", vim.log.levels.ERROR)
+                return
+            end
+
+            -- Send mine-subtitle command
+            asbplayer.mine_subtitle(fields, anki.post_mine_action or 0, function(response)
+                if response.error then
+                    vim.notify("[subjoyer] Anki mining failed: " .. response.error, vim.log.levels.ERROR)
+                elseif response.unknown then
+                    vim.notify(
+                        "[subjoyer] asbplayer did not confirm the card; check Anki before mining it again",
+                        vim.log.levels.WARN
+                    )
+                elseif response.spooled then
+                    vim.notify(
+                        string.format("[subjoyer] asbplayer away; card spooled (%d waiting)", response.depth or 0),
+                        vim.log.levels.INFO
+                    )
+                elseif response.body and response.body.published then
+                    vim.notify("[subjoyer] Anki note created successfully!", vim.log.levels.INFO)
+                else
+                    vim.notify("[subjoyer] Anki note created (status unknown)", vim.log.levels.INFO)
+                end
+            end)
+        end
+    )
+end
+
+-- Load subtitle files into asbplayer (the bridge reads them; Neovim only sends paths)
+function M.load_subtitles(paths)
+    if not M.asbplayer_started then
+        vim.notify("[subjoyer] asbplayer server not running", vim.log.levels.ERROR)
         return
     end
 
-    -- Get post-mine action
-    local post_mine_action = cfg.asbplayer.anki.post_mine_action or 0
+    for _, path in ipairs(paths) do
+        if vim.fn.filereadable(vim.fn.expand(path)) ~= 1 then
+            vim.notify("[subjoyer] Cannot read " .. path, vim.log.levels.ERROR)
+            return
+        end
+    end
 
-    -- Send mine-subtitle command
-    vim.notify("[subjoyer] Mining to Anki...", vim.log.levels.INFO)
-    asbplayer.mine_subtitle(fields, post_mine_action, function(response)
+    local expanded = vim.tbl_map(vim.fn.expand, paths)
+    asbplayer.load_subtitle_files(expanded, function(response)
         if response.error then
-            vim.notify("[subjoyer] Anki mining failed: " .. response.error, vim.log.levels.ERROR)
-        elseif response.body and response.body.published then
-            vim.notify("[subjoyer] Anki note created successfully!", vim.log.levels.INFO)
+            vim.notify("[subjoyer] Loading subtitles failed: " .. response.error, vim.log.levels.ERROR)
         else
-            vim.notify("[subjoyer] Anki note created (status unknown)", vim.log.levels.INFO)
+            vim.notify("[subjoyer] Subtitles loaded", vim.log.levels.INFO)
         end
     end)
 end
 
+-- Seek to the start of the previous, current or next cue of the loaded subtitle files
+function M.seek_cue(direction)
+    if not M.asbplayer_started then
+        vim.notify("[subjoyer] asbplayer server not running", vim.log.levels.ERROR)
+        return
+    end
+
+    if not asbplayer.cue_tracks then
+        vim.notify("[subjoyer] No subtitle files loaded (use :SubjoyerLoadSubtitles)", vim.log.levels.WARN)
+        return
+    end
+
+    local video = M.current_subtitle and M.current_subtitle.video
+    if not video or not video.currentTime then
+        vim.notify("[subjoyer] Video position unknown", vim.log.levels.WARN)
+        return
+    end
+
+    asbplayer.seek_cue(math.floor(video.currentTime * 1000), direction, 0, function(response)
+        if response.error then
+            vim.notify("[subjoyer] Seek failed: " .. response.error, vim.log.levels.WARN)
+        end
+    end)
+end
+
+-- Search the session's subtitles and seek asbplayer to the chosen line
+function M.search(query)
+    websocket.search(query, 20, function(answer)
+        if answer.error then
+            vim.notify("[subjoyer] Search failed: " .. answer.error, vim.log.levels.ERROR)
+            return
+        end
+
+        if #answer.results == 0 then
+            vim.notify("[subjoyer] No subtitles match: " .. query, vim.log.levels.INFO)
+            return
+        end
+
+        vim.ui.select(answer.results, {
+            prompt = "Subtitles matching " .. query,
+            format_item = function(result)
+                local seconds = math.floor(result.time / 1000)
+                local text = result.text:gsub("\n", " / ")
+                return string.format("[%02d:%02d] %s", math.floor(seconds / 60), seconds % 60, text)
+            end,
+        }, function(result)
+            if not result then
+                return
+            end
+
+            if not M.asbplayer_started then
+                vim.notify("[subjoyer] asbplayer server not running", vim.log.levels.ERROR)
+                return
+            end
+
+            asbplayer.seek_timestamp(result.time, function(response)
+                if response.error then
+                    vim.notify("[subjoyer] Seek failed: " .. response.error, vim.log.levels.WARN)
+                end
+            end)
+        end)
+    end)
+end
+
+-- Pick the asbplayer client (tab) commands go to
+function M.select_asbplayer_client()
+    if not M.asbplayer_started then
+        vim.notify("[subjoyer] asbplayer server not running", vim.log.levels.ERROR)
+        return
+    end
+
+    asbplayer.list_clients(function(response)
+        if response.error then
+            vim.notify("[subjoyer] Listing clients failed: " .. response.error, vim.log.levels.ERROR)
+            return
+        end
+
+        local clients = response.body and response.body.clients or {}
+        if #clients == 0 then
+            vim.notify("[subjoyer] No asbplayer client connected", vim.log.levels.INFO)
+            return
+        end
+
+        -- Last entry goes back to following the most recently active client
+        table.insert(clients, { automatic = true })
+        vim.ui.select(clients, {
+            prompt = "asbplayer client",
+            format_item = function(client)
+                if client.automatic then
+                    return "Most recently active"
+                end
+                return string.format("%s%s (idle %ds)", client.client, client.active and " *" or "",
+                    math.floor(client.idle))
+            end,
+        }, function(client)
+            if not client then
+                return
+            end
+
+            asbplayer.select_client(client.client, function(selected)
+                if selected.error then
+                    vim.notify("[subjoyer] Selecting client failed: " .. selected.error, vim.log.levels.ERROR)
+                end
+            end)
+        end)
+    end)
+end
+
 -- Get asbplayer status
 function M.asbplayer_status()
     local status = asbplayer.status()
@@ -505,6 +943,12 @@ function M.asbplayer_status()
         server_running = status.is_running,
         client_connected = status.is_connected,
         pending_requests = status.pending_count,
+        stats = status.stats,
+        cue_tracks = status.cue_tracks,
+        spool_depth = status.spool_depth,
+        spool_unknown = status.spool_unknown,
+        client_count = status.client_count,
+        active_client = status.active_client,
     }
 end
 
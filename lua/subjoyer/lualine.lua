@@ -39,31 +39,25 @@ end
 function M.get_subtitle()
     local cfg = config_mod.get()
 
+    -- Lines arrive filtered and trimmed by the relay
     local state = display_mod.get_state()
     if not state or not state.subtitle then
         return nil
     end
 
-    local raw_lines = state.subtitle.lines or {}
-    if #raw_lines == 0 and state.subtitle.text and state.subtitle.text ~= "" then
-        raw_lines = { { text = state.subtitle.text, track = 0 } }
+    local lines = state.subtitle.lines or {}
+    if #lines == 0 and state.subtitle.text and state.subtitle.text ~= "" then
+        lines = { { text = state.subtitle.text, track = 0 } }
     end
 
-    if #raw_lines == 0 then
+    if #lines == 0 then
         return nil
     end
 
     -- Build items with timestamp/track_label
     local items = {}
-    for _, line in ipairs(raw_lines) do
-        local track_num = line.track_num or line.track or 0
-        local text = line.text or ""
-
-        if cfg.subtitle.trim then
-            text = text:gsub("^%s*(.-)%s*$", "%1")
-        end
-
-        local item = { text = text }
+    for _, line in ipairs(lines) do
+        local item = { text = line.text }
 
         local show_timestamp = get_effective_setting(cfg.lualine.show_timestamp, cfg.subtitle.show_timestamp)
         local show_track_label = get_effective_setting(cfg.lualine.track_label, cfg.subtitle.track_label)
@@ -75,7 +69,7 @@ function M.get_subtitle()
         end
 
         if show_track_label then
-            item.track_label = string.format("Track %d:", track_num)
+            item.track_label = string.format("Track %d:", line.track_num or line.track or 0)
         end
 
         table.insert(items, item)
@@ -113,7 +107,7 @@ function M.component()
             return subjoyer.is_started
                 and state
                 and state.subtitle
-                and (state.subtitle.lines and #state.subtitle.lines > 0 or state.subtitle.text ~= "")
+                and (state.subtitle.lines and #state.subtitle.lines > 0 or (state.subtitle.text or "") ~= "")
         end,
     }
 end
@@ -11,9 +11,17 @@ M.reconnect_timer = nil
 M.last_error = nil
 M.last_error_time = 0
 M.error_shown = false -- Track if we've shown connection error
+M.relay_stats = nil -- Latest relay_stats event (stale subtitles dropped, subscribers and lag)
+M.extension_alive = nil -- false while the connected extension has stopped sending heartbeats
+M.stats = nil -- Latest stats event (frames/sec, relay queue and pipe write latency)
+M.video_clock = nil -- Latest video_clock event (the relay noticed a pause, play, seek or speed change)
+M.request_counter = 0
+M.pending_requests = {} -- Callbacks of relay queries (history, search) by id
 
 M.callbacks = {
     on_subtitle = nil,
+    on_subtitle_hide = nil,
+    on_video_clock = nil,
     on_connected = nil,
     on_disconnected = nil,
     on_error = nil,
@@ -90,25 +98,56 @@ local function handle_message(data)
         end
     elseif data.type == "connected" then
         M.error_shown = false -- Reset on successful connection
+        M.extension_alive = true
         if M.callbacks.on_connected then
             M.callbacks.on_connected(data)
         end
     elseif data.type == "disconnected" or data.type == "client_disconnected" then
         -- Only log disconnect in debug mode (not an error)
         debug_log("Client disconnected")
+        M.extension_alive = nil
         if M.callbacks.on_disconnected then
             M.callbacks.on_disconnected(data)
         end
     elseif data.type == "subtitle" then
+        local config = require("subjoyer.config").get()
+        if config.connection.passthrough then
+            -- Forwarded as the extension sent it; filter here instead of in the relay
+            data = require("subjoyer.display").prepare(data, config)
+        end
         if M.callbacks.on_subtitle then
             M.callbacks.on_subtitle(data)
         end
-    elseif data.type == "heartbeat" then
-        -- Silently ignore heartbeats (unless debug)
-        debug_log("Heartbeat received")
+    elseif data.type == "subtitle_hide" then
+        -- The relay's video clock reached the end of the subtitle on display
+        if M.callbacks.on_subtitle_hide then
+            M.callbacks.on_subtitle_hide(data)
+        end
+    elseif data.type == "video_clock" then
+        M.video_clock = data
+        if M.callbacks.on_video_clock then
+            M.callbacks.on_video_clock(data)
+        end
+    elseif data.type == "extension_liveness" then
+        -- Heartbeats are absorbed by the relay; it only reports when they stop or resume
+        M.extension_alive = data.alive
+        debug_log(data.alive and "Extension alive again" or "Extension stopped sending heartbeats")
+    elseif data.type == "relay_stats" then
+        M.relay_stats = data
+    elseif data.type == "stats" then
+        M.stats = data
+    elseif data.type == "history" or data.type == "search" or data.type == "log" then
+        -- Answers to a query of another attached Neovim carry an unknown id
+        local callback = M.pending_requests[data.id]
+        if callback then
+            M.pending_requests[data.id] = nil
+            callback(data)
+        end
     end
 end
 
+M.handle_message = handle_message
+
 -- Start WebSocket server
 function M.start(config)
     if M.is_running then
@@ -146,23 +185,41 @@ function M.start(config)
         tostring(config.connection.port),
     }
 
+    if config.connection.passthrough then
+        table.insert(cmd, "--passthrough")
+    end
+
+    vim.list_extend(cmd, {
+        "--liveness-timeout",
+        tostring(config.connection.liveness_timeout),
+        "--stats-interval",
+        tostring(config.connection.stats_interval),
+        "--history-size",
+        tostring(config.connection.history_size),
+        "--schedule-delay",
+        tostring(config.connection.schedule_delay),
+        "--log-level",
+        config.behavior.debug and "debug" or config.behavior.log_level,
+    })
+
+    if config.connection.record then
+        vim.list_extend(cmd, { "--record", vim.fn.expand(config.connection.record) })
+    end
+
     debug_log("Starting: " .. table.concat(cmd, " "))
 
     -- Start job
     M.job_id = vim.fn.jobstart(cmd, {
-        on_stdout = function(_, data, _)
-            for _, line in ipairs(data) do
-                if line and line ~= "" then
-                    local parsed, err = parse_json(line)
-                    if parsed then
-                        handle_message(parsed)
-                    else
-                        -- Only show parse errors in debug mode
-                        debug_log("Parse error: " .. err)
-                    end
-                end
+        -- Long answers (log, history) span several chunks; lines are reassembled first
+        on_stdout = require("subjoyer.daemon").line_reader(function(line)
+            local parsed, err = parse_json(line)
+            if parsed then
+                handle_message(parsed)
+            else
+                -- Only show parse errors in debug mode
+                debug_log("Parse error: " .. err)
             end
-        end,
+        end),
 
         on_stderr = function(_, data, _)
             -- Collect stderr output but only show in debug mode
@@ -176,6 +233,7 @@ function M.start(config)
         on_exit = function(_, exit_code, _)
             M.is_running = false
             M.job_id = nil
+            M.fail_pending("Server stopped")
 
             -- Only log exit in debug mode (reconnect will handle it silently)
             debug_log("Server exited with code: " .. exit_code)
@@ -197,7 +255,67 @@ function M.start(config)
         if M.callbacks.on_error then
             M.callbacks.on_error("Failed to start job")
         end
+        return
     end
+
+    M.send_display_config(config)
+end
+
+-- Send the display config to the relay, which filters and formats subtitles with it
+function M.send_display_config(config)
+    if M.job_id then
+        vim.fn.chansend(M.job_id, vim.json.encode(require("subjoyer.display").relay_config(config)) .. "\n")
+    end
+end
+
+-- Fail every pending relay query (relay gone; no answer will come)
+function M.fail_pending(reason)
+    local pending = M.pending_requests
+    M.pending_requests = {}
+    for _, callback in pairs(pending) do
+        callback({ error = reason })
+    end
+end
+
+-- Query the relay; callback gets the answer event (or { error = ... }, also
+-- after connection.request_timeout seconds without an answer)
+function M.request(command, callback)
+    if not M.job_id then
+        callback({ error = "Server not running" })
+        return nil
+    end
+
+    M.request_counter = M.request_counter + 1
+    local id = "nvim-" .. M.request_counter .. "-" .. vim.loop.now()
+    command.id = id
+    command.channel = "subtitle"
+    M.pending_requests[id] = callback
+    vim.fn.chansend(M.job_id, vim.json.encode(command) .. "\n")
+
+    local timeout = require("subjoyer.config").get().connection.request_timeout or 5
+    vim.defer_fn(function()
+        local pending = M.pending_requests[id]
+        if pending then
+            M.pending_requests[id] = nil
+            pending({ error = "Request timeout" })
+        end
+    end, timeout * 1000)
+    return id
+end
+
+-- Subtitles of the session between two video times (ms), for the tracks on display
+function M.history(from_ms, to_ms, callback)
+    return M.request({ command = "history", from = from_ms, to = to_ms }, callback)
+end
+
+-- Subtitles of the session matching query, best first (each with its video time in ms)
+function M.search(query, limit, callback)
+    return M.request({ command = "search", query = query, limit = limit }, callback)
+end
+
+-- Entries of the bridge's log buffer; level (optional) changes what it keeps from now on
+function M.log(level, callback)
+    return M.request({ command = "log", level = level }, callback)
 end
 
 -- Stop WebSocket server
@@ -218,6 +336,10 @@ function M.stop()
     M.is_running = false
     M.reconnect_count = 0
     M.error_shown = false
+    M.relay_stats = nil
+    M.extension_alive = nil
+    M.stats = nil
+    M.fail_pending("Server stopped")
 end
 
 -- Schedule reconnection
@@ -274,6 +396,10 @@ end
 function M.on(event, callback)
     if event == "subtitle" then
         M.callbacks.on_subtitle = callback
+    elseif event == "subtitle_hide" then
+        M.callbacks.on_subtitle_hide = callback
+    elseif event == "video_clock" then
+        M.callbacks.on_video_clock = callback
     elseif event == "connected" then
         M.callbacks.on_connected = callback
     elseif event == "disconnected" then
@@ -291,6 +417,11 @@ function M.status()
         is_running = M.is_running,
         job_id = M.job_id,
         reconnect_count = M.reconnect_count,
+        dropped = M.relay_stats and M.relay_stats.dropped or 0,
+        subscribers = M.relay_stats and M.relay_stats.subscribers,
+        lag_ms = M.relay_stats and M.relay_stats.lag_ms or 0,
+        extension_alive = M.extension_alive,
+        stats = M.stats,
     }
 end
 
@@ -30,10 +30,24 @@ end, {
     desc = "Show plugin status",
 })
 
-vim.api.nvim_create_user_command("SubjoyerDebug", function()
-    require("subjoyer").toggle_debug()
+vim.api.nvim_create_user_command("SubjoyerDebug", function(opts)
+    if opts.args == "log" then
+        require("subjoyer").show_log()
+    else
+        require("subjoyer").toggle_debug()
+    end
 end, {
-    desc = "Toggle debug mode on/off",
+    nargs = "?",
+    complete = function()
+        return { "log" }
+    end,
+    desc = "Toggle debug mode on/off, or show the bridge log (log)",
+})
+
+vim.api.nvim_create_user_command("SubjoyerDaemonStop", function()
+    require("subjoyer").shutdown_daemon()
+end, {
+    desc = "Shut down the persistent bridge daemon",
 })
 
 -- Anki mining command (asbplayer integration)
@@ -42,3 +56,34 @@ vim.api.nvim_create_user_command("SubjoyerMineAnki", function()
 end, {
     desc = "Create Anki note from current subtitle",
 })
+
+vim.api.nvim_create_user_command("SubjoyerLoadSubtitles", function(opts)
+    require("subjoyer").load_subtitles(opts.fargs)
+end, {
+    nargs = "+",
+    complete = "file",
+    desc = "Load subtitle files into asbplayer",
+})
+
+vim.api.nvim_create_user_command("SubjoyerSeekCue", function(opts)
+    require("subjoyer").seek_cue(opts.args ~= "" and opts.args or "next")
+end, {
+    nargs = "?",
+    complete = function()
+        return { "previous", "current", "next" }
+    end,
+    desc = "Seek asbplayer to the previous, current or next cue of the loaded subtitle files",
+})
+
+vim.api.nvim_create_user_command("SubjoyerSearch", function(opts)
+    require("subjoyer").search(opts.args)
+end, {
+    nargs = "+",
+    desc = "Search this session's subtitles and seek asbplayer to a result",
+})
+
+vim.api.nvim_create_user_command("SubjoyerAsbplayerClient", function()
+    require("subjoyer").select_asbplayer_client()
+end, {
+    desc = "Choose which connected asbplayer tab receives commands",
+})
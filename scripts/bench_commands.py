@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+subjoyer.nvim - asbplayer command round-trip benchmark
+Starts ws_server_8766.py as a subprocess, connects a fake asbplayer client
+that answers mine-subtitle, seek-timestamp and load-subtitles after a
+configurable delay, and drives the server's stdin the way Neovim does.
+
+For every command it measures:
+    queue_ms       stdin write -> command received by the fake client
+    round_trip_ms  stdin write -> asbplayer_response with the same messageId
+                   on the server's stdout
+
+Commands are sent at --rate per second (0 = as fast as possible) with at
+most --concurrency of them awaiting a response; the server itself sends at
+most --max-in-flight to the client. The report is JSON (stdout, or --output
+FILE) with percentiles per command type, overall throughput, timeouts
+(asbplayer_timeout events and commands never answered) and the server's CPU
+usage and RSS.
+
+Requirements:
+    pip install websockets
+
+Usage:
+    python bench_commands.py [--count N] [--rate PER_SEC] [--concurrency N] [--max-in-flight N]
+                             [--mix seek-timestamp=6,mine-subtitle=3,load-subtitles=1]
+                             [--delay COMMAND=MS ...] [--load-size BYTES] [--command-timeout SECS]
+                             [--port PORT] [--output FILE]
+"""
+
+import asyncio
+import websockets
+import base64
+import json
+import os
+import platform
+import random
+import sys
+import time
+import argparse
+from typing import Dict, List
+
+from bench_relay import ProcessMeter, summarize
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ws_server_8766.py')
+COMMANDS = ('seek-timestamp', 'mine-subtitle', 'load-subtitles')
+
+
+def parse_weights(text: str) -> Dict[str, float]:
+    """'seek-timestamp=6,mine-subtitle=3' -> {'seek-timestamp': 6.0, 'mine-subtitle': 3.0}"""
+    weights = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in COMMANDS:
+            raise argparse.ArgumentTypeError(f"Unknown command: {name}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def parse_delay(text: str) -> tuple:
+    """'mine-subtitle=250' -> ('mine-subtitle', 250.0)"""
+    name, _, delay = text.partition('=')
+    if name not in COMMANDS:
+        raise argparse.ArgumentTypeError(f"Unknown command: {name}")
+    return name, float(delay)
+
+
+def make_command(name: str, message_id: str, load_size: int) -> dict:
+    """Command as asbplayer.lua sends it"""
+    if name == 'seek-timestamp':
+        body = {"timestamp": random.randint(0, 3_600_000)}
+    elif name == 'mine-subtitle':
+        body = {"fields": {"Sentence": "吾輩は猫である。", "Source": "bench"}, "postMineAction": 0}
+    else:
+        content = base64.b64encode(os.urandom(load_size)).decode('ascii')
+        body = {"files": [{"name": "bench.srt", "base64": content}]}
+    return {"command": name, "messageId": message_id, "body": body}
+
+
+class FakeAsbplayer:
+    """asbplayer WebSocket client answering every command after a per-command delay"""
+
+    def __init__(self, url: str, delays: Dict[str, float]):
+        self.url = url
+        self.delays = delays
+        self.received_at = {}  # messageId -> perf_counter when the command arrived
+        self.answers = set()
+
+    async def run(self):
+        async with websockets.connect(self.url, max_size=None) as websocket:
+            try:
+                async for message in websocket:
+                    now = time.perf_counter()
+                    command = json.loads(message)
+                    self.received_at[command.get('messageId')] = now
+                    # Answer concurrently so delays overlap, like the real extension
+                    task = asyncio.create_task(self.answer(websocket, command))
+                    self.answers.add(task)
+                    task.add_done_callback(self.answers.discard)
+            except websockets.exceptions.ConnectionClosed:
+                pass  # server stopped
+
+    async def answer(self, websocket, command: dict):
+        delay = self.delays.get(command.get('command'), 0.0)
+        if delay:
+            await asyncio.sleep(delay / 1000)
+        response = {
+            "command": "response",
+            "messageId": command.get('messageId'),
+            "body": {"published": True}
+        }
+        try:
+            await websocket.send(json.dumps(response))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+
+class CommandBench:
+    def __init__(self, args):
+        self.args = args
+        self.process = None
+        self.meter = None
+        self.client = None
+        self.client_task = None
+        self.reader_task = None
+        self.ready = None
+        self.connected = None
+        self.window = None
+        self.sent_at = {}  # messageId -> perf_counter when written to stdin
+        self.kinds = {}  # messageId -> command name
+        self.round_trips: Dict[str, List[float]] = {name: [] for name in COMMANDS}
+        self.queue_times: Dict[str, List[float]] = {name: [] for name in COMMANDS}
+        self.answered = 0
+        self.timed_out = 0
+        self.done = None
+
+    async def start(self):
+        """Start the server, attach the fake client and wait until it is connected"""
+        loop = asyncio.get_running_loop()
+        self.ready = loop.create_future()
+        self.connected = loop.create_future()
+        self.done = asyncio.Event()
+
+        cmd = [sys.executable, SERVER_SCRIPT, '--host', '127.0.0.1', '--port', str(self.args.port),
+               '--stats-interval', '0', '--max-pending', str(max(1024, self.args.concurrency * 2)),
+               '--max-in-flight', str(self.args.max_in_flight), '--command-timeout', str(self.args.command_timeout)]
+        self.process = await asyncio.create_subprocess_exec(
+            *cmd, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL, limit=64 * 1024 * 1024)
+        self.meter = ProcessMeter(self.process.pid)
+        self.reader_task = asyncio.create_task(self.read_output())
+        await asyncio.wait_for(self.ready, 10)
+
+        self.client = FakeAsbplayer(f'ws://127.0.0.1:{self.args.port}/ws', self.args.delays)
+        self.client_task = asyncio.create_task(self.client.run())
+        await asyncio.wait_for(self.connected, 10)
+
+    async def stop(self):
+        self.process.stdin.close()
+        self.process.terminate()
+        await self.process.wait()
+        self.reader_task.cancel()
+        if self.client_task is not None:
+            await asyncio.gather(self.client_task, return_exceptions=True)
+
+    async def read_output(self):
+        """Read the server's stdout like Neovim and time every response"""
+        while True:
+            line = await self.process.stdout.readline()
+            if not line:
+                if not self.ready.done():
+                    self.ready.set_exception(RuntimeError('Server exited before it was ready'))
+                return
+            now = time.perf_counter()
+
+            event = json.loads(line)
+            event_type = event.get('type')
+            if event_type == 'asbplayer_server_ready' and not self.ready.done():
+                self.ready.set_result(True)
+            elif event_type == 'asbplayer_server_error' and not self.ready.done():
+                self.ready.set_exception(RuntimeError(event.get('error')))
+            elif event_type == 'asbplayer_connected' and not self.connected.done():
+                self.connected.set_result(True)
+            elif event_type == 'asbplayer_response':
+                message_id = (event.get('data') or {}).get('messageId')
+                sent = self.sent_at.pop(message_id, None)
+                if sent is None:
+                    continue
+                kind = self.kinds.pop(message_id)
+                self.round_trips[kind].append((now - sent) * 1000)
+                received = self.client.received_at.pop(message_id, None)
+                if received is not None:
+                    self.queue_times[kind].append((received - sent) * 1000)
+                self.answered += 1
+                self.finish()
+            elif event_type == 'asbplayer_timeout':
+                if self.sent_at.pop(event.get('messageId'), None) is not None:
+                    self.kinds.pop(event.get('messageId'))
+                    self.timed_out += 1
+                    self.finish()
+
+    def finish(self):
+        """One command got its final event"""
+        self.window.release()
+        if self.answered + self.timed_out == self.args.count:
+            self.done.set()
+
+    async def drive(self) -> float:
+        """Write --count commands to stdin; returns the seconds it took"""
+        args = self.args
+        names = list(args.mix)
+        weights = [args.mix[name] for name in names]
+        self.window = asyncio.Semaphore(args.concurrency)
+
+        start = time.perf_counter()
+        for i in range(args.count):
+            await self.window.acquire()
+            if args.rate > 0:
+                delay = start + i / args.rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            name = random.choices(names, weights)[0]
+            message_id = f'bench-{i}'
+            line = json.dumps(make_command(name, message_id, args.load_size), ensure_ascii=False) + '\n'
+            self.kinds[message_id] = name
+            self.sent_at[message_id] = time.perf_counter()
+            self.process.stdin.write(line.encode('utf-8'))
+            await self.process.stdin.drain()
+        return time.perf_counter() - start
+
+    async def run(self) -> dict:
+        args = self.args
+        await self.start()
+        try:
+            cpu_before = self.meter.cpu_seconds()
+            started = time.perf_counter()
+            send_seconds = await self.drive()
+            try:
+                await asyncio.wait_for(self.done.wait(), args.timeout)
+            except asyncio.TimeoutError:
+                pass
+            wall = time.perf_counter() - started
+            cpu_after = self.meter.cpu_seconds()
+            memory = self.meter.memory_kb()
+        finally:
+            await self.stop()
+
+        commands = {}
+        for name in COMMANDS:
+            if self.round_trips[name]:
+                commands[name] = {
+                    "count": len(self.round_trips[name]),
+                    "delay_ms": args.delays.get(name, 0.0),
+                    "round_trip_ms": summarize(self.round_trips[name]),
+                    "queue_ms": summarize(self.queue_times[name])
+                }
+
+        all_round_trips = [ms for samples in self.round_trips.values() for ms in samples]
+        print(f"[DEBUG] {self.answered}/{args.count} answered in {wall:.2f}s", file=sys.stderr, flush=True)
+        return {
+            "benchmark": "commands",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "count": args.count,
+            "rate": args.rate,
+            "concurrency": args.concurrency,
+            "answered": self.answered,
+            "timeouts": self.timed_out,
+            "unanswered": args.count - self.answered - self.timed_out,
+            "send_seconds": round(send_seconds, 3),
+            "throughput_per_sec": round(self.answered / wall, 1) if wall else 0.0,
+            "round_trip_ms": summarize(all_round_trips),
+            "commands": commands,
+            "cpu_percent": (round((cpu_after - cpu_before) / wall * 100, 1)
+                            if cpu_before is not None and cpu_after is not None else None),
+            **memory
+        }
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description='Benchmark asbplayer command round trips through ws_server_8766.py')
+    parser.add_argument('--count', type=int, default=2000, help='Commands to send')
+    parser.add_argument('--rate', type=float, default=0.0, help='Commands/sec (0 = as fast as the window allows)')
+    parser.add_argument('--concurrency', type=int, default=32, help='Max commands awaiting a response')
+    parser.add_argument('--max-in-flight', type=int, default=8, help="Server's in-flight window (--max-in-flight)")
+    parser.add_argument('--command-timeout', type=float, default=10.0, help="Server's --command-timeout")
+    parser.add_argument('--mix', type=parse_weights, default='seek-timestamp=6,mine-subtitle=3,load-subtitles=1',
+                        help='Command weights (default: seek-timestamp=6,mine-subtitle=3,load-subtitles=1)')
+    parser.add_argument('--delay', type=parse_delay, action='append', default=[],
+                        help='Client answer delay, e.g. mine-subtitle=250 (ms, repeatable)')
+    parser.add_argument('--load-size', type=int, default=64 * 1024, help='Subtitle file bytes per load-subtitles')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Seconds to wait for outstanding responses')
+    parser.add_argument('--port', type=int, default=18766, help='Port for the server under test')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the command mix')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    args = parser.parse_args()
+    args.delays = dict(args.delay)
+    random.seed(args.seed)
+
+    report = asyncio.run(CommandBench(args).run())
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+subjoyer.nvim - Subtitle relay benchmark
+Starts ws_client.py as a subprocess, plays the asbplayer-streamer extension
+against it and reads its stdout the way Neovim would.
+
+Every subtitle carries a sequence number in its text, so each line that
+comes out of the relay is matched to the frame that went in. Frames that
+never come out were coalesced (the relay only keeps the newest pending
+subtitle per track set). The relay runs with --schedule-delay 0: latency is
+its own, without the jitter buffer Neovim configures.
+
+Scenarios:
+    steady   single track at --rate frames/sec
+    dual     two tracks per frame at --rate
+    cjk      dual track, long Japanese lines (--cjk-length chars) at --rate
+    burst    --burst-size frames back to back every --burst-interval seconds
+    ramp     doubling rates until the relay falls behind or p99 latency
+             exceeds --max-p99; reports the max sustainable frames/sec
+    replay   frames from --replay FILE: a relay recording (ws_client.py
+             --record), or JSON lines with a frame per line or
+             {"t": seconds, "frame": {...}} to keep the recorded timing
+
+The report is JSON (stdout, or --output FILE): per scenario the frames sent
+and delivered, end-to-end latency percentiles in ms, and the relay's CPU
+usage and RSS.
+
+Requirements:
+    pip install websockets
+    pip install psutil  (optional, CPU/RSS where /proc is not available)
+
+Usage:
+    python bench_relay.py [--scenario NAME ...] [--rate FPS] [--duration SECS]
+                          [--burst-size N] [--burst-interval SECS] [--cjk-length N]
+                          [--replay FILE] [--passthrough] [--port PORT] [--output FILE]
+"""
+
+import asyncio
+import websockets
+import json
+import os
+import platform
+import re
+import sys
+import time
+import argparse
+from typing import List, Optional
+
+from session_recording import MAGIC, SessionRecording
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+RELAY_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ws_client.py')
+SCENARIOS = ('steady', 'dual', 'cjk', 'burst', 'ramp', 'replay')
+
+SEQ_PATTERN = re.compile(r'#(\d+)#')
+CJK_TEXT = '吾輩は猫である。名前はまだ無い。どこで生れたかとんと見当がつかぬ。'
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of a sorted list"""
+    if not samples:
+        return 0.0
+    rank = max(0, min(len(samples) - 1, int(round(fraction * len(samples))) - 1))
+    return samples[rank]
+
+
+def summarize(latencies: List[float]) -> dict:
+    samples = sorted(latencies)
+    return {
+        "p50": round(percentile(samples, 0.50), 3),
+        "p90": round(percentile(samples, 0.90), 3),
+        "p99": round(percentile(samples, 0.99), 3),
+        "max": round(samples[-1], 3) if samples else 0.0,
+        "mean": round(sum(samples) / len(samples), 3) if samples else 0.0
+    }
+
+
+def make_frame(seq: int, tracks: int = 1, text_length: int = 0, cjk: bool = False) -> dict:
+    """Synthetic subtitle event tagged with a sequence number"""
+    lines = []
+    for track in range(tracks):
+        body = f'line {seq}'
+        if cjk:
+            body = (CJK_TEXT * (text_length // len(CJK_TEXT) + 1))[:text_length]
+        lines.append({"text": f"#{seq}# {body}", "track": track})
+    return {
+        "type": "subtitle",
+        "subtitle": {"text": "\n".join(line["text"] for line in lines), "lines": lines},
+        "video": {"currentTime": seq / 10, "paused": False}
+    }
+
+
+def load_replay(path: str) -> List[tuple]:
+    """(offset seconds or None, frame) pairs from a recorded stream"""
+    with open(path, 'rb') as f:
+        is_recording = f.read(len(MAGIC)) == MAGIC
+    if is_recording:
+        recording = SessionRecording(path)
+        try:
+            recorded = list(recording.frames())
+        finally:
+            recording.close()
+        first = recorded[0][0] if recorded else 0
+        return [((received - first) / 1000, json.loads(message)) for received, _, message in recorded]
+
+    frames = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if 'frame' in record:
+                frames.append((record.get('t'), record['frame']))
+            else:
+                frames.append((None, record))
+    return frames
+
+
+class ProcessMeter:
+    """CPU time and memory of the relay process"""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.process = psutil.Process(pid) if psutil is not None else None
+        self.clock_ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+    def cpu_seconds(self) -> Optional[float]:
+        try:
+            with open(f'/proc/{self.pid}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / self.clock_ticks
+        except OSError:
+            if self.process is None:
+                return None
+            times = self.process.cpu_times()
+            return times.user + times.system
+
+    def memory_kb(self) -> dict:
+        try:
+            with open(f'/proc/{self.pid}/status') as f:
+                status = dict(line.split(':', 1) for line in f if ':' in line)
+            return {
+                "rss_kb": int(status['VmRSS'].split()[0]),
+                "peak_rss_kb": int(status['VmHWM'].split()[0])
+            }
+        except (OSError, KeyError):
+            if self.process is None:
+                return {"rss_kb": None, "peak_rss_kb": None}
+            rss = self.process.memory_info().rss // 1024
+            return {"rss_kb": rss, "peak_rss_kb": None}
+
+
+class RelayBench:
+    def __init__(self, args):
+        self.args = args
+        self.process = None
+        self.meter: Optional[ProcessMeter] = None
+        self.reader_task = None
+        self.ready = None
+        self.sent_at = {}  # seq -> perf_counter when sent
+        self.latencies: List[float] = []
+        self.last_output = 0.0
+        self.seq = 0
+
+    async def start(self):
+        """Start the relay and wait for server_ready"""
+        cmd = [sys.executable, RELAY_SCRIPT, '--host', 'localhost', '--port', str(self.args.port),
+               '--stats-interval', '0', '--schedule-delay', '0']
+        if self.args.passthrough:
+            cmd.append('--passthrough')
+        self.process = await asyncio.create_subprocess_exec(
+            *cmd, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL, limit=64 * 1024 * 1024)
+        self.meter = ProcessMeter(self.process.pid)
+        self.ready = asyncio.get_running_loop().create_future()
+        self.reader_task = asyncio.create_task(self.read_output())
+        await asyncio.wait_for(self.ready, 10)
+
+    async def stop(self):
+        self.process.stdin.close()
+        self.process.terminate()
+        await self.process.wait()
+        self.reader_task.cancel()
+
+    async def read_output(self):
+        """Read the relay's stdout like Neovim and time every subtitle"""
+        while True:
+            line = await self.process.stdout.readline()
+            if not line:
+                if not self.ready.done():
+                    self.ready.set_exception(RuntimeError('Relay exited before server_ready'))
+                return
+            now = time.perf_counter()
+            self.last_output = now
+
+            event = json.loads(line)
+            if event.get('type') == 'server_ready' and not self.ready.done():
+                self.ready.set_result(True)
+            elif event.get('type') == 'server_error' and not self.ready.done():
+                self.ready.set_exception(RuntimeError(event.get('error')))
+            elif event.get('type') == 'subtitle':
+                match = SEQ_PATTERN.search(event['subtitle']['text'])
+                sent = self.sent_at.pop(int(match.group(1)), None) if match else None
+                if sent is not None:
+                    self.latencies.append((now - sent) * 1000)
+
+    def next_frame(self, tracks: int = 1, cjk: bool = False) -> str:
+        self.seq += 1
+        return json.dumps(make_frame(self.seq, tracks, self.args.cjk_length, cjk), ensure_ascii=False)
+
+    async def send(self, websocket, message: str):
+        match = SEQ_PATTERN.search(message)
+        if match:
+            self.sent_at[int(match.group(1))] = time.perf_counter()
+        await websocket.send(message)
+
+    async def settle(self, timeout: float = 2.0):
+        """Wait until every frame came out, or the relay went quiet (the rest was coalesced)"""
+        deadline = time.perf_counter() + timeout
+        while self.sent_at and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+            if time.perf_counter() - self.last_output >= 0.2:
+                break
+
+    async def measure(self, name: str, play, **details) -> dict:
+        """Run one scenario over a fresh extension connection"""
+        self.sent_at.clear()
+        self.latencies = []
+        cpu_before = self.meter.cpu_seconds()
+        started = time.perf_counter()
+
+        async with websockets.connect(f'ws://localhost:{self.args.port}', max_size=None) as websocket:
+            await websocket.send(json.dumps({"type": "connected", "version": "bench"}))
+            sent = await play(websocket)
+            send_seconds = time.perf_counter() - started
+            await self.settle()
+            # The newest frame is never coalesced; if it is missing the relay fell behind
+            caught_up = self.seq not in self.sent_at
+
+        wall = time.perf_counter() - started
+        cpu_after = self.meter.cpu_seconds()
+        delivered = len(self.latencies)
+        result = {
+            "scenario": name,
+            **details,
+            "sent": sent,
+            "delivered": delivered,
+            "coalesced": sent - delivered,
+            "caught_up": caught_up,
+            "send_fps": round(sent / send_seconds, 1) if send_seconds else 0.0,
+            "latency_ms": summarize(self.latencies),
+            "cpu_percent": (round((cpu_after - cpu_before) / wall * 100, 1)
+                            if cpu_before is not None and cpu_after is not None else None),
+            **self.meter.memory_kb()
+        }
+        print(f"[DEBUG] {name}: {delivered}/{sent} delivered, p99 {result['latency_ms']['p99']}ms",
+              file=sys.stderr, flush=True)
+        return result
+
+    def paced(self, rate: float, duration: float, tracks: int = 1, cjk: bool = False):
+        """Player sending frames at a fixed rate"""
+        async def play(websocket) -> int:
+            count = int(rate * duration)
+            start = time.perf_counter()
+            for i in range(count):
+                delay = start + i / rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                await self.send(websocket, self.next_frame(tracks, cjk))
+            return count
+        return play
+
+    def bursts(self, size: int, interval: float, duration: float):
+        """Player sending frames back to back in periodic bursts"""
+        async def play(websocket) -> int:
+            count = 0
+            start = time.perf_counter()
+            for burst in range(max(1, int(duration / interval))):
+                delay = start + burst * interval - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                for _ in range(size):
+                    await self.send(websocket, self.next_frame(tracks=2))
+                    count += 1
+            return count
+        return play
+
+    def replayed(self, frames: List[tuple]):
+        """Player re-sending a recorded stream, with its timing when it has one"""
+        async def play(websocket) -> int:
+            subtitles = 0
+            start = time.perf_counter()
+            for i, (offset, frame) in enumerate(frames):
+                if offset is None:
+                    offset = i / self.args.rate
+                delay = start + offset - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                # Tag recorded subtitles so they can be matched on the way out
+                if frame.get('type') == 'subtitle':
+                    subtitles += 1
+                    self.seq += 1
+                    frame = json.loads(json.dumps(frame))
+                    subtitle = frame.setdefault('subtitle', {})
+                    for line in subtitle.get('lines') or []:
+                        line['text'] = f"#{self.seq}# {line.get('text', '')}"
+                    subtitle['text'] = f"#{self.seq}# {subtitle.get('text', '')}"
+                await self.send(websocket, json.dumps(frame, ensure_ascii=False))
+            return subtitles
+        return play
+
+    async def ramp(self) -> dict:
+        """Double the rate until the relay falls behind or p99 exceeds --max-p99.
+
+        Coalescing is expected at high rates and does not fail a step; the
+        harness itself failing to reach 90% of the rate does.
+        """
+        steps = []
+        sustainable = 0.0
+        rate = self.args.ramp_start
+        while rate <= self.args.ramp_limit:
+            step = await self.measure('ramp', self.paced(rate, self.args.ramp_step, tracks=2), rate=rate)
+            steps.append(step)
+            ok = (step['caught_up'] and step['latency_ms']['p99'] <= self.args.max_p99
+                  and step['send_fps'] >= 0.9 * rate)
+            if not ok:
+                break
+            sustainable = step['send_fps']
+            rate *= 2
+        return {"scenario": "ramp", "max_sustainable_fps": sustainable, "steps": steps}
+
+    async def run(self, scenarios: List[str]) -> dict:
+        args = self.args
+        await self.start()
+        results = []
+        try:
+            for name in scenarios:
+                if name == 'steady':
+                    results.append(await self.measure(name, self.paced(args.rate, args.duration),
+                                                      rate=args.rate))
+                elif name == 'dual':
+                    results.append(await self.measure(name, self.paced(args.rate, args.duration, tracks=2),
+                                                      rate=args.rate))
+                elif name == 'cjk':
+                    results.append(await self.measure(name, self.paced(args.rate, args.duration, 2, cjk=True),
+                                                      rate=args.rate, text_length=args.cjk_length))
+                elif name == 'burst':
+                    results.append(await self.measure(name, self.bursts(args.burst_size, args.burst_interval,
+                                                                        args.duration),
+                                                      burst_size=args.burst_size))
+                elif name == 'ramp':
+                    results.append(await self.ramp())
+                elif name == 'replay':
+                    results.append(await self.measure(name, self.replayed(load_replay(args.replay)),
+                                                      file=args.replay))
+        finally:
+            await self.stop()
+
+        return {
+            "benchmark": "relay",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "passthrough": args.passthrough,
+            "results": results
+        }
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description='Benchmark the subjoyer.nvim subtitle relay')
+    parser.add_argument('--scenario', nargs='+', choices=SCENARIOS,
+                        default=['steady', 'dual', 'cjk', 'burst', 'ramp'], help='Scenarios to run')
+    parser.add_argument('--rate', type=float, default=30.0, help='Frames/sec for paced scenarios')
+    parser.add_argument('--duration', type=float, default=5.0, help='Seconds per scenario')
+    parser.add_argument('--burst-size', type=int, default=200, help='Frames per burst')
+    parser.add_argument('--burst-interval', type=float, default=1.0, help='Seconds between bursts')
+    parser.add_argument('--cjk-length', type=int, default=400, help='Characters per CJK line')
+    parser.add_argument('--ramp-start', type=float, default=100.0, help='First ramp rate (frames/sec)')
+    parser.add_argument('--ramp-limit', type=float, default=51200.0, help='Highest ramp rate tried')
+    parser.add_argument('--ramp-step', type=float, default=2.0, help='Seconds per ramp rate')
+    parser.add_argument('--max-p99', type=float, default=50.0, help='p99 latency (ms) a ramp rate must stay under')
+    parser.add_argument('--replay', help='Recorded frames (JSON lines) for the replay scenario')
+    parser.add_argument('--passthrough', action='store_true', help='Run the relay with --passthrough')
+    parser.add_argument('--port', type=int, default=18767, help='Port for the relay under test')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    if 'replay' in args.scenario and not args.replay:
+        parser.error('the replay scenario needs --replay FILE')
+
+    report = asyncio.run(RelayBench(args).run(args.scenario))
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
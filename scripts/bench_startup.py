@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+subjoyer.nvim - Bridge startup benchmark
+Spawns ws_client.py, ws_server_8766.py and subjoyer_daemon.py the way
+Neovim does (:SubjoyerStart, reconnect respawns) and times, per run:
+    ready_ms    spawn -> every ready event of the bridge on stdout
+    serving_ms  spawn -> first WebSocket handshake answered (101) on its port
+
+Each bridge is started --runs times after --warmup discarded runs. The
+report is JSON (stdout, or --output FILE) with percentiles per bridge. Pass
+an earlier report as --compare FILE to add the change of each p50, and
+--scripts DIR to time another checkout.
+
+Requirements:
+    pip install websockets  (for the bridges under test)
+
+Usage:
+    python bench_startup.py [--bridge relay|asbplayer|daemon ...] [--runs N] [--warmup N]
+                            [--port PORT] [--scripts DIR] [--compare FILE] [--output FILE]
+"""
+
+import asyncio
+import base64
+import json
+import os
+import platform
+import sys
+import time
+import argparse
+from typing import List, Optional
+
+from bench_relay import summarize
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BRIDGES = ('relay', 'asbplayer', 'daemon')
+
+# Longest a bridge may take to become ready or serve
+START_TIMEOUT = 20.0  # seconds
+
+
+def bridge_command(name: str, scripts: str, port: int) -> tuple:
+    """(argv, ready event types) of one bridge on port (the daemon also uses port + 1)"""
+    if name == 'relay':
+        return ([sys.executable, os.path.join(scripts, 'ws_client.py'), '--host', '127.0.0.1', '--port', str(port),
+                 '--stats-interval', '0'], {'server_ready'})
+    if name == 'asbplayer':
+        return ([sys.executable, os.path.join(scripts, 'ws_server_8766.py'), '--host', '127.0.0.1',
+                 '--port', str(port), '--stats-interval', '0'], {'asbplayer_server_ready'})
+    return ([sys.executable, os.path.join(scripts, 'subjoyer_daemon.py'), '--host', '127.0.0.1', '--port', str(port),
+             '--asbplayer-port', str(port + 1), '--stats-interval', '0'],
+            {'server_ready', 'asbplayer_server_ready'})
+
+
+async def handshake(port: int) -> bool:
+    """One WebSocket opening handshake; False if the port is not accepting yet"""
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    except OSError:
+        return False
+    try:
+        key = base64.b64encode(os.urandom(16)).decode('ascii')
+        writer.write((f"GET /ws HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\nUpgrade: websocket\r\n"
+                      f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n")
+                     .encode('ascii'))
+        status = await reader.readline()
+        return status.split(b' ', 2)[1:2] == [b'101']
+    except (OSError, IndexError):
+        return False
+    finally:
+        writer.close()
+
+
+async def wait_serving(process, port: int, deadline: float) -> Optional[float]:
+    """perf_counter of the first answered handshake, or None by deadline or exit"""
+    while time.perf_counter() < deadline and process.returncode is None:
+        if await handshake(port):
+            return time.perf_counter()
+        await asyncio.sleep(0.002)
+    return None
+
+
+async def wait_ready(process, types: set, deadline: float) -> Optional[float]:
+    """perf_counter once every ready event type was seen, or None"""
+    remaining = set(types)
+    while remaining:
+        try:
+            line = await asyncio.wait_for(process.stdout.readline(), deadline - time.perf_counter())
+        except asyncio.TimeoutError:
+            return None
+        if not line:
+            return None
+        try:
+            event = json.loads(line)
+        except ValueError:
+            continue
+        if event.get('type', '').endswith('server_error'):
+            return None
+        remaining.discard(event.get('type'))
+    return time.perf_counter()
+
+
+async def start_once(name: str, args) -> dict:
+    """Spawn one bridge, time it, and stop it"""
+    argv, types = bridge_command(name, args.scripts, args.port)
+    started = time.perf_counter()
+    deadline = started + START_TIMEOUT
+    process = await asyncio.create_subprocess_exec(*argv, stdin=asyncio.subprocess.PIPE,
+                                                   stdout=asyncio.subprocess.PIPE,
+                                                   stderr=asyncio.subprocess.DEVNULL)
+    try:
+        ready, serving = await asyncio.gather(wait_ready(process, types, deadline),
+                                              wait_serving(process, args.port, deadline))
+    finally:
+        process.stdin.close()
+        if process.returncode is None:
+            process.terminate()
+        await process.wait()
+
+    return {
+        "ready_ms": (ready - started) * 1000 if ready is not None else None,
+        "serving_ms": (serving - started) * 1000 if serving is not None else None
+    }
+
+
+async def bench_bridge(name: str, args) -> dict:
+    ready: List[float] = []
+    serving: List[float] = []
+    failures = 0
+    for run in range(args.warmup + args.runs):
+        result = await start_once(name, args)
+        if run < args.warmup:
+            continue
+        if result["ready_ms"] is None or result["serving_ms"] is None:
+            failures += 1
+        if result["ready_ms"] is not None:
+            ready.append(result["ready_ms"])
+        if result["serving_ms"] is not None:
+            serving.append(result["serving_ms"])
+    return {
+        "runs": args.runs,
+        "failures": failures,
+        "ready_ms": summarize(ready),
+        "serving_ms": summarize(serving)
+    }
+
+
+def compare(report: dict, path: str):
+    """Add the change of each p50 against an earlier report"""
+    with open(path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    for name, result in report["bridges"].items():
+        before = baseline.get("bridges", {}).get(name)
+        if before is None:
+            continue
+        result["change_p50_ms"] = {
+            metric: round(result[metric]["p50"] - before[metric]["p50"], 3)
+            for metric in ("ready_ms", "serving_ms") if metric in before
+        }
+
+
+async def run(args) -> dict:
+    bridges = {}
+    for name in args.bridge or BRIDGES:
+        bridges[name] = await bench_bridge(name, args)
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scripts": os.path.abspath(args.scripts),
+        "bridges": bridges
+    }
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description='Benchmark how fast the subjoyer.nvim bridges start')
+    parser.add_argument('--bridge', choices=BRIDGES, action='append', help='Bridge to time (repeatable; default all)')
+    parser.add_argument('--runs', type=int, default=20, help='Timed starts per bridge')
+    parser.add_argument('--warmup', type=int, default=2, help='Untimed starts per bridge first (file cache)')
+    parser.add_argument('--port', type=int, default=18767, help='Port for the bridge under test (daemon: and +1)')
+    parser.add_argument('--scripts', default=SCRIPTS_DIR, help='Directory holding the bridge scripts')
+    parser.add_argument('--compare', help='Earlier report to compare p50s against')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.compare:
+        compare(report, args.compare)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,520 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+subjoyer.nvim - Shared I/O for the bridge scripts
+Non-blocking, batching stdout writer, async stdin reader, JSON helpers,
+latency histograms and the bridge log used by ws_client.py and
+ws_server_8766.py, and the msgpack-RPC writer of subjoyer_daemon.py --nvim.
+
+Requirements:
+    pip install orjson  (optional, faster JSON decoding/encoding)
+    pip install msgpack  (optional, for delivering events over Neovim's RPC socket)
+"""
+
+import asyncio
+import io
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from typing import List, Optional
+
+try:
+    import orjson
+
+    def json_loads(text):
+        return orjson.loads(text)
+
+    def json_dumps(data) -> str:
+        return orjson.dumps(data).decode('utf-8')
+
+except ImportError:
+    json_loads = json.loads
+
+    def json_dumps(data) -> str:
+        return json.dumps(data, ensure_ascii=False)
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest', 'wait')
+
+def force_utf8_stdio():
+    """Force UTF-8 stdout/stderr on Windows (Japanese subtitles etc.); safe to call twice"""
+    if sys.platform == 'win32' and getattr(sys.stdout, 'encoding', '').lower() != 'utf-8':
+        sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+        sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+
+
+# load-subtitles commands carry whole subtitle files on one line
+STDIN_LINE_LIMIT = 128 * 1024 * 1024
+
+
+async def open_stdin_reader(limit: int = STDIN_LINE_LIMIT) -> asyncio.StreamReader:
+    """Return a StreamReader fed from stdin by the event loop.
+
+    Uses loop.connect_read_pipe, so reading costs nothing while Neovim is
+    quiet. Where stdin cannot be registered with the loop (regular file,
+    event loop without pipe support) a helper thread feeds the same reader.
+    """
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=limit, loop=loop)
+    try:
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader, loop=loop), sys.stdin)
+    except (NotImplementedError, ValueError, OSError):
+        def pump():
+            stream = getattr(sys.stdin, 'buffer', sys.stdin)
+            while True:
+                chunk = stream.readline()
+                if not chunk:
+                    loop.call_soon_threadsafe(reader.feed_eof)
+                    return
+                loop.call_soon_threadsafe(reader.feed_data, chunk)
+
+        threading.Thread(target=pump, daemon=True).start()
+    return reader
+
+
+class LatencyHistogram:
+    """Latency samples (ms) of the current stats interval in log-spaced buckets.
+
+    Recording is one bisect and an increment, cheap enough for every frame.
+    snapshot() summarizes the interval and starts the next one.
+    """
+
+    EDGES = tuple(0.01 * 2 ** i for i in range(21))  # 0.01ms .. ~10s
+
+    def __init__(self):
+        self.counts = [0] * (len(self.EDGES) + 1)
+        self.count = 0
+        self.max = 0.0
+
+    def record(self, ms: float):
+        self.counts[bisect_left(self.EDGES, ms)] += 1
+        self.count += 1
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, fraction: float) -> float:
+        """Upper bound of the bucket holding the given fraction of samples"""
+        rank = fraction * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(self.EDGES[i], self.max) if i < len(self.EDGES) else self.max
+        return self.max
+
+    def snapshot(self) -> dict:
+        """Summary of the interval so far; resets the histogram"""
+        summary = {
+            "count": self.count,
+            "p50": round(self.percentile(0.5), 2),
+            "p95": round(self.percentile(0.95), 2),
+            "max": round(self.max, 2)
+        }
+        self.counts = [0] * len(self.counts)
+        self.count = 0
+        self.max = 0.0
+        return summary
+
+
+LOG_LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40, 'off': 100}
+
+# Log entries kept in memory for the log command
+LOG_BUFFER_SIZE = 2000
+
+
+class BridgeLog:
+    """Recent log entries of this process in a ring buffer, gated by a runtime level.
+
+    Call sites pass a %-format string and its arguments; the message is only
+    formatted if its level is enabled, so a disabled debug call costs one
+    comparison. Entries stay in memory until Neovim asks for them (the log
+    command of each bridge); only errors are also written to stderr.
+    """
+
+    def __init__(self, size: int = LOG_BUFFER_SIZE):
+        self.threshold = LOG_LEVELS['off']
+        self.entries = deque(maxlen=size)
+
+    @property
+    def level(self) -> str:
+        return next(name for name, value in LOG_LEVELS.items() if value == self.threshold)
+
+    def set_level(self, name: str):
+        if name not in LOG_LEVELS:
+            raise ValueError(f"Unknown log level: {name}")
+        self.threshold = LOG_LEVELS[name]
+
+    def record(self, level: str, source: str, message: str, args: tuple):
+        text = message % args if args else message
+        self.entries.append((time.time(), level, source, text))
+        if level == 'error':
+            print(f"ERROR: [{source}] {text}", file=sys.stderr, flush=True)
+
+    def dump(self) -> List[dict]:
+        """Buffered entries, oldest first"""
+        return [{"time": round(at, 3), "level": level, "source": source, "message": text}
+                for at, level, source, text in self.entries]
+
+
+# One log per process: in the daemon both bridges share it
+LOG = BridgeLog()
+
+
+class Logger:
+    """Named handle on the process log"""
+
+    __slots__ = ('source',)
+
+    def __init__(self, source: str):
+        self.source = source
+
+    def debug(self, message: str, *args):
+        if LOG.threshold <= 10:
+            LOG.record('debug', self.source, message, args)
+
+    def info(self, message: str, *args):
+        if LOG.threshold <= 20:
+            LOG.record('info', self.source, message, args)
+
+    def warning(self, message: str, *args):
+        if LOG.threshold <= 30:
+            LOG.record('warning', self.source, message, args)
+
+    def error(self, message: str, *args):
+        # Errors reach stderr whatever the level
+        LOG.record('error', self.source, message, args)
+
+
+log = Logger('nvim')
+
+
+def log_command(command: dict) -> dict:
+    """Apply a log command ({"level": NAME} optional) and return the level and buffered entries"""
+    if command.get('level'):
+        LOG.set_level(str(command['level']))
+    return {"level": LOG.level, "entries": LOG.dump()}
+
+
+class _PipeProtocol(asyncio.Protocol):
+    """Forwards transport flow control to the owning writer"""
+
+    def __init__(self, writer: 'LineWriter'):
+        self.writer = writer
+
+    def pause_writing(self):
+        self.writer.pause_writing()
+
+    def resume_writing(self):
+        self.writer.resume_writing()
+
+    def connection_lost(self, exc):
+        self.writer.connection_lost(exc)
+
+
+class LineWriter:
+    """Bounded, batching writer of JSON lines to Neovim over an asyncio transport.
+
+    Lines written during one loop tick go out as a single transport write,
+    so a slow reader never blocks the event loop. While the transport buffer
+    is above high_water, writing pauses and lines wait in a queue of at most
+    max_pending entries. When that queue is full the overflow policy decides:
+
+        drop_oldest  discard the oldest queued line
+        drop_newest  discard the line being written
+        wait         keep queueing; send() waits until there is room
+
+    The protocol owning the transport must forward pause_writing(),
+    resume_writing() and connection_lost() to the writer.
+
+    write_times records how long each batch waited before it was handed to
+    the transport (pipe write time, including time spent paused).
+    """
+
+    def __init__(self, max_pending: int = 1024, overflow: str = 'drop_oldest', high_water: int = 64 * 1024):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.max_pending = max_pending
+        self.overflow = overflow
+        self.high_water = high_water
+        self.queue = deque()
+        self.dropped = 0
+        self.write_times = LatencyHistogram()
+        self.queued_at = 0.0  # loop time the oldest queued line was written
+        self.paused = True  # until attached
+        self.closed = False
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.transport = None
+        self._writable: Optional[asyncio.Event] = None  # created on the running loop in attach()
+        self._flush_scheduled = False
+        self._lost = None
+
+    def attach(self, transport):
+        """Start writing to transport; lines written before this are flushed now"""
+        self.loop = asyncio.get_running_loop()
+        self._writable = asyncio.Event()
+        self._lost = self.loop.create_future()
+        self.queued_at = self.loop.time()
+        self.transport = transport
+        if transport is not None:
+            transport.set_write_buffer_limits(high=self.high_water)
+        self.resume_writing()
+
+    def write(self, line: str) -> bool:
+        """Queue one line (without trailing newline). Returns False if dropped."""
+        if self.closed:
+            return False
+        if len(self.queue) >= self.max_pending:
+            if self.overflow == 'drop_newest':
+                self.dropped += 1
+                return False
+            if self.overflow == 'drop_oldest':
+                self.queue.popleft()
+                self.dropped += 1
+        if not self.queue and self.loop is not None:
+            self.queued_at = self.loop.time()
+        self.queue.append(line)
+        self._schedule_flush()
+        return True
+
+    def write_json(self, data) -> bool:
+        """Queue one event as compact single-line JSON"""
+        return self.write(json_dumps(data))
+
+    async def send(self, line: str) -> bool:
+        """Like write(), but waits for room when the policy is 'wait'"""
+        while self.overflow == 'wait' and len(self.queue) >= self.max_pending and not self.closed:
+            await self.drain()
+        return self.write(line)
+
+    async def send_json(self, data) -> bool:
+        """Like write_json(), but waits for room when the policy is 'wait'"""
+        return await self.send(json_dumps(data))
+
+    async def drain(self):
+        """Wait until the transport accepts writes again"""
+        await self._writable.wait()
+
+    async def close(self):
+        """Flush everything still queued and close the transport"""
+        if self.loop is None or self.closed:
+            self.closed = True
+            return
+
+        # Hand over the rest even if the transport is above high water
+        self.paused = False
+        self._flush()
+        if self.transport is not None and not self.closed:
+            self.transport.close()
+            await self._lost
+        self.closed = True
+
+    @property
+    def pending(self) -> int:
+        """Lines queued but not yet handed to the transport"""
+        return len(self.queue)
+
+    def pause_writing(self):
+        self.paused = True
+        if self._writable is not None:
+            self._writable.clear()
+
+    def resume_writing(self):
+        self.paused = False
+        self._flush()
+        if not self.paused and self._writable is not None:
+            self._writable.set()
+
+    def connection_lost(self, exc):
+        # Neovim went away: nothing more can be delivered
+        self.closed = True
+        self.paused = False
+        self.queue.clear()
+        if self._writable is not None:
+            self._writable.set()
+        if self._lost is not None and not self._lost.done():
+            self._lost.set_result(exc)
+
+    def _schedule_flush(self):
+        if not self._flush_scheduled and self.loop is not None and not self.paused:
+            self._flush_scheduled = True
+            self.loop.call_soon(self._flush)
+
+    def _flush(self):
+        self._flush_scheduled = False
+        if self.paused or self.closed or not self.queue:
+            return
+
+        data = ('\n'.join(self.queue) + '\n').encode('utf-8')
+        self.queue.clear()
+        self._write_data(data)
+        self.write_times.record((self.loop.time() - self.queued_at) * 1000)
+
+    def _write_data(self, data: bytes):
+        self.transport.write(data)
+
+
+class StdoutWriter(LineWriter):
+    """LineWriter for the stdout pipe of a bridge started by Neovim.
+
+    If stdout cannot be wrapped in a pipe transport (regular file, event loop
+    without pipe support) writes fall back to a worker thread with the same
+    pause/resume behaviour.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._thread_write = None
+
+    async def start(self):
+        """Attach to stdout; lines written before this are flushed now"""
+        loop = asyncio.get_running_loop()
+        self.loop = loop
+        sys.stdout.flush()
+        try:
+            pipe = os.fdopen(sys.stdout.fileno(), 'wb', buffering=0, closefd=False)
+            transport, _ = await loop.connect_write_pipe(lambda: _PipeProtocol(self), pipe)
+        except (NotImplementedError, ValueError, OSError, AttributeError):
+            transport = None
+        self.attach(transport)
+
+    async def close(self):
+        """Flush everything still queued and release stdout"""
+        while self._thread_write is not None:
+            await self._thread_write
+        if self.transport is None and self.loop is not None and not self.closed:
+            self.paused = False
+            self._flush()
+            while self._thread_write is not None:
+                await self._thread_write
+        await super().close()
+
+    def _write_data(self, data: bytes):
+        if self.transport is not None:
+            self.transport.write(data)
+            return
+
+        self.pause_writing()
+        self._thread_write = self.loop.run_in_executor(None, self._blocking_write, data)
+        self._thread_write.add_done_callback(self._thread_write_done)
+
+    @staticmethod
+    def _blocking_write(data: bytes):
+        out = getattr(sys.stdout, 'buffer', sys.stdout)
+        out.write(data)
+        out.flush()
+
+    def _thread_write_done(self, future):
+        self._thread_write = None
+        if future.cancelled() or future.exception() is not None:
+            self.connection_lost(None if future.cancelled() else future.exception())
+        else:
+            self.resume_writing()
+
+
+# Lua Neovim runs for every batch of events delivered over RPC
+NVIM_RECEIVE_LUA = 'require("subjoyer.daemon").receive(...)'
+
+
+class _NvimProtocol(_PipeProtocol):
+    """Flow control of the RPC socket, plus the error events Neovim sends back"""
+
+    def __init__(self, writer: 'NvimRpcWriter'):
+        super().__init__(writer)
+        self.unpacker = msgpack.Unpacker(raw=False)
+
+    def data_received(self, data: bytes):
+        # Notifications get no response; a failed one comes back as [2, "nvim_error_event", [type, message]]
+        self.unpacker.feed(data)
+        for message in self.unpacker:
+            if isinstance(message, list) and len(message) == 3 and message[1] == 'nvim_error_event':
+                self.writer.rpc_errors += 1
+                log.error("Neovim rejected an event batch: %s", message[2])
+
+
+class NvimRpcWriter(StdoutWriter):
+    """Writer that calls into Neovim over its RPC socket instead of writing stdout.
+
+    address is Neovim's v:servername (a Unix socket path, or host:port).
+    The events written during one loop tick are sent as a single msgpack-RPC
+    notification, nvim_exec_lua(NVIM_RECEIVE_LUA, [events]), so Neovim gets
+    Lua tables without splitting or decoding lines on its main thread.
+    Events must arrive through write_json() (takes_objects tells callers):
+    nothing on this path is serialized as JSON. Without msgpack, or if the
+    socket cannot be reached, this is a plain StdoutWriter.
+    """
+
+    def __init__(self, address: str, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.address = address
+        self.packer = None  # set once connected
+        self.rpc_errors = 0
+
+    @property
+    def takes_objects(self) -> bool:
+        """True if write_json() queues the object itself (no JSON text stage)"""
+        return self.packer is not None
+
+    async def start(self):
+        """Connect to Neovim; falls back to stdout if that is not possible"""
+        if msgpack is None:
+            log.error("msgpack is not installed; sending events on stdout")
+            await super().start()
+            return
+
+        loop = asyncio.get_running_loop()
+        self.loop = loop
+        try:
+            if os.path.exists(self.address) or ':' not in self.address:
+                transport, _ = await loop.create_unix_connection(lambda: _NvimProtocol(self), self.address)
+            else:
+                host, port = self.address.rsplit(':', 1)
+                transport, _ = await loop.create_connection(lambda: _NvimProtocol(self), host, int(port))
+        except (NotImplementedError, AttributeError, ValueError, OSError) as e:
+            log.error("Cannot connect to Neovim at %s (%s); sending events on stdout", self.address, e)
+            await super().start()
+            return
+
+        self.packer = msgpack.Packer()
+        self.attach(transport)
+
+    def write(self, line: str) -> bool:
+        if self.packer is None:
+            return super().write(line)
+        # A caller that did not check takes_objects; decoding here would undo the point of RPC
+        log.error("Dropping a serialized event sent over RPC: %.80s", line)
+        return False
+
+    def write_json(self, data) -> bool:
+        if self.packer is None:
+            return super().write_json(data)
+        return LineWriter.write(self, data)
+
+    async def send_json(self, data) -> bool:
+        if self.packer is None:
+            return await super().send_json(data)
+        while self.overflow == 'wait' and len(self.queue) >= self.max_pending and not self.closed:
+            await self.drain()
+        return LineWriter.write(self, data)
+
+    def _flush(self):
+        if self.packer is None:
+            super()._flush()
+            return
+
+        self._flush_scheduled = False
+        if self.paused or self.closed or not self.queue:
+            return
+
+        events = list(self.queue)
+        self.queue.clear()
+        self._write_data(self.packer.pack([2, 'nvim_exec_lua', [NVIM_RECEIVE_LUA, [events]]]))
+        self.write_times.record((self.loop.time() - self.queued_at) * 1000)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+subjoyer.nvim - Display filter
+The display config Neovim sends with display-config (tracks, trim, the
+max text length of each display provider), applied to subtitles before
+they reach Neovim so the Lua side only renders.
+
+Used by ws_client.py (subtitles and history), ws_server_8766.py (look-ahead
+cues) and subjoyer_daemon.py (per attached Neovim). Standard library only,
+so the asbplayer bridge does not pull in the relay to use it.
+"""
+
+from typing import Optional
+
+
+def track_of(line: dict) -> int:
+    """Track number of a subtitle line (same precedence as the Lua side)"""
+    track = line.get('track_num')
+    if track is None:
+        track = line.get('track', 0)
+    return track
+
+
+class DisplayFilter:
+    """Display config sent by Neovim, applied to subtitles before they are emitted.
+
+    Tracks that are not shown never reach Neovim, text is trimmed, and lines
+    longer than a provider's max length carry a truncated copy for it under
+    "short" (e.g. {"incline": "..."}), so the Lua side only renders.
+    """
+
+    def __init__(self, tracks=0, trim: bool = True, max_lengths: Optional[dict] = None):
+        # 'all' (or anything unrecognized, like the Lua fallback) shows every track
+        if isinstance(tracks, int):
+            self.tracks = frozenset([tracks])
+        elif isinstance(tracks, list):
+            self.tracks = frozenset(tracks)
+        else:
+            self.tracks = None
+        self.trim = trim
+        self.max_lengths = {provider: length for provider, length in (max_lengths or {}).items()
+                            if isinstance(length, int) and length > 0}
+
+    @classmethod
+    def from_command(cls, command: dict) -> 'DisplayFilter':
+        max_lengths = command.get('max_lengths')
+        # vim.json.encode turns an empty table into []
+        if not isinstance(max_lengths, dict):
+            max_lengths = None
+        return cls(command.get('tracks', 0), bool(command.get('trim', True)), max_lengths)
+
+    def prepare(self, data: dict) -> dict:
+        """Return the compact, display-ready form of a subtitle event"""
+        subtitle = data.get('subtitle') or {}
+        lines = subtitle.get('lines') or []
+
+        # Fallback to legacy subtitle.text
+        if not lines and subtitle.get('text'):
+            lines = [{"text": subtitle['text'], "track": 0}]
+
+        shown = []
+        for line in lines:
+            track = track_of(line)
+            if self.tracks is not None and track not in self.tracks:
+                continue
+
+            text = line.get('text') or ''
+            if self.trim:
+                text = text.strip()
+            if not text:
+                continue
+
+            item = {"text": text, "track_num": track}
+            short = {provider: text[:length] + '...'
+                     for provider, length in self.max_lengths.items() if len(text) > length}
+            if short:
+                item["short"] = short
+            shown.append(item)
+
+        video = data.get('video') or {}
+        return {
+            "type": "subtitle",
+            "subtitle": {
+                "text": '\n'.join(item["text"] for item in shown),
+                "lines": shown
+            },
+            "video": {key: video[key] for key in ('currentTime', 'paused', 'playbackRate') if key in video}
+        }
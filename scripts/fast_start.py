@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+subjoyer.nvim - Fast start
+Binds a bridge's listening sockets and tells Neovim the bridge is ready
+before the slow imports (asyncio, websockets, orjson) run, so :SubjoyerStart
+and every reconnect respawn get the ready event in roughly the time it
+takes to start the interpreter.
+
+Run as a script, ws_client.py, ws_server_8766.py and subjoyer_daemon.py call
+early_start() before their other imports. It reads --host/--port straight
+from argv, binds, listens and writes the ready event to stdout. The
+extension can connect right away: connections wait in the listen backlog
+until the WebSocket server takes over the sockets from claim(). If anything
+is off (bad host or port, port in use, --help) nothing is announced and the
+bridge binds and reports errors the usual way.
+
+Only the host and port are read here, by exact option name: the parsers
+are built with allow_abbrev=False, so an option argparse accepts is one
+option() sees. Whatever fails after the announcement (argparse, through
+parse_args(), or a missing websockets import) is reported with abandon()
+as the server's error event, so Neovim does not wait on a bridge that is
+gone.
+
+Only the standard library modules the interpreter loads anyway, plus json.
+
+Measured with bench_startup.py.
+"""
+
+import os
+import socket
+import sys
+
+# Pre-bound sockets by (host, port), waiting for the WebSocket server
+_bound = {}
+
+# Error events sent in place of the ready events from abandon()
+_errors = {}
+
+# Arguments after which a bridge serves no sockets, or runs elsewhere
+NO_EARLY_START = ('-h', '--help', '--replay', '--persistent', '--nvim')
+
+# Error event type of each ready event type
+ERROR_TYPES = {'server_ready': 'server_error', 'asbplayer_server_ready': 'asbplayer_server_error'}
+
+
+def relay_ready(host: str, port: int) -> dict:
+    """Ready event of the subtitle relay (ws_client.py)"""
+    return {"type": "server_ready", "host": host, "port": port}
+
+
+def asbplayer_ready(host: str, port: int) -> dict:
+    """Ready event of the asbplayer bridge (ws_server_8766.py)"""
+    return {"type": "asbplayer_server_ready", "url": f"ws://{host}:{port}/ws"}
+
+
+def option(name: str, default=None):
+    """Value of --name VALUE or --name=VALUE in argv (the last one wins, as with argparse).
+
+    Abbreviations are not matched; parsers of early-started bridges reject them too.
+    """
+    value = default
+    args = sys.argv[1:]
+    for i, arg in enumerate(args):
+        if arg == name and i + 1 < len(args):
+            value = args[i + 1]
+        elif arg.startswith(name + '='):
+            value = arg[len(name) + 1:]
+    return value
+
+
+def bind_sockets(host: str, port: int) -> list:
+    """Listening sockets for every address of host, as loop.create_server() would bind them"""
+    infos = socket.getaddrinfo(host, port, socket.AF_UNSPEC, socket.SOCK_STREAM, 0, socket.AI_PASSIVE)
+    sockets = []
+    try:
+        for family, kind, proto, _, address in dict.fromkeys(infos):
+            sock = socket.socket(family, kind, proto)
+            sockets.append(sock)
+            if os.name == 'posix' and sys.platform != 'cygwin':
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if family == socket.AF_INET6 and hasattr(socket, 'IPPROTO_IPV6'):
+                sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 1)
+            sock.bind(address)
+            sock.listen(100)
+            sock.setblocking(False)
+    except OSError:
+        for sock in sockets:
+            sock.close()
+        raise
+    return sockets
+
+
+def early_start(ready, host_option: str, default_host: str, port_option: str, default_port: int,
+                channel=None) -> bool:
+    """Bind and announce one server from argv; returns False (and does nothing) if it cannot"""
+    if any(arg in NO_EARLY_START or arg.split('=', 1)[0] in NO_EARLY_START for arg in sys.argv[1:]):
+        return False
+    host = option(host_option, default_host)
+    try:
+        port = int(option(port_option, default_port))
+        sockets = bind_sockets(host, port)
+    except (ValueError, OSError):
+        return False  # reported by the normal start path
+
+    _bound[(host, port)] = sockets
+    event = ready(host, port)
+    error = {"type": ERROR_TYPES[event['type']]}
+    if channel is not None:
+        event = dict(event, channel=channel)
+        error["channel"] = channel
+    _errors[(host, port)] = error
+    _write_event(event)
+    return True
+
+
+def claim(host: str, port: int):
+    """Sockets early_start() bound and announced for host:port, or None"""
+    _errors.pop((host, port), None)
+    return _bound.pop((host, port), None)
+
+
+def abandon(error: str):
+    """Take back every announcement not claimed yet: an error event for each, and the sockets closed"""
+    for key, event in list(_errors.items()):
+        _write_event(dict(event, error=error))
+        for sock in _bound.pop(key, ()):
+            sock.close()
+    _errors.clear()
+
+
+def parse_args(parser):
+    """parser.parse_args(), with its errors (and later parser.error() calls) also abandoning"""
+    exit_with_usage = parser.error
+
+    def error(message):
+        abandon(message)
+        exit_with_usage(message)
+
+    parser.error = error
+    return parser.parse_args()
+
+
+def _write_event(event: dict):
+    import json
+    os.write(sys.stdout.fileno(), (json.dumps(event, ensure_ascii=False) + '\n').encode('utf-8'))
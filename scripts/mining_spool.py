@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+subjoyer.nvim - Mining spool
+Durable queue of mine-subtitle commands that asbplayer has not acknowledged
+yet, so cards mined while asbplayer is disconnected (or while its tab
+reloads) are sent once it is back.
+
+The spool is a JSON-lines journal: {"add": ID, "command": {...}} when a
+command is spooled, {"done": ID} once asbplayer answered it (an error
+answer is final too). A card that reached asbplayer but was never answered may or may not
+be in Anki, so it is marked {"unknown": ID} and not sent again until the
+user says so ({"retry": ID}). Adds are fsynced (in a worker thread) before
+Neovim is told the card is spooled. The journal is rewritten with only the
+open entries when it is loaded, and emptied whenever nothing is left.
+
+Used by ws_server_8766.py (--spool).
+"""
+
+import asyncio
+import json
+import os
+from collections import OrderedDict
+from typing import List, Set
+
+
+class MiningSpool:
+    """Open mine-subtitle commands by messageId, in the order they were mined"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: 'OrderedDict[str, dict]' = OrderedDict()
+        self.unknown: Set[str] = set()  # sent but never answered; held until the user decides
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.load()
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, message_id) -> bool:
+        return message_id in self.entries
+
+    def load(self):
+        """Replay the journal, then rewrite it with the open entries only"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # line cut off by a crash
+                if 'add' in record:
+                    self.entries[record['add']] = record.get('command') or {}
+                elif 'done' in record:
+                    self.entries.pop(record['done'], None)
+                    self.unknown.discard(record['done'])
+                elif 'unknown' in record:
+                    if record['unknown'] in self.entries:
+                        self.unknown.add(record['unknown'])
+                elif 'retry' in record:
+                    self.unknown.discard(record['retry'])
+
+        temp = self.path + '.tmp'
+        with open(temp, 'w', encoding='utf-8') as f:
+            for message_id, command in self.entries.items():
+                f.write(json.dumps({"add": message_id, "command": command}, ensure_ascii=False) + '\n')
+            for message_id in self.unknown:
+                f.write(json.dumps({"unknown": message_id}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, self.path)
+
+    async def add(self, message_id: str, command: dict):
+        """Spool a command; it is on disk when this returns.
+
+        The fsync runs in a worker thread so the event loop keeps relaying
+        subtitles meanwhile.
+        """
+        self.entries[message_id] = command
+        self.append({"add": message_id, "command": command})
+        await asyncio.get_running_loop().run_in_executor(None, os.fsync, self.file.fileno())
+
+    def done(self, message_id: str):
+        """Drop a command asbplayer acknowledged (or the user discarded)"""
+        if self.entries.pop(message_id, None) is None:
+            return
+        self.unknown.discard(message_id)
+        if self.entries:
+            self.append({"done": message_id})
+        else:
+            self.file.truncate(0)
+            self.file.flush()
+
+    def mark_unknown(self, message_id: str):
+        """Hold a card whose send reached asbplayer without an answer; it may already be in Anki"""
+        if message_id in self.entries and message_id not in self.unknown:
+            self.unknown.add(message_id)
+            self.append({"unknown": message_id})
+
+    def retry(self, message_id: str):
+        """Let an unknown card be sent again (the user checked it is not in Anki)"""
+        if message_id in self.unknown:
+            self.unknown.discard(message_id)
+            self.append({"retry": message_id})
+
+    def unknown_commands(self) -> List[dict]:
+        """Commands held as unknown, in the order they were mined"""
+        return [dict(command, messageId=message_id) for message_id, command in self.entries.items()
+                if message_id in self.unknown]
+
+    def batch(self, size: int, skip) -> List[dict]:
+        """The oldest size commands whose messageId is neither in skip nor unknown"""
+        commands = []
+        for message_id, command in self.entries.items():
+            if len(commands) >= size:
+                break
+            if message_id not in skip and message_id not in self.unknown:
+                commands.append(dict(command, messageId=message_id))
+        return commands
+
+    def append(self, record: dict):
+        self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
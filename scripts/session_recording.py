@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+subjoyer.nvim - Session recordings
+Append-only recordings of the frames the relay receives from the extension,
+for offline review and reproducible load without a browser.
+
+A recording starts with the magic b'SJR1'; each frame is a 12-byte header
+    <u32 payload length> <u32 receive time, ms> <i32 video time, ms or -1>
+followed by the raw frame as UTF-8. Receive times count from the first
+recorded frame and keep counting when a recording is appended to later.
+
+A sidecar PATH.idx (magic b'SJI1', then <i32 video ms> <u64 offset> pairs)
+is a sparse seek index: an entry every SEEK_INTERVAL_MS of video time and
+at every jump. It is only an accelerator: a missing index is rebuilt by
+scanning the headers, and one cut short by a crash is extended by scanning
+the frames after its last entry.
+
+Used by ws_client.py (--record, --replay).
+"""
+
+import os
+import re
+import struct
+import time
+from typing import Iterator, List, Optional, Tuple
+
+MAGIC = b'SJR1'
+INDEX_MAGIC = b'SJI1'
+HEADER = struct.Struct('<IIi')
+INDEX_ENTRY = struct.Struct('<iQ')
+
+# Video time between seek index entries
+SEEK_INTERVAL_MS = 10000
+
+# Longest a recorded frame may sit in the file buffer
+FLUSH_INTERVAL = 1.0  # seconds
+
+# Video time of a raw frame without decoding it
+CURRENT_TIME_PATTERN = re.compile(r'"currentTime"\s*:\s*(-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)')
+
+Frame = Tuple[int, int, str]  # receive ms, video ms (-1 = unknown), raw frame
+
+
+def video_time_of(message: str) -> int:
+    """Video time of a frame in ms, or -1"""
+    match = CURRENT_TIME_PATTERN.search(message)
+    return round(float(match.group(1)) * 1000) if match else -1
+
+
+def read_headers(f, start: int = len(MAGIC)) -> Iterator[Tuple[int, int, int, int]]:
+    """(offset, length, receive ms, video ms) of every complete frame from start (a frame offset)"""
+    f.seek(start)
+    offset = start
+    size = os.fstat(f.fileno()).st_size
+    while offset + HEADER.size <= size:
+        length, received, video = HEADER.unpack(f.read(HEADER.size))
+        if offset + HEADER.size + length > size:
+            break  # frame cut off by a crash
+        yield offset, length, received, video
+        offset += HEADER.size + length
+        f.seek(offset)
+
+
+class SessionRecorder:
+    """Appends received frames to a recording and its seek index"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.base_ms = 0
+        self.end = len(MAGIC)  # offset after the last complete frame
+        self.last_indexed: Optional[int] = None
+        self.last_video = -1
+        self.frames = 0
+
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, 'rb') as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    raise ValueError(f"{path} is not a subjoyer recording")
+                for offset, length, received, video in read_headers(f):
+                    self.end = offset + HEADER.size + length
+                    self.base_ms = received
+            # Drop a frame cut off by a crash, then append after the last good one
+            with open(path, 'r+b') as f:
+                f.truncate(self.end)
+            self.file = open(path, 'ab')
+        else:
+            self.file = open(path, 'wb')
+            self.file.write(MAGIC)
+
+        index_path = path + '.idx'
+        if os.path.exists(index_path) and os.path.getsize(index_path) > 0:
+            self.index = open(index_path, 'ab')
+        else:
+            self.index = open(index_path, 'wb')
+            self.index.write(INDEX_MAGIC)
+        self.started = time.monotonic()
+        self.last_flush = self.started
+
+    def write(self, message: str):
+        """Append one raw frame as received now"""
+        now = time.monotonic()
+        payload = message.encode('utf-8')
+        video = video_time_of(message)
+        received = self.base_ms + int((now - self.started) * 1000)
+
+        if video >= 0 and (self.last_indexed is None or abs(video - self.last_indexed) >= SEEK_INTERVAL_MS
+                           or abs(video - self.last_video) >= SEEK_INTERVAL_MS):
+            self.index.write(INDEX_ENTRY.pack(video, self.end))
+            self.last_indexed = video
+        if video >= 0:
+            self.last_video = video
+
+        self.file.write(HEADER.pack(len(payload), received, video))
+        self.file.write(payload)
+        self.end += HEADER.size + len(payload)
+        self.frames += 1
+
+        if now - self.last_flush >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        self.file.flush()
+        self.index.flush()
+
+    def close(self):
+        self.file.close()
+        self.index.close()
+
+
+class SessionRecording:
+    """A recording opened for replay"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, 'rb')
+        if self.file.read(len(MAGIC)) != MAGIC:
+            self.file.close()
+            raise ValueError(f"{path} is not a subjoyer recording")
+        self.seek_points = self.load_index()
+
+    def load_index(self) -> List[Tuple[int, int]]:
+        """(video ms, offset) seek points in file order.
+
+        The frames after the last index entry are scanned for the points a
+        crash kept out of the index; without a usable index (missing, or
+        written past the data) every header is scanned.
+        """
+        points = []
+        try:
+            with open(self.path + '.idx', 'rb') as f:
+                if f.read(len(INDEX_MAGIC)) == INDEX_MAGIC:
+                    data = f.read()
+                    usable = len(data) - len(data) % INDEX_ENTRY.size
+                    points = list(INDEX_ENTRY.iter_unpack(data[:usable]))
+        except OSError:
+            pass
+
+        size = os.fstat(self.file.fileno()).st_size
+        if points and points[-1][1] < size:
+            last_video, start = points[-1]
+        else:
+            points, last_video, start = [], None, len(MAGIC)
+
+        for offset, _, _, video in read_headers(self.file, start):
+            if offset == start and points:
+                continue  # the last index entry itself
+            if video >= 0 and (last_video is None or abs(video - last_video) >= SEEK_INTERVAL_MS):
+                points.append((video, offset))
+                last_video = video
+        return points
+
+    def offset_for(self, video_ms: int) -> int:
+        """Offset to scan from for the first frame at or after video_ms.
+
+        Video time jumps with seeks, so the seek points are not sorted; the
+        latest seek point at or before video_ms (by video time) is used.
+        """
+        best = None
+        for video, offset in self.seek_points:
+            if video <= video_ms and (best is None or video > best[0]):
+                best = (video, offset)
+        return best[1] if best is not None else len(MAGIC)
+
+    def frames(self, seek_ms: Optional[int] = None) -> Iterator[Frame]:
+        """Recorded frames in order, starting at the first one at or after seek_ms video time"""
+        start = len(MAGIC) if seek_ms is None else self.offset_for(seek_ms)
+        found = seek_ms is None
+        self.file.seek(start)
+        while True:
+            header = self.file.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return
+            length, received, video = HEADER.unpack(header)
+            payload = self.file.read(length)
+            if len(payload) < length:
+                return
+            if not found:
+                if video < seek_ms:
+                    continue
+                found = True
+            yield received, video, payload.decode('utf-8', errors='replace')
+
+    def close(self):
+        self.file.close()
+
@@ -0,0 +1,561 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+subjoyer.nvim - Bridge daemon
+Runs the subtitle relay (ws_client.py) and the asbplayer bridge
+(ws_server_8766.py) on one event loop in a single process.
+
+Both share one stdin/stdout channel with Neovim. Every line written to
+stdout carries a "channel" field ("subtitle" or "asbplayer"); lines read
+from stdin are routed by their "channel" field (default: "asbplayer").
+
+With --nvim ADDRESS (Neovim's v:servername) events are not written to stdout
+but delivered into Neovim over its RPC socket: each loop tick's events go
+out as one msgpack-RPC call of subjoyer.daemon.receive() (see
+bridge_io.NvimRpcWriter). Commands still arrive on stdin.
+
+With --persistent the daemon instead listens on a Unix domain socket and
+outlives Neovim: the browser connections stay open, and a Neovim can attach
+to the socket (same line protocol as stdin/stdout) or detach at any time.
+Any number of Neovims can be attached at once; each gets every line, with
+its own bounded queue so a stalled one never delays the others. Attaching
+replays the current state right away. {"channel": "daemon",
+"command": "shutdown"} stops the daemon. Each attached Neovim has its own
+display config: the relay sends every subtitle as received, and the
+attachment applies the config its Neovim sent (tracks, trim, truncation)
+before queueing it. History, search and next-cues answers use the config
+of the Neovim that asked.
+
+Subtitles are scheduled on the video clock as in ws_client.py; the cues of
+the files asbplayer loaded give the relay the end of each subtitle, so it
+can hide them on time.
+
+Both bridges log to the same in-memory buffer (--log-level, default off), so
+the log command of either channel returns the entries of the whole process.
+
+Requirements:
+    pip install websockets
+    pip install msgpack  (optional, for --nvim)
+
+Usage:
+    python subjoyer_daemon.py [--host HOST] [--port PORT] [--passthrough] [--liveness-timeout SECS]
+                              [--stats-interval SECS] [--history-size N] [--schedule-delay MS] [--record PATH]
+                              [--asbplayer-host HOST] [--asbplayer-port PORT] [--no-asbplayer]
+                              [--max-in-flight N] [--command-timeout SECS] [--spool PATH]
+                              [--log-level LEVEL] [--nvim ADDRESS | --persistent --socket PATH [--log-file PATH]]
+"""
+
+if __name__ == "__main__":
+    # Bind and announce both servers before the slow imports below (see fast_start.py)
+    import sys
+    import fast_start
+    fast_start.early_start(fast_start.relay_ready, '--host', 'localhost', '--port', 8767, channel='subtitle')
+    if '--no-asbplayer' not in sys.argv:
+        fast_start.early_start(fast_start.asbplayer_ready, '--asbplayer-host', '127.0.0.1', '--asbplayer-port', 8766,
+                               channel='asbplayer')
+
+import asyncio
+import json
+import os
+import socket
+import sys
+import argparse
+from typing import List, Optional
+
+import fast_start
+from bridge_io import (LOG, LOG_LEVELS, LineWriter, Logger, NvimRpcWriter, StdoutWriter, force_utf8_stdio, json_dumps,
+                       json_loads, open_stdin_reader)
+from display_filter import DisplayFilter
+from mining_spool import MiningSpool
+from session_recording import SessionRecorder
+from subtitle_history import HISTORY_SIZE
+from ws_client import (SCHEDULE_DELAY_MS, TRACK_PATTERN, SubtitleCoalescer, SubtitleWebSocketServer,
+                       sniff_frame)
+from ws_server_8766 import AsbplayerWebSocketServer
+
+force_utf8_stdio()
+
+log = Logger('daemon')
+
+# Attachments whose output waits at least this long report their lag
+LAG_REPORT_THRESHOLD = 0.1  # seconds
+
+
+class ChannelWriter:
+    """View of a shared StdoutWriter that tags every line (or event object, over RPC) with a channel"""
+
+    def __init__(self, writer: StdoutWriter, channel: str):
+        self.writer = writer
+        self.channel = channel
+        self.prefix = '{"channel":' + json.dumps(channel) + ','
+
+    def tag(self, line: str) -> str:
+        # Splice the field into the serialized object instead of re-encoding it
+        rest = line[1:]
+        if rest.lstrip().startswith('}'):
+            return self.prefix[:-1] + rest
+        return self.prefix + rest
+
+    async def start(self):
+        if self.writer.loop is None:
+            await self.writer.start()
+
+    def write(self, line: str) -> bool:
+        return self.writer.write(self.tag(line))
+
+    def write_json(self, data) -> bool:
+        if self.takes_objects:
+            return self.writer.write_json(dict(data, channel=self.channel))
+        return self.write(json_dumps(data))
+
+    @property
+    def takes_objects(self) -> bool:
+        return getattr(self.writer, 'takes_objects', False)
+
+    async def send(self, line: str) -> bool:
+        return await self.writer.send(self.tag(line))
+
+    async def send_json(self, data) -> bool:
+        if self.takes_objects:
+            return await self.writer.send_json(dict(data, channel=self.channel))
+        return await self.send(json_dumps(data))
+
+    async def drain(self):
+        await self.writer.drain()
+
+    async def close(self):
+        # The shared writer is closed by the daemon
+        pass
+
+    @property
+    def dropped(self) -> int:
+        return self.writer.dropped
+
+    @property
+    def pending(self) -> int:
+        return self.writer.pending
+
+    @property
+    def write_times(self):
+        # Per-attachment writers in persistent mode have no shared histogram
+        return getattr(self.writer, 'write_times', None)
+
+
+class Attachment(asyncio.Protocol):
+    """One Neovim attached to a persistent daemon over its Unix socket.
+
+    Each attachment has its own output stage: lines wait in a bounded
+    SubtitleCoalescer until this Neovim's socket has room, so a slow
+    subscriber only ever receives the newest subtitle and never holds up
+    the others. Subtitles are rendered with this Neovim's display config
+    on the way in, and held back until that config has arrived.
+    """
+
+    def __init__(self, daemon: 'SubjoyerDaemon', max_pending: int = 1024):
+        self.daemon = daemon
+        self.output = SubtitleCoalescer(max_pending=max_pending)
+        self.writer = LineWriter(max_pending=max_pending)
+        self.buffer = bytearray()
+        self.scanned = 0  # bytes of buffer already searched for a newline
+        self.pump_task: Optional[asyncio.Task] = None
+        self.pending_since = 0.0  # loop time the oldest pending line arrived
+        self.lag = 0.0  # how long the last delivered batch waited
+        self.lagging = False
+        self.delivered = 0
+        self.reported_dropped = 0
+        self.display: Optional[DisplayFilter] = None  # set by this Neovim's display-config
+        self.last_subtitle: Optional[str] = None  # last rendered subtitle line queued
+
+    def connection_made(self, transport):
+        self.writer.attach(transport)
+        self.pump_task = self.writer.loop.create_task(self.pump())
+        self.daemon.attach(self)
+
+    def push(self, line: str):
+        """Queue a line for this Neovim; stale subtitles are replaced, not queued"""
+        msg_type = sniff_frame(line)
+        if msg_type == 'subtitle':
+            if self.display is None:
+                # Raw until this Neovim's display-config arrives; set_display() sends the current one
+                return
+            line = self.render(line)
+            # Changes on tracks this Neovim does not show render the same
+            if line == self.last_subtitle:
+                return
+            self.last_subtitle = line
+        tracks = TRACK_PATTERN.findall(line) if msg_type == 'subtitle' else ()
+        if not self.output.pending:
+            self.pending_since = self.writer.loop.time()
+        self.output.push(SubtitleCoalescer.key_for(msg_type, tracks), line)
+
+    def render(self, line: str) -> str:
+        """A subtitle line as the relay sends it, in this Neovim's display config"""
+        data = json_loads(line)
+        data.pop('channel', None)
+        return json_dumps(dict({"channel": "subtitle"}, **self.display.prepare(data)))
+
+    def set_display(self, display: DisplayFilter, current: Optional[str]):
+        """Apply a display-config and re-render the current subtitle with it"""
+        self.display = display
+        self.last_subtitle = None
+        if current is not None:
+            self.push(current)
+
+    async def pump(self):
+        """Move pending lines to the socket whenever it has room"""
+        while True:
+            await self.output.has_pending.wait()
+            await self.writer.drain()
+            if self.writer.closed:
+                return
+
+            self.lag = self.writer.loop.time() - self.pending_since
+            lines = self.output.take()
+            self.delivered += len(lines)
+            for line in lines:
+                self.writer.write(line)
+
+            # Report drops, and lag while it is noticeable (plus once when it recovers)
+            lagging = self.lag >= LAG_REPORT_THRESHOLD
+            if self.dropped != self.reported_dropped or lagging or self.lagging:
+                self.write_stats()
+            self.lagging = lagging
+
+    def write_stats(self):
+        """Send this Neovim its relay_stats: own drops and lag, plus subscriber count"""
+        self.reported_dropped = self.dropped
+        self.writer.write_json({
+            "channel": "subtitle",
+            "type": "relay_stats",
+            "dropped": self.dropped,
+            "forwarded": self.delivered,
+            "subscribers": len(self.daemon.writer.attachments),
+            "lag_ms": round(self.lag * 1000)
+        })
+
+    @property
+    def dropped(self) -> int:
+        # Stale subtitles this Neovim skipped, here or already in the relay
+        return self.output.dropped + self.writer.dropped + self.daemon.relay.coalesced
+
+    async def close(self):
+        """Hand over what is still pending and close the socket"""
+        if self.pump_task is not None:
+            self.pump_task.cancel()
+        for line in self.output.take():
+            self.writer.write(line)
+        await self.writer.close()
+
+    def data_received(self, data: bytes):
+        self.buffer.extend(data)
+        while True:
+            end = self.buffer.find(b'\n', self.scanned)
+            if end < 0:
+                self.scanned = len(self.buffer)
+                return
+            line = bytes(self.buffer[:end])
+            del self.buffer[:end + 1]
+            self.scanned = 0
+            self.daemon.commands.put_nowait((self, line))
+
+    def pause_writing(self):
+        self.writer.pause_writing()
+
+    def resume_writing(self):
+        self.writer.resume_writing()
+
+    def connection_lost(self, exc):
+        self.writer.connection_lost(exc)
+        if self.pump_task is not None:
+            self.pump_task.cancel()
+        self.daemon.detach(self)
+
+
+class AttachmentHub:
+    """Writer front of a persistent daemon: fans every line out to all attached Neovims.
+
+    Writes never wait: each attachment paces itself, so the relay and the
+    asbplayer bridge are never held up by a slow subscriber.
+    """
+
+    def __init__(self):
+        self.attachments: List[Attachment] = []
+        self.replay_target: Optional[Attachment] = None  # set while replaying state to a new attachment
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+
+    def write(self, line: str) -> bool:
+        if self.replay_target is not None:
+            self.replay_target.push(line)
+            return True
+        for attachment in self.attachments:
+            attachment.push(line)
+        return bool(self.attachments)
+
+    async def send(self, line: str) -> bool:
+        return self.write(line)
+
+    async def drain(self):
+        pass
+
+    async def close(self):
+        for attachment in list(self.attachments):
+            await attachment.close()
+
+    def broadcast_stats(self):
+        for attachment in self.attachments:
+            attachment.write_stats()
+
+    @property
+    def dropped(self) -> int:
+        # Drops happen per attachment and are reported to each one separately
+        return 0
+
+    @property
+    def pending(self) -> int:
+        return sum(len(attachment.output.pending) for attachment in self.attachments)
+
+
+def claim_socket(path: str) -> bool:
+    """Remove a stale socket file; returns False if a live daemon owns the path"""
+    if not os.path.exists(path):
+        return True
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+        return False
+    except OSError:
+        os.unlink(path)
+        return True
+    finally:
+        probe.close()
+
+
+def detach_stdio(log_path: str):
+    """Point stdio away from the spawning Neovim so the daemon survives it"""
+    null = os.open(os.devnull, os.O_RDONLY)
+    log = os.open(log_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+    os.dup2(null, 0)
+    os.dup2(log, 1)
+    os.dup2(log, 2)
+    os.close(null)
+    os.close(log)
+
+
+class SubjoyerDaemon:
+    def __init__(self, relay: SubtitleWebSocketServer, asbplayer: Optional[AsbplayerWebSocketServer],
+                 writer, socket_path: Optional[str] = None):
+        self.relay = relay
+        self.asbplayer = asbplayer
+        self.writer = writer  # StdoutWriter, or AttachmentHub with socket_path
+        self.socket_path = socket_path
+        self.unix_server = None
+        self.stdin_task = None
+        self.commands_task = None
+        self.commands: Optional[asyncio.Queue] = None
+        self.shutdown: Optional[asyncio.Future] = None
+
+    def attach(self, attachment: Attachment):
+        """A Neovim attached: it joins the fan-out and gets the current state"""
+        hub = self.writer
+        hub.attachments.append(attachment)
+        log.info("Neovim attached (%d subscribed)", len(hub.attachments))
+
+        # Replay goes to the new attachment only
+        hub.replay_target = attachment
+        try:
+            self.relay.replay_state()
+            if self.asbplayer is not None:
+                self.asbplayer.replay_state()
+        finally:
+            hub.replay_target = None
+        hub.broadcast_stats()
+
+    def detach(self, attachment: Attachment):
+        hub = self.writer
+        if attachment in hub.attachments:
+            hub.attachments.remove(attachment)
+            log.info("Neovim detached (%d subscribed)", len(hub.attachments))
+            hub.broadcast_stats()
+
+    async def route_command(self, command: dict, attachment: Optional[Attachment] = None):
+        """Hand a command to the subsystem named by its channel"""
+        channel = command.pop('channel', 'asbplayer')
+        # An attached Neovim's display config stays its own
+        display = attachment.display if attachment is not None else None
+        if channel == 'daemon' and command.get('command') == 'shutdown':
+            if not self.shutdown.done():
+                self.shutdown.set_result(True)
+        elif channel == 'subtitle' and attachment is not None and command.get('command') == 'display-config':
+            attachment.set_display(DisplayFilter.from_command(command),
+                                   None if self.relay.subtitle_ended else self.relay.subtitle_line())
+        elif channel == 'subtitle':
+            self.relay.handle_command(command, display)
+        elif channel == 'asbplayer' and self.asbplayer is not None:
+            await self.asbplayer.dispatch_command(command, display)
+        else:
+            log.warning("No handler for channel %r", channel)
+
+    async def handle_line(self, line: bytes, attachment: Optional[Attachment] = None):
+        """Parse one command line from Neovim (attachment, in persistent mode) and route it"""
+        line = line.strip()
+        if not line:
+            return
+
+        try:
+            command = json_loads(line)
+        except json.JSONDecodeError as e:
+            log.warning("Invalid JSON from Neovim: %s", e)
+            return
+        if not isinstance(command, dict):
+            log.warning("Ignoring non-object command from Neovim: %.80r", line)
+            return
+
+        await self.route_command(command, attachment)
+
+    async def read_commands(self):
+        """Read commands from stdin (Neovim) and route them"""
+        reader = await open_stdin_reader()
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError as e:
+                log.warning("Error reading stdin: %s", e)
+                continue
+
+            if not line:
+                log.info("Stdin EOF")
+                break
+
+            await self.handle_line(line)
+
+    async def process_commands(self):
+        """Route commands received from attached Neovims, in arrival order"""
+        while True:
+            attachment, line = await self.commands.get()
+            await self.handle_line(line, attachment)
+
+    async def run(self) -> bool:
+        """Run both servers until shutdown; returns False if every server failed"""
+        loop = asyncio.get_running_loop()
+        self.shutdown = loop.create_future()
+
+        await self.writer.start()
+        if self.socket_path is None:
+            self.stdin_task = asyncio.create_task(self.read_commands())
+        else:
+            self.commands = asyncio.Queue()
+            self.commands_task = asyncio.create_task(self.process_commands())
+            self.unix_server = await loop.create_unix_server(lambda: Attachment(self), self.socket_path)
+            os.chmod(self.socket_path, 0o600)
+
+        servers = [self.relay.start(standalone=False)]
+        if self.asbplayer is not None:
+            servers.append(self.asbplayer.start(standalone=False))
+
+        # Each start() only returns after its server failed
+        servers = asyncio.gather(*servers)
+        await asyncio.wait([servers, self.shutdown], return_when=asyncio.FIRST_COMPLETED)
+        servers.cancel()
+        try:
+            await servers
+        except asyncio.CancelledError:
+            pass
+
+        if self.unix_server is not None:
+            self.unix_server.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+        await self.writer.close()
+        return self.shutdown.done()
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description='Combined bridge daemon for subjoyer.nvim', allow_abbrev=False)
+    parser.add_argument('--host', default='localhost', help='Subtitle relay host')
+    parser.add_argument('--port', type=int, default=8767, help='Subtitle relay port')
+    parser.add_argument('--passthrough', action='store_true',
+                        help='Forward well-formed frames verbatim instead of re-encoding them')
+    parser.add_argument('--liveness-timeout', type=float, default=15.0,
+                        help='Seconds without frames before the extension is reported stalled')
+    parser.add_argument('--stats-interval', type=float, default=5.0, help='Seconds between stats events (0 = off)')
+    parser.add_argument('--history-size', type=int, default=HISTORY_SIZE,
+                        help='Subtitles kept for history queries (0 = off)')
+    parser.add_argument('--schedule-delay', type=float, default=SCHEDULE_DELAY_MS,
+                        help='Ms after the extension sent a subtitle that it is shown (0 = on arrival)')
+    parser.add_argument('--record', help='Append every frame from the extension to this recording')
+    parser.add_argument('--asbplayer-host', default='127.0.0.1', help='asbplayer bridge host')
+    parser.add_argument('--asbplayer-port', type=int, default=8766, help='asbplayer bridge port')
+    parser.add_argument('--no-asbplayer', action='store_true', help='Run the subtitle relay only')
+    parser.add_argument('--max-in-flight', type=int, default=8, help='Max asbplayer commands awaiting a response')
+    parser.add_argument('--command-timeout', type=float, default=10.0,
+                        help='Seconds before an unanswered asbplayer command times out')
+    parser.add_argument('--spool', help='Journal mine-subtitle commands here until asbplayer acknowledges them')
+    parser.add_argument('--persistent', action='store_true',
+                        help='Outlive Neovim; Neovim attaches through --socket instead of stdin/stdout')
+    parser.add_argument('--socket', help='Unix socket path for --persistent')
+    parser.add_argument('--log-file', default=os.devnull, help='Where a persistent daemon writes its logs')
+    parser.add_argument('--log-level', choices=LOG_LEVELS, default='off', help='Entries kept in the log buffer')
+    parser.add_argument('--nvim', help="Deliver events over this Neovim's RPC socket (v:servername) instead of stdout")
+    args = fast_start.parse_args(parser)
+    LOG.set_level(args.log_level)
+    if args.nvim and args.persistent:
+        parser.error('--nvim cannot be combined with --persistent')
+
+    try:
+        recorder = SessionRecorder(args.record) if args.record else None
+        spool = MiningSpool(os.path.expanduser(args.spool)) if args.spool and not args.no_asbplayer else None
+    except (OSError, ValueError) as e:
+        print(json.dumps({"type": "server_error", "channel": "subtitle", "error": str(e)}), flush=True)
+        sys.exit(1)
+
+    if args.persistent:
+        if not args.socket:
+            parser.error('--persistent requires --socket')
+        if not hasattr(socket, 'AF_UNIX'):
+            parser.error('--persistent needs Unix domain sockets')
+        if not claim_socket(args.socket):
+            print(f"ERROR: A daemon is already listening on {args.socket}", file=sys.stderr, flush=True)
+            sys.exit(1)
+        detach_stdio(args.log_file)
+        writer = AttachmentHub()
+    elif args.nvim:
+        writer = NvimRpcWriter(args.nvim, overflow='wait')
+    else:
+        writer = StdoutWriter(overflow='wait')
+
+    relay = SubtitleWebSocketServer(host=args.host, port=args.port, passthrough=args.passthrough,
+                                    writer=ChannelWriter(writer, 'subtitle'), liveness_timeout=args.liveness_timeout,
+                                    stats_interval=args.stats_interval, history_size=args.history_size,
+                                    recorder=recorder, schedule_delay=args.schedule_delay)
+    asbplayer = None
+    if not args.no_asbplayer:
+        asbplayer = AsbplayerWebSocketServer(host=args.asbplayer_host, port=args.asbplayer_port,
+                                             writer=ChannelWriter(writer, 'asbplayer'), relay=relay,
+                                             stats_interval=args.stats_interval, max_in_flight=args.max_in_flight,
+                                             command_timeout=args.command_timeout, spool=spool)
+
+    if args.persistent:
+        # Each attachment reports its own relay_stats
+        relay.emit_relay_stats = False
+
+    daemon = SubjoyerDaemon(relay, asbplayer, writer, socket_path=args.socket if args.persistent else None)
+
+    try:
+        clean = asyncio.run(daemon.run())
+        sys.exit(0 if clean else 1)
+    except KeyboardInterrupt:
+        shutdown_event = {
+            "type": "server_shutdown",
+            "channel": "subtitle",
+            "reason": "keyboard_interrupt"
+        }
+        print(json.dumps(shutdown_event), flush=True)
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+subjoyer.nvim - Session subtitle history
+Every subtitle the relay receives, keyed by video time (ms) and bounded to a
+fixed number of entries, so Neovim can ask for "the lines from T-30s to
+T+5s" when mining instead of keeping raw payloads itself.
+
+The history is also full-text searchable: an inverted index of character
+bigrams (so Japanese and Chinese need no tokenizer) is updated as entries
+are added and evicted, so it stays as bounded as the history.
+
+Used by ws_client.py.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Default number of subtitles kept for a session (a feature film has ~1500)
+HISTORY_SIZE = 20000
+
+# A subtitle arriving again within this distance of an identical one (pause,
+# seek back, re-render) is the same line, not a new entry
+MERGE_MS = 10000
+
+# Characters per indexed n-gram
+NGRAM = 2
+
+# Share of a query's n-grams an entry must contain to be a search result
+MIN_MATCH = 0.5
+
+Lines = Tuple[Tuple[int, str], ...]  # (track, text) per line
+
+
+def normalize(text: str) -> str:
+    """Case-folded text without whitespace, as indexed and searched"""
+    return ''.join(text.casefold().split())
+
+
+def ngrams(text: str) -> Set[str]:
+    """Character n-grams of normalized text (the text itself if shorter)"""
+    if len(text) <= NGRAM:
+        return {text} if text else set()
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+class SubtitleHistory:
+    """Subtitles by video time; the oldest received are evicted first.
+
+    times is kept sorted for range queries, arrival records the order
+    entries came in for eviction. Video time jumps around with seeks, so
+    the two orders differ. postings maps each n-gram to the times of the
+    entries containing it; searchable holds each entry's normalized text.
+    """
+
+    def __init__(self, max_entries: int = HISTORY_SIZE):
+        self.max_entries = max_entries
+        self.times = array('q')
+        self.lines = {}  # video time ms -> Lines
+        self.arrival = deque()
+        self.postings: Dict[str, Set[int]] = {}
+        self.searchable: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def add(self, time_ms: int, lines: Lines) -> bool:
+        """Record a subtitle shown at time_ms; returns False if it was already known"""
+        if not lines or self.max_entries <= 0:
+            return False
+        if time_ms in self.lines:
+            self.unindex(time_ms)
+            self.lines[time_ms] = lines
+            self.index(time_ms)
+            return True
+
+        i = bisect_right(self.times, time_ms)
+        for j in (i - 1, i):
+            if 0 <= j < len(self.times) and abs(self.times[j] - time_ms) < MERGE_MS \
+                    and self.lines[self.times[j]] == lines:
+                return False
+
+        self.times.insert(i, time_ms)
+        self.lines[time_ms] = lines
+        self.index(time_ms)
+        self.arrival.append(time_ms)
+        while len(self.arrival) > self.max_entries:
+            oldest = self.arrival.popleft()
+            self.unindex(oldest)
+            del self.lines[oldest]
+            del self.times[bisect_left(self.times, oldest)]
+        return True
+
+    def add_event(self, data: dict) -> bool:
+        """Record a subtitle event from the extension (needs video.currentTime)"""
+        video = data.get('video') or {}
+        current_time = video.get('currentTime')
+        if not isinstance(current_time, (int, float)):
+            return False
+        return self.add(round(current_time * 1000), event_lines(data))
+
+    def index(self, time_ms: int):
+        text = normalize(''.join(text for _, text in self.lines[time_ms]))
+        self.searchable[time_ms] = text
+        for gram in ngrams(text):
+            self.postings.setdefault(gram, set()).add(time_ms)
+
+    def unindex(self, time_ms: int):
+        for gram in ngrams(self.searchable.pop(time_ms)):
+            times = self.postings.get(gram)
+            if times is not None:
+                times.discard(time_ms)
+                if not times:
+                    del self.postings[gram]
+
+    def entry(self, time_ms: int, tracks: Optional[frozenset] = None) -> Optional[dict]:
+        """One entry as Neovim receives it, or None if no shown track has text"""
+        shown = [{"text": text, "track_num": track} for track, text in self.lines[time_ms]
+                 if tracks is None or track in tracks]
+        if not shown:
+            return None
+        return {"time": time_ms, "text": '\n'.join(line["text"] for line in shown), "lines": shown}
+
+    def between(self, start: int, end: int, tracks: Optional[frozenset] = None) -> List[dict]:
+        """Entries from start to end (ms, inclusive), oldest video time first"""
+        entries = (self.entry(self.times[i], tracks)
+                   for i in range(bisect_left(self.times, start), bisect_right(self.times, end)))
+        return [entry for entry in entries if entry is not None]
+
+    def search(self, query: str, limit: int = 20, tracks: Optional[frozenset] = None) -> List[dict]:
+        """Entries matching query, best first.
+
+        An entry scores the share of the query's n-grams it contains, plus 1
+        if it contains the whole query; ties go to the earlier video time.
+        """
+        needle = normalize(query)
+        grams = ngrams(needle)
+        if not grams:
+            return []
+
+        if len(needle) < NGRAM:
+            # Shorter than an n-gram: scan instead of looking up postings
+            scored = [(-2.0, time_ms) for time_ms, text in self.searchable.items() if needle in text]
+        else:
+            scored = self.score(needle, grams, limit)
+        scored.sort()
+
+        results = []
+        for score, time_ms in scored:
+            entry = self.entry(time_ms, tracks)
+            if entry is not None:
+                entry["score"] = round(-score, 3)
+                results.append(entry)
+                if len(results) >= limit:
+                    break
+        return results
+
+    def score(self, needle: str, grams: Set[str], limit: int) -> List[Tuple[float, int]]:
+        """(-score, time) of the entries matching at least MIN_MATCH of grams"""
+        # Entries with every n-gram come from intersecting postings, rarest first
+        postings = sorted((self.postings.get(gram, set()) for gram in grams), key=len)
+        full = set(postings[0]).intersection(*postings[1:])
+        exact = [(-2.0, time_ms) for time_ms in full if needle in self.searchable[time_ms]]
+        if len(exact) >= limit:
+            return exact
+
+        # Not enough exact matches: count n-grams of partial matches too
+        counts = Counter()
+        for times in postings:
+            counts.update(times)
+        needed = max(1, int(len(grams) * MIN_MATCH))
+        return [(-(count / len(grams) + (needle in self.searchable[time_ms])), time_ms)
+                for time_ms, count in counts.items() if count >= needed]
+
+
+def event_lines(data: dict) -> Lines:
+    """Non-empty, trimmed (track, text) pairs of a subtitle event"""
+    subtitle = data.get('subtitle') or {}
+    lines: Iterable[dict] = subtitle.get('lines') or []
+    if not lines and subtitle.get('text'):
+        lines = [{"text": subtitle['text'], "track": 0}]
+
+    pairs = []
+    for line in lines:
+        track = line.get('track_num')
+        if track is None:
+            track = line.get('track', 0)
+        text = (line.get('text') or '').strip()
+        if text:
+            pairs.append((track, text))
+    return tuple(pairs)
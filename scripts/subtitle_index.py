@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+subjoyer.nvim - Subtitle file parsing and cue index
+Parses SRT, WebVTT and ASS/SSA files into a CueIndex: cues sorted by start
+time in compact arrays, answering "cues active at T", "cues between T0 and
+T1" and "next N cues after T" with a binary search. Times are milliseconds.
+
+Used by ws_server_8766.py for the files asbplayer loads.
+"""
+
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Iterable, List, Optional, Tuple
+
+# 00:01:02,345 / 01:02.345 / 1:02:03.45 (ASS centiseconds)
+TIMESTAMP_PATTERN = re.compile(r'(?:(\d+):)?(\d{1,2}):(\d{2})[.,](\d{1,3})')
+TIMING_PATTERN = re.compile(r'^\s*(\S+)\s*-->\s*(\S+)')
+TAG_PATTERN = re.compile(r'<[^>]*>')
+ASS_OVERRIDE_PATTERN = re.compile(r'\{[^}]*\}')
+
+# "previous" / "next" seeks look from slightly ahead of the clock, so pressing
+# again right after a seek moves on instead of landing on the same cue
+SEEK_SLACK_MS = 100
+
+Cue = Tuple[int, int, str]  # start_ms, end_ms, text
+
+
+def parse_timestamp(text: str) -> Optional[int]:
+    """'00:01:02,345' -> 62345 (ms); None if it is not a timestamp"""
+    match = TIMESTAMP_PATTERN.fullmatch(text.strip())
+    if not match:
+        return None
+    hours, minutes, seconds, fraction = match.groups()
+    ms = int(fraction.ljust(3, '0'))
+    return ((int(hours or 0) * 60 + int(minutes)) * 60 + int(seconds)) * 1000 + ms
+
+
+def decode_text(data) -> str:
+    """Subtitle files are UTF-8 (with or without BOM) or, rarely, UTF-16 with BOM.
+
+    data is any bytes-like object (bytes, mmap, memoryview); str() decodes it
+    straight from the buffer without copying it into a bytes object first.
+    """
+    if data[:2] in (b'\xff\xfe', b'\xfe\xff'):
+        return str(data, 'utf-16', 'replace')
+    return str(data, 'utf-8-sig', 'replace')
+
+
+def parse_srt(text: str) -> List[Cue]:
+    """SRT and WebVTT: blocks separated by blank lines, each with a timing line"""
+    cues = []
+    for block in re.split(r'\n\s*\n', text.replace('\r\n', '\n').replace('\r', '\n')):
+        lines = block.strip('\n').split('\n')
+        for i, line in enumerate(lines):
+            match = TIMING_PATTERN.match(line)
+            if not match:
+                continue
+            start, end = parse_timestamp(match.group(1)), parse_timestamp(match.group(2))
+            if start is not None and end is not None:
+                body = TAG_PATTERN.sub('', '\n'.join(lines[i + 1:])).strip()
+                if body:
+                    cues.append((start, end, body))
+            break
+    return cues
+
+
+def parse_ass(text: str) -> List[Cue]:
+    """ASS/SSA: Dialogue lines of the [Events] section, in the order given by its Format line"""
+    cues = []
+    fields = None
+    in_events = False
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('['):
+            in_events = line.lower() == '[events]'
+            continue
+        if not in_events:
+            continue
+
+        key, _, value = line.partition(':')
+        if key == 'Format':
+            fields = [field.strip().lower() for field in value.split(',')]
+        elif key == 'Dialogue' and fields:
+            values = value.split(',', len(fields) - 1)
+            if len(values) != len(fields):
+                continue
+            row = dict(zip(fields, values))
+            start, end = parse_timestamp(row.get('start', '')), parse_timestamp(row.get('end', ''))
+            body = ASS_OVERRIDE_PATTERN.sub('', row.get('text', ''))
+            body = body.replace('\\N', '\n').replace('\\n', '\n').replace('\\h', ' ').strip()
+            if start is not None and end is not None and body:
+                cues.append((start, end, body))
+    return cues
+
+
+def parse_subtitles(name: str, data) -> List[Cue]:
+    """Parse a subtitle file by extension, falling back to sniffing its content"""
+    text = decode_text(data)
+    lower = name.lower()
+    if lower.endswith(('.ass', '.ssa')) or (not lower.endswith(('.srt', '.vtt')) and '[Events]' in text):
+        return parse_ass(text)
+    return parse_srt(text)
+
+
+class CueIndex:
+    """Cues of one subtitle track, sorted by start time.
+
+    reach[i] is the latest end time among cues 0..i, so finding the cues
+    active at T walks back from the last cue starting before T only as long
+    as an earlier cue could still be showing.
+    """
+
+    def __init__(self, cues: Iterable[Cue]):
+        cues = sorted(cues)
+        self.starts = array('q', (cue[0] for cue in cues))
+        self.ends = array('q', (cue[1] for cue in cues))
+        self.texts = [cue[2] for cue in cues]
+        self.reach = array('q')
+        latest = 0
+        for end in self.ends:
+            latest = max(latest, end)
+            self.reach.append(latest)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def cue(self, i: int) -> dict:
+        return {"start": self.starts[i], "end": self.ends[i], "text": self.texts[i]}
+
+    def active(self, t: int) -> List[int]:
+        """Indexes of the cues showing at t, in start order"""
+        found = []
+        i = bisect_right(self.starts, t) - 1
+        while i >= 0 and self.reach[i] > t:
+            if self.ends[i] > t:
+                found.append(i)
+            i -= 1
+        found.reverse()
+        return found
+
+    def between(self, start: int, end: int) -> List[int]:
+        """Indexes of the cues overlapping [start, end)"""
+        first = bisect_left(self.starts, start)
+        last = bisect_left(self.starts, end)
+        return [i for i in self.active(start) if i < first] + list(range(first, last))
+
+    def following(self, t: int, count: int) -> range:
+        """Indexes of the next count cues starting after t"""
+        first = bisect_right(self.starts, t)
+        return range(first, min(first + count, len(self.starts)))
+
+    def seek_target(self, t: int, direction: str) -> Optional[int]:
+        """Start time of the previous, current or next cue relative to t"""
+        t += SEEK_SLACK_MS
+        current = bisect_right(self.starts, t) - 1
+        if direction == 'next':
+            target = current + 1
+        elif direction == 'previous':
+            # From inside a cue go to the one before it; from a gap, to the last one
+            target = current - 1 if current >= 0 and self.ends[current] > t else current
+        else:
+            target = current
+        if 0 <= target < len(self.starts):
+            return self.starts[target]
+        return None
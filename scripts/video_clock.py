@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+subjoyer.nvim - Video clock
+Follows the browser's video on the local clock, so subtitles can be shown
+and hidden on a schedule instead of the moment a frame happens to arrive.
+
+Frames from the extension carry "timestamp" (the browser's clock when the
+frame was sent, ms) and subtitles "video" {"currentTime", "paused"}. The
+offset between the browser's clock and the local one is the smallest
+(local receive - browser send) of the last OFFSET_WINDOW frames: the
+quickest frame had the least network and pipe delay, so the send time of
+every frame is estimated without its jitter. Each subtitle then anchors
+video time to that local send time. A frame the anchor predicts more than
+SEEK_THRESHOLD_MS wrong is a seek; the rate comes from "playbackRate" when
+the extension sends it, or is measured over RATE_SPAN_MS of playback and
+snapped to the usual player speeds.
+
+Times are milliseconds; local times are the asyncio loop's clock. A
+recording replayed at --speed N arrives N times faster than the browser sent
+it: the clock is built with speed=N, so browser time and playback are scaled
+to local time before they are compared, and rates stay the player's. With
+speed=0 (no pacing at all) frames carry no timing, and seek and rate
+detection are off.
+
+Used by ws_client.py.
+"""
+
+from collections import deque
+from typing import Optional
+
+# Frames the clock offset is the minimum over
+OFFSET_WINDOW = 64
+
+# Video time off by more than this from the prediction is a seek
+SEEK_THRESHOLD_MS = 750
+
+# Playback a measured rate needs, and how close it must be to a player speed
+RATE_SPAN_MS = 2000
+RATE_TOLERANCE = 0.03
+PLAYER_RATES = (0.25, 0.5, 0.75, 1.0, 1.25, 1.5, 1.75, 2.0, 2.5, 3.0)
+
+
+def snap_rate(measured: float) -> Optional[float]:
+    """The player speed measured is, or None if it is none of them"""
+    for rate in PLAYER_RATES:
+        if abs(measured - rate) <= rate * RATE_TOLERANCE:
+            return rate
+    return None
+
+
+class VideoClock:
+    """Browser clock offset and the video's position, rate and pause state"""
+
+    def __init__(self, speed: float = 1.0):
+        self.speed = speed  # local time runs this much faster than the browser's (replay)
+        self.scale = speed if speed > 0 else 1.0
+        self.offsets = deque(maxlen=OFFSET_WINDOW)  # local receive - browser send, per frame
+        self.offset: Optional[float] = None
+        self.anchor: Optional[tuple] = None  # (local ms, video ms) of the latest frame
+        self.recent = deque()  # (local ms, video ms) of the frames since the last jump, over RATE_SPAN_MS
+        self.rate = 1.0
+        self.paused = True
+
+    def sent_at(self, now: float, timestamp) -> Optional[float]:
+        """Local time a frame received at now was sent, from its browser timestamp (None without one)"""
+        if not isinstance(timestamp, (int, float)) or isinstance(timestamp, bool) or timestamp <= 0:
+            return None
+        timestamp /= self.scale
+        offset = now - timestamp
+        self.offsets.append(offset)
+        if self.offset is None or offset <= self.offset:
+            self.offset = offset
+        elif len(self.offsets) == OFFSET_WINDOW:
+            # The old minimum may have left the window
+            self.offset = min(self.offsets)
+        return timestamp + self.offset
+
+    def observe(self, sent: float, video_ms: float, paused: bool, rate=None) -> Optional[str]:
+        """Anchor the clock on a frame sent at local time sent.
+
+        Returns what changed: 'seek', 'pause', 'play', 'rate' or None.
+        """
+        change = None
+        if self.anchor is None:
+            change = 'seek'
+        elif paused != self.paused:
+            change = 'pause' if paused else 'play'
+        elif paused and video_ms != self.anchor[1]:
+            change = 'seek'
+        elif not paused and self.speed > 0 and abs(video_ms - self.video_at(sent)) > SEEK_THRESHOLD_MS * self.scale:
+            # A new speed looks like a seek, unless the video moved at a player
+            # speed since the last frame
+            measured = self.measure(self.anchor, sent, video_ms)
+            if measured is not None and measured != self.rate and not isinstance(rate, (int, float)):
+                self.rate = measured
+                change = 'rate'
+            else:
+                change = 'seek'
+
+        if isinstance(rate, (int, float)) and rate > 0:
+            if rate != self.rate and change is None:
+                change = 'rate'
+            self.rate = float(rate)
+        elif change is None and not paused and self.speed > 0:
+            measured = self.measure(self.recent[0] if self.recent else None, sent, video_ms)
+            if measured is not None and measured != self.rate:
+                self.rate = measured
+                change = 'rate'
+
+        self.paused = paused
+        self.anchor = (sent, video_ms)
+        if change is not None:
+            self.recent.clear()
+        self.recent.append(self.anchor)
+        # Measure over the last RATE_SPAN_MS only, so a new speed is not averaged with the old one
+        while len(self.recent) > 2 and sent - self.recent[1][0] >= RATE_SPAN_MS / self.scale:
+            self.recent.popleft()
+        return change
+
+    def measure(self, since: Optional[tuple], sent: float, video_ms: float) -> Optional[float]:
+        """Player speed from the (local, video) point since, once RATE_SPAN_MS of playback has passed"""
+        if since is None or (sent - since[0]) * self.scale < RATE_SPAN_MS:
+            return None
+        return snap_rate((video_ms - since[1]) / ((sent - since[0]) * self.scale))
+
+    def video_at(self, local: float) -> float:
+        """Video time at local time local"""
+        sent, video_ms = self.anchor
+        if self.paused:
+            return video_ms
+        return video_ms + (local - sent) * self.rate * self.scale
+
+    def local_at(self, video_ms: float) -> Optional[float]:
+        """Local time the video reaches video_ms, or None while paused"""
+        if self.anchor is None or self.paused:
+            return None
+        sent, anchor_video = self.anchor
+        return sent + (video_ms - anchor_video) / (self.rate * self.scale)
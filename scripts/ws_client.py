@@ -4,87 +4,748 @@
 subjoyer.nvim - WebSocket Server
 Receives subtitle messages from asbplayer-streamer extension and outputs to stdout.
 
+Neovim sends commands on stdin, one JSON object per line:
+    {"command": "display-config", "tracks": 0 | "all" | [0, 1], "trim": true,
+     "max_lengths": {"nui": 80, "incline": 40}}
+From then on subtitles are filtered, trimmed and truncated here (see DisplayFilter).
+
+Every subtitle of the session is kept by video time (--history-size entries,
+see subtitle_history.py) and can be queried with
+    {"command": "history", "id": ID, "from": MS, "to": MS}
+which is answered with {"type": "history", "id": ID, "entries": [...]}, each
+entry {"time": MS, "text": ..., "lines": [...]} for the tracks on display.
+    {"command": "search", "id": ID, "query": TEXT, "limit": N}
+searches it by character n-grams and is answered with
+{"type": "search", "id": ID, "results": [...]}, entries best match first,
+each with a "score".
+    {"command": "log", "id": ID, "level": NAME}
+is answered with {"type": "log", "id": ID, "level": ..., "entries": [...]},
+the buffered diagnostics of this process (see bridge_io.BridgeLog); "level"
+is optional and changes what is kept from then on (--log-level, default off).
+
+With --record PATH every frame from the extension except heartbeats is
+appended to a recording (see session_recording.py). --replay PATH plays a
+recording through the relay instead of listening for the extension, at
+--speed times its recorded pace (0 = as fast as Neovim reads), from
+--seek SECS of video time; {"type": "replay_finished"} follows the last
+frame and the relay keeps answering commands until stdin closes.
+
+Subtitles are shown on the video's clock rather than when their frame
+arrives (see video_clock.py): each one is emitted --schedule-delay ms after
+the extension sent it, so network and pipe jitter up to that much no longer
+reaches the display, and a burst of frames comes out at its original pace.
+Every subtitle is shown, in order, however short; frames without a
+"timestamp" are shown on arrival.
+When the end of the subtitle on display is known (an "end" in the frame,
+or in the daemon the cue index of the files asbplayer loaded),
+    {"type": "subtitle_hide", "at": MS, "video": {"currentTime": ...}}
+follows once the video reaches it; "video" is that of the subtitle it ends.
+A hide waits while the video is paused and is dropped on a seek. Whenever
+the video pauses, plays, seeks or changes speed,
+    {"type": "video_clock", "change": "pause" | "play" | "seek" | "rate",
+     "currentTime": SECS, "paused": BOOL, "rate": N}
+gives the video time on display (--schedule-delay behind the browser), so
+Neovim can restart the look-ahead of loaded cues from it.
+
+Heartbeats and repeated identical subtitles are not forwarded. If a connected
+extension sends nothing for --liveness-timeout seconds, one
+{"type": "extension_liveness", "alive": false} event is emitted, and
+{"alive": true} once frames arrive again.
+
+While frames are flowing, a {"type": "stats"} event reports frames/sec and
+latency percentiles (time in the relay queue and in the stdout writer) every
+--stats-interval seconds. The stats and liveness timers only run while an
+extension is connected (or a recording replays), so an idle relay sleeps.
+
 Requirements:
     pip install websockets
+    pip install orjson  (optional, faster JSON decoding/encoding)
 
 Usage:
-    python ws_client.py [--host HOST] [--port PORT]
+    python ws_client.py [--host HOST] [--port PORT] [--passthrough]
+                        [--overflow POLICY] [--max-pending N] [--liveness-timeout SECS]
+                        [--stats-interval SECS] [--history-size N] [--schedule-delay MS] [--record PATH]
+                        [--log-level LEVEL]
+    python ws_client.py --replay PATH [--speed N] [--seek SECS] [...]
 """
 
+if __name__ == "__main__":
+    # Bind and announce before the slow imports below (see fast_start.py)
+    import fast_start
+    fast_start.early_start(fast_start.relay_ready, '--host', 'localhost', '--port', 8767)
+
 import asyncio
-import websockets
 import json
+import re
 import sys
+import time
 import argparse
-import io
-from typing import Optional
+from collections import deque
+from typing import Optional, Union
+
+import fast_start
+try:
+    import websockets
+except ImportError as e:
+    # Neovim may already have the ready event from early_start()
+    fast_start.abandon(f"Cannot import websockets: {e}")
+    raise
+from bridge_io import (LOG, LOG_LEVELS, OVERFLOW_POLICIES, LatencyHistogram, Logger, StdoutWriter, force_utf8_stdio,
+                       json_dumps, json_loads, log_command, open_stdin_reader)
+from display_filter import DisplayFilter, track_of
+from session_recording import CURRENT_TIME_PATTERN, SessionRecorder, SessionRecording
+from subtitle_history import HISTORY_SIZE, SubtitleHistory
+from video_clock import VideoClock
 
 # Force UTF-8 encoding for stdout/stderr to handle Unicode subtitles (Japanese, etc.)
-if sys.platform == 'win32':
-    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
-    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+force_utf8_stdio()
+
+log = Logger('relay')
+
+# Most results a search command returns
+MAX_SEARCH_RESULTS = 100
+
+# How long after the extension sent a subtitle it is shown (the jitter buffer)
+SCHEDULE_DELAY_MS = 50
+
+# Cheap pass-through checks (JSON string values escape quotes, so these
+# patterns only ever match real keys)
+TYPE_PATTERN = re.compile(r'"type"\s*:\s*"([A-Za-z_]+)"')
+TRACK_PATTERN = re.compile(r'"track(?:_num)?"\s*:\s*(-?\d+)')
+TEXT_PATTERN = re.compile(r'"text"\s*:\s*"((?:[^"\\]|\\.)*)"')
+TIMESTAMP_PATTERN = re.compile(r'"timestamp"\s*:\s*(\d+(?:\.\d+)?)')
+PAUSED_PATTERN = re.compile(r'"paused"\s*:\s*(true|false)')
+RATE_PATTERN = re.compile(r'"playbackRate"\s*:\s*(\d+(?:\.\d+)?)')
+
+
+def sniff_frame(message) -> Optional[str]:
+    """Return the message type if the frame can be forwarded verbatim.
+
+    A frame qualifies when it is a single-line JSON object with a type field.
+    Anything else goes through a full decode.
+    """
+    if not isinstance(message, str) or not message.startswith('{'):
+        return None
+    if '\n' in message or '\r' in message:
+        return None
+    match = TYPE_PATTERN.search(message)
+    return match.group(1) if match else None
+
+
+def frame_number(pattern, message: str) -> Optional[float]:
+    match = pattern.search(message)
+    return float(match.group(1)) if match else None
+
+
+def frame_clock(message: str) -> tuple:
+    """(timestamp, currentTime, paused, playbackRate) of a raw frame without decoding it; None where absent"""
+    paused = PAUSED_PATTERN.search(message)
+    return (frame_number(TIMESTAMP_PATTERN, message), frame_number(CURRENT_TIME_PATTERN, message),
+            paused is not None and paused.group(1) == 'true', frame_number(RATE_PATTERN, message))
+
+
+def frame_end(data: dict) -> Optional[float]:
+    """Video ms a subtitle event ends at, if the extension sent its cue times"""
+    subtitle = data.get('subtitle') or {}
+    ends = [line.get('end') for line in subtitle.get('lines') or []] + [subtitle.get('end')]
+    ends = [end for end in ends if isinstance(end, (int, float)) and not isinstance(end, bool)]
+    return max(ends) if ends else None
+
+
+class SubtitleCoalescer:
+    """Pending output stage between the WebSocket and stdout.
+
+    While Neovim is slow to drain stdout, newer subtitles replace older pending
+    ones for the same set of tracks. Everything else (connected,
+    client_disconnected, ...) is kept in order and only dropped, oldest
+    first, once more than max_pending lines are waiting. wait_times records
+    how long each delivered line was pending.
+    """
+
+    def __init__(self, max_pending: Optional[int] = None):
+        self.pending = deque()  # (key, line, monotonic time queued) in arrival order; key None = never coalesced
+        self.max_pending = max_pending
+        self.dropped = 0
+        self.wait_times = LatencyHistogram()
+        self.has_pending = asyncio.Event()
+
+    @staticmethod
+    def key_for(msg_type, tracks):
+        """Coalescing key for a message, or None if it must not be dropped"""
+        if msg_type != 'subtitle':
+            return None
+        return ('subtitle',) + tuple(sorted(set(tracks)) or [0])
+
+    def push(self, key, line: Union[str, dict]):
+        """Queue an output line (or an event the writer serializes), replacing a stale pending one with the same key"""
+        if key is not None:
+            for i, (pending_key, _, _) in enumerate(self.pending):
+                if pending_key == key:
+                    del self.pending[i]
+                    self.dropped += 1
+                    break
+        if self.max_pending is not None and len(self.pending) >= self.max_pending:
+            self.pending.popleft()
+            self.dropped += 1
+        self.pending.append((key, line, time.monotonic()))
+        self.has_pending.set()
+
+    def take(self):
+        """Remove and return all pending lines"""
+        now = time.monotonic()
+        for _, _, queued in self.pending:
+            self.wait_times.record((now - queued) * 1000)
+        lines = [line for _, line, _ in self.pending]
+        self.pending.clear()
+        self.has_pending.clear()
+        return lines
 
 
 class SubtitleWebSocketServer:
-    def __init__(self, host: str = 'localhost', port: int = 8767):
+    def __init__(self, host: str = 'localhost', port: int = 8767, passthrough: bool = False,
+                 writer: Optional[StdoutWriter] = None, liveness_timeout: float = 15.0,
+                 stats_interval: float = 5.0, history_size: int = HISTORY_SIZE,
+                 recorder: Optional[SessionRecorder] = None, schedule_delay: float = 0.0):
         self.host = host
         self.port = port
-        self.server: Optional[websockets.WebSocketServer] = None
+        self.passthrough = passthrough
+        self.liveness_timeout = liveness_timeout
+        self.stats_interval = stats_interval
+        self.servers = []  # one WebSocket server per bound address
+        self.writer = writer or StdoutWriter()
+        self.output: Optional[SubtitleCoalescer] = None
+        self.forwarded = 0
+        self.reported_dropped = 0
+        self.emit_relay_stats = True  # off when the daemon reports per subscriber
+        self.last_subtitle = None  # latest subtitle (dict, or raw frame in pass-through mode)
+        self.extension_hello = None  # 'connected' event of the attached extension, same forms
+        self.display: Optional[DisplayFilter] = None  # set by a display-config command
+        self.ready_event = None
+        self.stdin_task = None
+        self.liveness_task = None  # running while an extension is connected
+        self.stats_task = None  # running while an extension is connected or a recording replays
+        self.clients = 0
+        self.last_seen = 0.0  # loop time of the last frame from any extension
+        self.alive = True
+        self.last_digest = None  # content hash of the last subtitle sent
+        self.suppressed = 0
+        self.frames = 0  # frames received from the extension
+        self.reported_frames = 0
+        self.history = SubtitleHistory(history_size)
+        self.recorder = recorder  # --record
+        self.schedule_delay = schedule_delay  # ms
+        self.clock = VideoClock()
+        self.waiting = 0  # subtitles scheduled for a later time
+        self.late = 0  # subtitles that arrived after their time
+        self.hide = None  # (video ms, hide event) of the subtitle on display
+        self.hide_handle = None
+        self.subtitle_ended = False  # the latest subtitle was hidden at its end
+        self.cue_end = None  # (video ms, tracks) -> end of the cues showing; set by the asbplayer bridge
+
+    def emit(self, data: dict):
+        """Queue a decoded event for Neovim"""
+        tracks = []
+        if data.get('type') == 'heartbeat':
+            # Only feeds the liveness check and the clock offset
+            self.clock.sent_at(self.now(), data.get('timestamp'))
+            return
+        if data.get('type') == 'connected':
+            self.clock.sent_at(self.now(), data.get('timestamp'))
+            self.extension_hello = data
+        elif data.get('type') == 'subtitle':
+            video = data.get('video') or {}
+            sent = self.follow_video(data.get('timestamp'), video.get('currentTime'), video.get('paused'),
+                                     video.get('playbackRate'))
+            self.last_subtitle = data
+            if self.display is not None:
+                data = self.display.prepare(data)
+            subtitle = data.get('subtitle') or {}
+            lines = subtitle.get('lines') or []
+            tracks = [track_of(line) for line in lines]
+            # Over the payload Neovim gets: truncated copies count, and pausing is news
+            if self.is_repeat(hash((subtitle.get('text'), tuple(tracks), bool(video.get('paused')),
+                                    tuple((line.get('text'), tuple(sorted((line.get('short') or {}).items())))
+                                          for line in lines)))):
+                return
+            self.history.add_event(self.last_subtitle)
+            self.schedule(SubtitleCoalescer.key_for('subtitle', tracks), data, sent,
+                          self.hide_for(self.last_subtitle, tracks))
+            return
+        self.output.push(SubtitleCoalescer.key_for(data.get('type'), tracks), data)
+
+    def emit_raw(self, msg_type: str, message: str):
+        """Queue an already-serialized frame for Neovim without decoding it"""
+        tracks = []
+        if msg_type == 'heartbeat':
+            self.clock.sent_at(self.now(), frame_number(TIMESTAMP_PATTERN, message))
+            return
+        if msg_type == 'connected':
+            self.clock.sent_at(self.now(), frame_number(TIMESTAMP_PATTERN, message))
+            self.extension_hello = message
+        elif msg_type == 'subtitle':
+            timestamp, current_time, paused, rate = frame_clock(message)
+            sent = self.follow_video(timestamp, current_time, paused, rate)
+            self.last_subtitle = message
+            tracks = [int(track) for track in TRACK_PATTERN.findall(message)]
+            if self.is_repeat(hash((tuple(tracks), paused, tuple(TEXT_PATTERN.findall(message))))):
+                return
+            # Only new subtitles are decoded, for the history and their end
+            data = json_loads(message)
+            self.history.add_event(data)
+            self.schedule(SubtitleCoalescer.key_for(msg_type, tracks), message, sent,
+                          self.hide_for(data, tracks))
+            return
+        self.output.push(SubtitleCoalescer.key_for(msg_type, tracks), message)
+
+    def now(self) -> float:
+        """Local clock in ms (the loop's, which timers run on)"""
+        return asyncio.get_running_loop().time() * 1000
+
+    def follow_video(self, timestamp, current_time, paused, rate=None) -> Optional[float]:
+        """Feed a subtitle frame to the video clock; returns the local ms it was sent (None if untimed)"""
+        now = self.now()
+        sent = self.clock.sent_at(now, timestamp)
+        if not isinstance(current_time, (int, float)) or isinstance(current_time, bool):
+            return sent
+        change = self.clock.observe(now if sent is None else sent, current_time * 1000, bool(paused), rate)
+        if change is not None:
+            log.debug("Video clock: %s at %.0f ms (rate %g)", change, current_time * 1000, self.clock.rate)
+            self.output.push(None, self.clock_event(change))
+        if change == 'seek':
+            # The extension re-sends the subtitle at the new position; it is new again
+            self.last_digest = None
+            self.cancel_hide()
+        if self.hide is not None:
+            # Every frame corrects the estimate; a pause holds the hide until play
+            self.arm_hide()
+        return sent
+
+    def clock_event(self, change: str) -> dict:
+        """The video clock as Neovim's look-ahead follows it"""
+        return {
+            "type": "video_clock",
+            "change": change,
+            "currentTime": round(self.clock.video_at(self.now() - self.schedule_delay)) / 1000,
+            "paused": self.clock.paused,
+            "rate": self.clock.rate
+        }
+
+    def hide_for(self, data: dict, tracks: list) -> Optional[tuple]:
+        """(video ms, hide event) for a subtitle with lines on tracks, if its end is known"""
+        current_time = (data.get('video') or {}).get('currentTime')
+        if not tracks or not isinstance(current_time, (int, float)):
+            return None
+        end = frame_end(data)
+        if end is None and self.cue_end is not None:
+            end = self.cue_end(round(current_time * 1000), tracks)
+        if end is None:
+            return None
+        return end, {"type": "subtitle_hide", "at": end, "video": {"currentTime": current_time}}
+
+    def schedule(self, key, line: Union[str, dict], sent: Optional[float], hide: Optional[tuple]):
+        """Show a subtitle schedule_delay ms after the local time it was sent.
+
+        Subtitles waiting for their time are never replaced: each comes out
+        at its own time, in the order they were sent.
+        """
+        if self.schedule_delay <= 0 or (sent is None and not self.waiting):
+            self.show(key, line, hide)
+            return
+        if sent is None:
+            # Untimed, but behind subtitles still waiting
+            sent = self.now()
+        due = sent + self.schedule_delay
+        if due <= self.now():
+            self.late += 1
+            self.show(key, line, hide)
+        else:
+            self.waiting += 1
+            asyncio.get_running_loop().call_at(due / 1000, self.show_waiting, key, line, hide)
+
+    def show_waiting(self, key, line: Union[str, dict], hide: Optional[tuple]):
+        self.waiting -= 1
+        self.show(key, line, hide)
+
+    def show(self, key, line: Union[str, dict], hide: Optional[tuple]):
+        """Queue a subtitle for Neovim now; it replaces the hide of the one before"""
+        self.output.push(key, line)
+        self.subtitle_ended = False
+        self.cancel_hide()
+        self.hide = hide
+        if hide is not None:
+            self.arm_hide()
+
+    def arm_hide(self):
+        """(Re)schedule the hide for when the video clock reaches its time"""
+        if self.hide_handle is not None:
+            self.hide_handle.cancel()
+            self.hide_handle = None
+        local = self.clock.local_at(self.hide[0])
+        if local is not None:
+            due = (local + self.schedule_delay) / 1000
+            self.hide_handle = asyncio.get_running_loop().call_at(due, self.fire_hide)
+
+    def cancel_hide(self):
+        if self.hide_handle is not None:
+            self.hide_handle.cancel()
+        self.hide = None
+        self.hide_handle = None
+
+    def fire_hide(self):
+        _, event = self.hide
+        self.hide = None
+        self.hide_handle = None
+        # Once hidden, the same subtitle again (a seek back) is shown again
+        self.last_digest = None
+        self.subtitle_ended = True
+        self.output.push(None, event)
+
+    def is_repeat(self, digest: int) -> bool:
+        """True if a subtitle has the same texts, tracks and pause state as the last one sent.
+
+        The extension re-sends the current subtitle while paused, on seek and
+        on re-render; Neovim already shows it. Only the change to paused (and
+        back) goes through, so Neovim can stop and restart its look-ahead.
+        """
+        if digest == self.last_digest:
+            self.suppressed += 1
+            return True
+        self.last_digest = digest
+        return False
+
+    def seen(self):
+        """Record a frame from the extension; reports it alive again after a timeout"""
+        self.frames += 1
+        self.last_seen = asyncio.get_running_loop().time()
+        if not self.alive:
+            self.alive = True
+            self.emit({"type": "extension_liveness", "alive": True})
+
+    async def watch_liveness(self):
+        """Report once when a connected extension stops sending frames (heartbeats included)"""
+        loop = asyncio.get_running_loop()
+        while True:
+            remaining = self.liveness_timeout
+            if self.clients and self.alive:
+                idle = loop.time() - self.last_seen
+                if idle >= self.liveness_timeout:
+                    self.alive = False
+                    self.emit({"type": "extension_liveness", "alive": False, "idle": round(idle, 1)})
+                else:
+                    remaining -= idle
+            await asyncio.sleep(remaining)
+
+    @property
+    def coalesced(self) -> int:
+        """Stale subtitles replaced in the relay's own output stage"""
+        return self.output.dropped if self.output is not None else 0
+
+    def current_subtitle(self) -> Optional[dict]:
+        """Latest subtitle event received from the extension"""
+        if isinstance(self.last_subtitle, str):
+            self.last_subtitle = json_loads(self.last_subtitle)
+        return self.last_subtitle
+
+    def stats_event(self, elapsed: float) -> Optional[dict]:
+        """Throughput and latency since the last stats event, or None if idle"""
+        frames = self.frames - self.reported_frames
+        if not frames and not self.output.wait_times.count:
+            return None
+        self.reported_frames = self.frames
+
+        event = {
+            "type": "stats",
+            "frames_per_sec": round(frames / elapsed, 1),
+            "forwarded": self.forwarded,
+            "suppressed": self.suppressed,
+            "history": len(self.history),
+            "late": self.late,
+            "queue_ms": self.output.wait_times.snapshot()
+        }
+        write_times = getattr(self.writer, 'write_times', None)
+        if write_times is not None:
+            event["write_ms"] = write_times.snapshot()
+        return event
+
+    def start_timers(self, liveness: bool = True):
+        """Start the liveness and stats timers if they are not running"""
+        if liveness and self.liveness_task is None:
+            self.liveness_task = asyncio.create_task(self.watch_liveness())
+        if self.stats_task is None and self.stats_interval > 0:
+            self.stats_task = asyncio.create_task(self.report_stats())
+
+    def stop_timers(self):
+        """Cancel the liveness and stats timers; nothing wakes the loop while idle"""
+        for task in (self.liveness_task, self.stats_task):
+            if task is not None:
+                task.cancel()
+        self.liveness_task = None
+        self.stats_task = None
+
+    async def report_stats(self):
+        """Emit a stats event every stats_interval seconds while frames are flowing"""
+        loop = asyncio.get_running_loop()
+        last = loop.time()
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            now = loop.time()
+            event = self.stats_event(now - last)
+            last = now
+            if event is not None:
+                self.writer.write_json(event)
+
+    def subtitle_line(self) -> Optional[str]:
+        """The latest subtitle as Neovim should receive it"""
+        if self.last_subtitle is None:
+            return None
+        if self.display is not None:
+            return json_dumps(self.display.prepare(self.current_subtitle()))
+        if isinstance(self.last_subtitle, str):
+            return self.last_subtitle
+        return json_dumps(self.last_subtitle)
+
+    def deliver(self, line: Union[str, dict]):
+        """Hand a line to the writer; decoded events are serialized there (or not at all over RPC)"""
+        if isinstance(line, str):
+            self.writer.write(line)
+        else:
+            self.writer.write_json(line)
+
+    def replay_state(self):
+        """Re-send the current state to a Neovim that attached late (persistent daemon)"""
+        if self.ready_event is not None:
+            self.writer.write_json(self.ready_event)
+        if self.extension_hello is not None:
+            self.deliver(self.extension_hello)
+        if self.last_subtitle is not None and not self.subtitle_ended:
+            if self.display is not None:
+                self.writer.write_json(self.display.prepare(self.current_subtitle()))
+            else:
+                self.deliver(self.last_subtitle)
+
+    def shown_tracks(self, display: Optional[DisplayFilter] = None) -> Optional[frozenset]:
+        """Tracks history and search answers are limited to (None = all)"""
+        display = display or self.display
+        return display.tracks if display is not None else None
+
+    def handle_command(self, command: dict, display: Optional[DisplayFilter] = None):
+        """Apply a command from Neovim (display: the asking Neovim's config, in the persistent daemon)"""
+        if command.get('command') == 'display-config':
+            self.display = DisplayFilter.from_command(command)
+            # The current subtitle in the new form is not a repeat
+            self.last_digest = None
+            # Re-render the current subtitle with the new config
+            if self.last_subtitle is not None and self.output is not None and not self.subtitle_ended:
+                self.emit(self.current_subtitle())
+        elif command.get('command') == 'history':
+            try:
+                start, end = int(command.get('from', 0)), int(command.get('to', 0))
+            except (TypeError, ValueError):
+                start, end = 0, -1
+            self.writer.write_json({
+                "type": "history",
+                "id": command.get('id'),
+                "entries": self.history.between(start, end, self.shown_tracks(display))
+            })
+        elif command.get('command') == 'search':
+            try:
+                limit = min(int(command.get('limit', 20)), MAX_SEARCH_RESULTS)
+            except (TypeError, ValueError):
+                limit = 20
+            self.writer.write_json({
+                "type": "search",
+                "id": command.get('id'),
+                "results": self.history.search(str(command.get('query') or ''), limit, self.shown_tracks(display))
+            })
+        elif command.get('command') == 'log':
+            try:
+                answer = log_command(command)
+            except ValueError as e:
+                answer = {"error": str(e)}
+            self.writer.write_json(dict(answer, type="log", id=command.get('id')))
+        else:
+            log.warning("Unknown relay command: %r", command.get('command'))
+
+    async def read_commands(self):
+        """Read commands from stdin (Neovim) as they arrive and apply them"""
+        reader = await open_stdin_reader()
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError as e:
+                log.warning("Error reading stdin: %s", e)
+                continue
+
+            if not line:
+                log.info("Stdin EOF")
+                break
+
+            line = line.strip()
+            if not line:
+                continue
+
+            try:
+                command = json_loads(line)
+            except json.JSONDecodeError as e:
+                log.warning("Invalid JSON from stdin: %s", e)
+                continue
+            if not isinstance(command, dict):
+                log.warning("Ignoring non-object command from stdin: %.80r", line)
+                continue
+
+            self.handle_command(command)
+
+    async def drain_output(self):
+        """Move pending lines to the stdout writer whenever the pipe has room"""
+        while True:
+            await self.output.has_pending.wait()
+            # While the pipe is backed up, new subtitles keep coalescing here
+            await self.writer.drain()
+            lines = self.output.take()
+            self.forwarded += len(lines)
+            for line in lines:
+                self.deliver(line)
+
+            dropped = self.coalesced + self.writer.dropped
+            if self.emit_relay_stats and dropped != self.reported_dropped:
+                self.reported_dropped = dropped
+                self.writer.write_json({
+                    "type": "relay_stats",
+                    "dropped": dropped,
+                    "forwarded": self.forwarded
+                })
+
+    def handle_frame(self, message):
+        """Relay one frame from the extension (or a recording) to Neovim"""
+        if self.passthrough:
+            msg_type = sniff_frame(message)
+            if msg_type is not None:
+                # Forward the original text, skipping decode/re-encode; with a
+                # display config Neovim filters these subtitles itself (display.prepare)
+                self.emit_raw(msg_type, message)
+                return
+
+        try:
+            # Parse and validate JSON
+            data = json_loads(message)
+
+            # Queue for stdout (compact single-line JSON)
+            self.emit(data)
+
+        except json.JSONDecodeError as e:
+            log.warning("Invalid JSON from the extension: %s", e)
+
+    async def replay(self, recording: SessionRecording, speed: float = 1.0, seek_ms: Optional[int] = None):
+        """Play a recording through the relay at speed times its recorded pace (0 = no pauses)"""
+        loop = asyncio.get_running_loop()
+        first = None
+        started = loop.time()
+        count = 0
+        self.clock = VideoClock(speed)
+        self.start_timers(liveness=False)
+        try:
+            for received, _, message in recording.frames(seek_ms):
+                if speed > 0:
+                    if first is None:
+                        first = received
+                    delay = started + (received - first) / 1000 / speed - loop.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                else:
+                    # Let the output stage drain; stale subtitles coalesce as they would live
+                    await asyncio.sleep(0)
+                self.frames += 1
+                count += 1
+                self.handle_frame(message)
+
+            # Report the end after the last subtitle has left the output stage
+            while self.output.pending or self.waiting:
+                await asyncio.sleep(0.01)
+        finally:
+            self.stop_timers()
+        self.writer.write_json({"type": "replay_finished", "frames": count})
 
     async def handle_client(self, websocket):
         """Handle incoming WebSocket connection"""
-        # Log connection (to stderr so it doesn't interfere with JSON output)
         client_addr = websocket.remote_address
-        print(f"[DEBUG] Extension connected from {client_addr[0]}:{client_addr[1]}", file=sys.stderr, flush=True)
+        log.info("Extension connected from %s:%s", client_addr[0], client_addr[1])
+        self.clients += 1
+        self.seen()
+        self.start_timers()
 
         try:
             async for message in websocket:
-                try:
-                    # Parse and validate JSON
-                    data = json.loads(message)
-
-                    # Output to stdout for neovim to read
-                    # Use compact JSON format (single line)
-                    output = json.dumps(data, ensure_ascii=False)
-                    print(output, flush=True)
-
-                except json.JSONDecodeError as e:
-                    # Log error to stderr (visible in neovim debug)
-                    print(f"ERROR: Invalid JSON: {e}", file=sys.stderr, flush=True)
+                self.seen()
+                if self.recorder is not None and isinstance(message, str) and sniff_frame(message) != 'heartbeat':
+                    self.recorder.write(message)
+                self.handle_frame(message)
 
         except websockets.exceptions.ConnectionClosed:
-            # Connection closed, output disconnect event
-            print(f"[DEBUG] Extension disconnected from {client_addr[0]}:{client_addr[1]}", file=sys.stderr, flush=True)
-            disconnect_event = {
-                "type": "client_disconnected",
-                "timestamp": 0
-            }
-            print(json.dumps(disconnect_event), flush=True)
+            pass
 
         except Exception as e:
-            # Unexpected error
-            print(f"ERROR: {e}", file=sys.stderr, flush=True)
+            log.error("Extension handler error: %s", e)
+
+        # Connection closed (cleanly or not), output disconnect event
+        log.info("Extension disconnected from %s:%s", client_addr[0], client_addr[1])
+        self.clients -= 1
+        if not self.clients:
+            self.stop_timers()
+        self.extension_hello = None
+        self.last_digest = None
+        self.alive = True
+        self.clock = VideoClock()
+        disconnect_event = {
+            "type": "client_disconnected",
+            "timestamp": 0
+        }
+        self.emit(disconnect_event)
+
+    async def start(self, standalone: bool = True, replay: Optional[SessionRecording] = None,
+                    speed: float = 1.0, seek_ms: Optional[int] = None):
+        """Start WebSocket server
+
+        A standalone server owns the process: it reads commands from stdin and
+        exits on errors. Inside the daemon the error is reported and start()
+        returns. With a recording to replay no server is started.
+        """
+        self.output = SubtitleCoalescer()
+        await self.writer.start()
+        if self.passthrough and getattr(self.writer, 'takes_objects', False):
+            # Events go to Neovim as objects (daemon --nvim); there is no JSON text to pass through
+            self.passthrough = False
+        drain_task = asyncio.create_task(self.drain_output())
+        if standalone:
+            self.stdin_task = asyncio.create_task(self.read_commands())
 
-    async def start(self):
-        """Start WebSocket server"""
         try:
-            self.server = await websockets.serve(
-                self.handle_client,
-                self.host,
-                self.port,
-                ping_interval=None  # Extension sends heartbeats
-            )
-
-            # Output ready event to stdout
-            ready_event = {
-                "type": "server_ready",
-                "host": self.host,
-                "port": self.port
-            }
-            print(json.dumps(ready_event), flush=True)
+            if replay is not None:
+                self.ready_event = {"type": "server_ready", "host": self.host, "port": self.port,
+                                    "replay": replay.path}
+                self.writer.write_json(self.ready_event)
+                await self.replay(replay, speed, seek_ms)
+                # Keep answering history and search commands until Neovim goes away
+                if self.stdin_task is not None:
+                    await self.stdin_task
+                await self.writer.close()
+                return
+
+            # Sockets bound (and announced) before the imports when run as a script
+            sockets = fast_start.claim(self.host, self.port)
+            self.ready_event = fast_start.relay_ready(self.host, self.port)
+            if sockets is None:
+                sockets = fast_start.bind_sockets(self.host, self.port)
+                self.writer.write_json(self.ready_event)
+
+            for sock in sockets:
+                self.servers.append(await websockets.serve(
+                    self.handle_client,
+                    sock=sock,
+                    ping_interval=None  # Extension sends heartbeats
+                ))
 
             # Keep server running
-            await self.server.wait_closed()
+            await asyncio.gather(*(server.wait_closed() for server in self.servers))
 
         except OSError as e:
             # Port already in use or other OS error
@@ -92,35 +753,78 @@ class SubtitleWebSocketServer:
                 "type": "server_error",
                 "error": str(e)
             }
-            print(json.dumps(error_event), flush=True)
-            sys.exit(1)
+            self.writer.write_json(error_event)
+            if standalone:
+                await self.writer.close()
+                sys.exit(1)
 
         except Exception as e:
             error_event = {
                 "type": "server_error",
                 "error": str(e)
             }
-            print(json.dumps(error_event), flush=True)
-            sys.exit(1)
+            self.writer.write_json(error_event)
+            if standalone:
+                await self.writer.close()
+                sys.exit(1)
+
+        finally:
+            drain_task.cancel()
+            self.stop_timers()
+            if self.stdin_task is not None:
+                self.stdin_task.cancel()
+            if self.recorder is not None:
+                self.recorder.flush()
 
     async def stop(self):
         """Stop WebSocket server"""
-        if self.server:
-            self.server.close()
-            await self.server.wait_closed()
+        for server in self.servers:
+            server.close()
+            await server.wait_closed()
 
 
 def main():
     """Main entry point"""
-    parser = argparse.ArgumentParser(description='WebSocket server for subjoyer.nvim')
+    parser = argparse.ArgumentParser(description='WebSocket server for subjoyer.nvim', allow_abbrev=False)
     parser.add_argument('--host', default='localhost', help='Host to bind to')
     parser.add_argument('--port', type=int, default=8767, help='Port to bind to')
-    args = parser.parse_args()
+    parser.add_argument('--passthrough', action='store_true',
+                        help='Forward well-formed frames verbatim instead of re-encoding them')
+    parser.add_argument('--overflow', choices=OVERFLOW_POLICIES, default='drop_oldest',
+                        help='What to do when the stdout queue is full')
+    parser.add_argument('--max-pending', type=int, default=1024, help='Max lines queued for stdout')
+    parser.add_argument('--liveness-timeout', type=float, default=15.0,
+                        help='Seconds without frames (heartbeats included) before the extension is reported stalled')
+    parser.add_argument('--stats-interval', type=float, default=5.0,
+                        help='Seconds between stats events (0 = off)')
+    parser.add_argument('--history-size', type=int, default=HISTORY_SIZE,
+                        help='Subtitles kept for history queries (0 = off)')
+    parser.add_argument('--schedule-delay', type=float, default=SCHEDULE_DELAY_MS,
+                        help='Ms after the extension sent a subtitle that it is shown (0 = on arrival)')
+    parser.add_argument('--record', help='Append every frame from the extension to this recording')
+    parser.add_argument('--replay', help='Play this recording instead of listening for the extension')
+    parser.add_argument('--speed', type=float, default=1.0, help='Replay speed (0 = as fast as possible)')
+    parser.add_argument('--seek', type=float, help='Start the replay at this video time (seconds)')
+    parser.add_argument('--log-level', choices=LOG_LEVELS, default='off', help='Entries kept in the log buffer')
+    args = fast_start.parse_args(parser)
+    LOG.set_level(args.log_level)
+
+    try:
+        recorder = SessionRecorder(args.record) if args.record else None
+        recording = SessionRecording(args.replay) if args.replay else None
+    except (OSError, ValueError) as e:
+        print(json.dumps({"type": "server_error", "error": str(e)}), flush=True)
+        sys.exit(1)
 
-    server = SubtitleWebSocketServer(host=args.host, port=args.port)
+    writer = StdoutWriter(max_pending=args.max_pending, overflow=args.overflow)
+    server = SubtitleWebSocketServer(host=args.host, port=args.port, passthrough=args.passthrough, writer=writer,
+                                     liveness_timeout=args.liveness_timeout, stats_interval=args.stats_interval,
+                                     history_size=args.history_size, recorder=recorder,
+                                     schedule_delay=args.schedule_delay)
+    seek_ms = round(args.seek * 1000) if args.seek is not None else None
 
     try:
-        asyncio.run(server.start())
+        asyncio.run(server.start(replay=recording, speed=args.speed, seek_ms=seek_ms))
     except KeyboardInterrupt:
         # Clean shutdown on Ctrl+C
         shutdown_event = {
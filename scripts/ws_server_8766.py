@@ -4,195 +4,862 @@
 subjoyer.nvim - asbplayer WebSocket Server
 Accepts connections from asbplayer WebSocket client and forwards commands from Neovim.
 
+The bridge owns request correlation: every command with a messageId is
+tracked until the client answers it. At most --max-in-flight commands are
+sent and unanswered at a time; the rest wait in order. Each tracked command
+ends in exactly one event, {"type": "asbplayer_response"} with the client's
+answer or {"type": "asbplayer_timeout"} once --command-timeout seconds have
+passed since Neovim sent it. An answer that comes after the timeout (or
+names no command the bridge knows) is forwarded as
+{"type": "asbplayer_late_response"}, for logging only. Either event has
+"spooled": true when the answer settles a spooled card (see below). If the client
+disconnects, its unanswered commands (other than mines) are sent again to
+the next client.
+
+Several asbplayer clients (tabs) may be connected at once. Commands go to
+the active one: the client picked with select-client, or else the one that
+answered or connected most recently (PINGs do not count, so a stale tab
+does not win). A command with "broadcast": true is encoded once and sent to
+every client. Each client has its own send queue, so a slow tab only
+delays itself. Answered locally:
+
+    list-clients   {"clients": [{"client": "ip:port", "active": bool, "idle": SECS}]}
+    select-client  {"client": "ip:port"}  (null to go back to automatic)
+
+load-subtitles files may name a local "path" instead of carrying "base64"
+content: the bridge memory-maps the file, base64-encodes it off the event
+loop and sends one pre-built frame. Encoded files are cached by path, mtime
+and size, so loading the same track again costs no file I/O or encoding.
+
+Loaded files (path or base64) are also parsed into cue indexes, one per
+track, so Neovim can ask the bridge instead of the browser:
+
+    next-cues    {"timestamp": MS, "count": N}   display-ready subtitles for
+                 the next N cue starts, to show when the playback clock
+                 crosses them
+    cues-around  {"timestamp": MS, "before": MS, "after": MS}  cues per track
+    seek-cue     {"timestamp": MS, "direction": "previous"|"current"|"next"}
+                 sent to asbplayer as seek-timestamp to that cue's start
+
+After a load, {"type": "asbplayer_cues_loaded", "tracks": [cue counts]}
+tells Neovim cues are available.
+
+With --spool PATH, mine-subtitle commands are journaled to disk (see
+mining_spool.py) until asbplayer acknowledges them. Mined while no client
+is connected, a card is answered with {"type": "asbplayer_spooled"}; once a
+client connects, the spool is sent in batches of --max-in-flight commands,
+each removed once asbplayer answers it. An answer is final, error or not:
+Neovim has reported it, so the card is not sent again. Cards that timed
+out before they were sent are retried up to SPOOL_ATTEMPTS times per
+connection and otherwise wait for the next one. A card that was sent but never answered (timed out, or its
+client went away) may already be in Anki, so it is never resent on its
+own: it is held as unknown until Neovim sends
+
+    spool-resolve  {"card": ID, "action": "resend"|"discard"}
+
+{"type": "asbplayer_spool", "depth": N, "unknown": [{"messageId", "fields"}]}
+reports the spool whenever it changes.
+
+Diagnostics go to the process log (bridge_io.BridgeLog, off unless
+--log-level says otherwise); {"command": "log", "level": NAME} answers with
+the buffered entries and optionally changes the level.
+
+While commands are flowing, an {"type": "asbplayer_stats"} event reports
+commands/sec and round-trip percentiles (stdin command to the response with
+the same messageId) every --stats-interval seconds. The stats timer only
+runs while a client is connected, so an idle bridge sleeps.
+
 Requirements:
     pip install websockets
 
 Usage:
-    python ws_server_8766.py [--host HOST] [--port PORT]
+    python ws_server_8766.py [--host HOST] [--port PORT] [--overflow POLICY] [--max-pending N]
+                             [--max-in-flight N] [--command-timeout SECS] [--stats-interval SECS]
+                             [--spool PATH] [--log-level LEVEL]
 """
 
+if __name__ == "__main__":
+    # Bind and announce before the slow imports below (see fast_start.py)
+    import fast_start
+    fast_start.early_start(fast_start.asbplayer_ready, '--host', '127.0.0.1', '--port', 8766)
+
 import asyncio
-import websockets.asyncio.server
+import contextlib
+import base64
 import json
+import mmap
+import os
 import sys
 import argparse
-import io
-from typing import Optional
-import threading
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Set
+
+import fast_start
+try:
+    import websockets.asyncio.server
+except ImportError as e:
+    # Neovim may already have the ready event from early_start()
+    fast_start.abandon(f"Cannot import websockets: {e}")
+    raise
+from bridge_io import (LOG, LOG_LEVELS, OVERFLOW_POLICIES, LatencyHistogram, Logger, StdoutWriter, force_utf8_stdio,
+                       json_dumps, json_loads, log_command, open_stdin_reader)
+from display_filter import DisplayFilter
+from mining_spool import MiningSpool
+from subtitle_index import CueIndex, parse_subtitles
 
 # Force UTF-8 encoding for stdout/stderr
-if sys.platform == 'win32':
-    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
-    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+force_utf8_stdio()
+
+log = Logger('asbplayer')
+
+# Commands awaiting a response (sent or not); beyond this new ones are refused
+MAX_TRACKED_COMMANDS = 1024
+
+
+# Total size of the encoded subtitle files kept for reloading
+FILE_CACHE_BYTES = 64 * 1024 * 1024
+
+# Longest command shown in debug output
+DEBUG_COMMAND_CHARS = 300
+
+# Most cues a single next-cues command returns
+MAX_CUES_PER_REQUEST = 64
+
+# Timeouts of an unsent spooled card per client connection before it waits for the next one
+SPOOL_ATTEMPTS = 3
+
+
+class PrebuiltCommand(dict):
+    """A command whose JSON frame was built ahead of time (large load-subtitles payloads, broadcasts)"""
+
+    def __init__(self, command: dict, frame: str, broadcast: bool = False):
+        super().__init__(command)
+        self.frame = frame
+        self.broadcast = broadcast
+
+
+class AsbplayerClient:
+    """One connected asbplayer tab with its own queue of outgoing frames.
+
+    Frames are sent by the client's own task, so a tab that is slow to read
+    only ever delays itself.
+    """
+
+    def __init__(self, websocket, now: float):
+        self.websocket = websocket
+        host, port = websocket.remote_address[:2]
+        self.name = f"{host}:{port}"
+        self.last_active = now  # loop time of the connection or the last non-PING message
+        self.outgoing = deque()
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def send(self, frame: str):
+        self.outgoing.append(frame)
+        self.wakeup.set()
+
+    async def pump(self):
+        """Send queued frames in order until the connection closes"""
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            while self.outgoing:
+                frame = self.outgoing.popleft()
+                log.debug("Sending to %s: %.*s", self.name, DEBUG_COMMAND_CHARS, frame)
+                try:
+                    await self.websocket.send(frame)
+                except websockets.exceptions.ConnectionClosed:
+                    # handle_client() requeues whatever this client never answered
+                    return
+                except Exception as e:
+                    log.warning("Error sending to %s: %s", self.name, e)
+
+
+class SubtitleFileCache:
+    """Encoded load-subtitles file entries, keyed by path and invalidated by mtime/size.
+
+    Each entry is the finished JSON fragment {"name": ..., "base64": ...}, so
+    a cached file is spliced into the frame without copying it again, plus
+    the file's parsed CueIndex.
+    """
+
+    def __init__(self, max_bytes: int = FILE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # path -> (mtime_ns, size, name, fragment, index)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, path: str, name: str) -> tuple:
+        """(JSON fragment, CueIndex) for one file; runs in a worker thread"""
+        stat = os.stat(path)
+        entry = self.entries.get(path)
+        if entry is not None and entry[:3] == (stat.st_mtime_ns, stat.st_size, name):
+            self.entries.move_to_end(path)
+            self.hits += 1
+            return entry[3], entry[4]
+
+        self.misses += 1
+        encoded, index = self.read(path, name, stat.st_size)
+        fragment = '{"name":' + json.dumps(name) + ',"base64":"' + encoded + '"}'
+        self.store(path, (stat.st_mtime_ns, stat.st_size, name, fragment, index))
+        return fragment, index
+
+    @staticmethod
+    def read(path: str, name: str, size: int) -> tuple:
+        if size == 0:
+            return '', CueIndex([])
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return base64.b64encode(mapped).decode('ascii'), CueIndex(parse_subtitles(name, mapped))
+
+    def store(self, path: str, entry: tuple):
+        old = self.entries.pop(path, None)
+        if old is not None:
+            self.size -= len(old[3])
+        if len(entry[3]) > self.max_bytes:
+            return
+        self.entries[path] = entry
+        self.size += len(entry[3])
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted[3])
+
+
+def index_base64(name: str, content: str) -> CueIndex:
+    """CueIndex of a file sent inline as base64; runs in a worker thread"""
+    return CueIndex(parse_subtitles(name, base64.b64decode(content)))
+
+
+class PendingCommand:
+    """A command from Neovim that has not been answered or timed out yet"""
+
+    __slots__ = ('command', 'received', 'deadline')
+
+    def __init__(self, command: dict, received: float, deadline: float):
+        self.command = command
+        self.received = received  # loop time the command arrived from Neovim
+        self.deadline = deadline
 
 
 class AsbplayerWebSocketServer:
-    def __init__(self, host: str = '127.0.0.1', port: int = 8766):
+    def __init__(self, host: str = '127.0.0.1', port: int = 8766, writer: Optional[StdoutWriter] = None,
+                 relay=None, stats_interval: float = 5.0, max_in_flight: int = 8, command_timeout: float = 10.0,
+                 spool: Optional[MiningSpool] = None):
         self.host = host
         self.port = port
+        self.stats_interval = stats_interval
+        self.max_in_flight = max(1, max_in_flight)
+        self.command_timeout = command_timeout
+        self.writer = writer or StdoutWriter(overflow='wait')
+        self.relay = relay  # SubtitleWebSocketServer sharing this process (daemon mode)
         self.server = None
-        self.client_websocket = None
-        self.command_queue = asyncio.Queue()
+        self.clients: Dict[str, AsbplayerClient] = {}  # by "ip:port", in connection order
+        self.selected: Optional[str] = None  # client picked with select-client
+        self.command_queue = deque()  # commands waiting for a client or a free in-flight slot
+        self.stdin_task = None
+        self.stats_task = None  # running while a client is connected
+        self.send_task = None
+        self.ready_event = None
+        # messageId -> command, in arrival order; with one timeout that is also deadline order
+        self.pending: Dict[str, PendingCommand] = {}
+        self.in_flight: Dict[str, AsbplayerClient] = {}  # messageId -> client it was sent to, not answered yet
+        self.expiry_handle: Optional[asyncio.TimerHandle] = None
+        self.send_wakeup: Optional[asyncio.Event] = None
+        self.file_cache = SubtitleFileCache()
+        self.cue_tracks: List[CueIndex] = []  # one per file of the last load-subtitles
+        self.cues_event = None
+        self.display: Optional[DisplayFilter] = None  # standalone only; the daemon uses the relay's
+        self.spool = spool  # --spool
+        self.spool_sending: Set[str] = set()  # spooled messageIds of the batch being sent
+        self.spool_attempts: Dict[str, int] = {}  # unsent timeouts per spooled messageId, this connection
+        self.round_trips = LatencyHistogram()
+        self.commands = 0
+        self.reported_commands = 0
+        if relay is not None:
+            # The relay hides subtitles at the end of the loaded cues
+            relay.cue_end = self.cue_end
+        self.timeouts = 0
+        self.reported_timeouts = 0
 
     async def handle_client(self, websocket):
         """Handle incoming WebSocket connection from asbplayer"""
-        print(f"[DEBUG] Connection from {websocket.remote_address}", file=sys.stderr, flush=True)
-
-        # Only allow one client at a time
-        if self.client_websocket:
-            print(f"[DEBUG] Client already connected, rejecting", file=sys.stderr, flush=True)
-            return
-
-        self.client_websocket = websocket
-        client_addr = websocket.remote_address
-        print(f"[DEBUG] asbplayer connected from {client_addr[0]}:{client_addr[1]}", file=sys.stderr, flush=True)
+        client = AsbplayerClient(websocket, asyncio.get_running_loop().time())
+        log.info("Client connected from %s", client.name)
+        first = not self.clients
+        self.clients[client.name] = client
+        client.task = asyncio.create_task(client.pump())
+        if first and self.stats_interval > 0:
+            self.stats_task = asyncio.create_task(self.report_stats())
 
         # Notify Neovim of connection
-        connection_event = {
-            "type": "asbplayer_connected",
-            "client": f"{client_addr[0]}:{client_addr[1]}"
-        }
-        print(json.dumps(connection_event), flush=True)
+        self.writer.write_json(self.client_event("asbplayer_connected", client))
 
-        send_task = None
         try:
-            # Start send task in background
-            send_task = asyncio.create_task(self.process_command_queue(websocket))
+            # Deliver anything Neovim sent before a client showed up, then the spool
+            self.wake_sender()
+            if first:
+                self.spool_attempts.clear()
+            self.feed_spool()
 
             # Main receive loop
-            await self.receive_messages(websocket)
+            await self.receive_messages(client)
 
         except Exception as e:
-            print(f"[DEBUG] Client handler error: {e}", file=sys.stderr, flush=True)
+            log.error("Client handler error: %s", e)
         finally:
-            # Cancel send task if still running
-            if send_task:
-                send_task.cancel()
-                try:
-                    await send_task
-                except asyncio.CancelledError:
-                    pass
-
-            self.client_websocket = None
-            disconnect_event = {
-                "type": "asbplayer_disconnected",
-                "client": f"{client_addr[0]}:{client_addr[1]}"
-            }
-            print(json.dumps(disconnect_event), flush=True)
+            client.task.cancel()
+            del self.clients[client.name]
+            if not self.clients and self.stats_task is not None:
+                self.stats_task.cancel()
+                self.stats_task = None
+            if self.selected == client.name:
+                self.selected = None
+            self.requeue_in_flight(client)
+            log.info("Client %s disconnected (%d left)", client.name, len(self.clients))
+            self.writer.write_json(self.client_event("asbplayer_disconnected", client))
+            self.wake_sender()
+
+    def active_client(self) -> Optional[AsbplayerClient]:
+        """The selected client, or else the most recently active one"""
+        if self.selected in self.clients:
+            return self.clients[self.selected]
+        return max(self.clients.values(), key=lambda client: client.last_active, default=None)
+
+    def client_event(self, event_type: str, client: AsbplayerClient) -> dict:
+        active = self.active_client()
+        return {
+            "type": event_type,
+            "client": client.name,
+            "clients": len(self.clients),
+            "active": active.name if active is not None else None
+        }
 
-    async def receive_messages(self, websocket):
+    def replay_state(self):
+        """Re-send the current state to a Neovim that attached late (persistent daemon)"""
+        if self.ready_event is not None:
+            self.writer.write_json(self.ready_event)
+        if self.cues_event is not None:
+            self.writer.write_json(self.cues_event)
+        if self.spool is not None:
+            self.writer.write_json(self.spool_event())
+        active = self.active_client()
+        if active is not None:
+            self.writer.write_json(self.client_event("asbplayer_connected", active))
+
+    async def receive_messages(self, client: AsbplayerClient):
         """Receive messages from asbplayer client"""
         try:
-            async for message in websocket:
+            async for message in client.websocket:
                 try:
                     # Handle text messages
                     if isinstance(message, str):
                         # asbplayer uses text-based PING/PONG for keepalive
                         if message.strip() == "PING":
-                            print(f"[DEBUG] Received PING, sending PONG", file=sys.stderr, flush=True)
-                            await websocket.send("PONG")
+                            log.debug("PING from %s", client.name)
+                            client.send("PONG")
                             continue
+                        client.last_active = asyncio.get_running_loop().time()
 
                         # Parse JSON response
-                        data = json.loads(message)
+                        data = json_loads(message)
 
-                        # Forward response to Neovim
-                        output = {
-                            "type": "asbplayer_response",
-                            "data": data
-                        }
-                        print(json.dumps(output, ensure_ascii=False), flush=True)
+                        # Forward response to Neovim; waits here (not in the pipe) if Neovim stops reading
+                        await self.writer.send_json(self.settle(data))
 
-                except json.JSONDecodeError as e:
-                    print(f"[DEBUG] Invalid JSON: {message!r}", file=sys.stderr, flush=True)
+                except json.JSONDecodeError:
+                    log.warning("Invalid JSON from %s: %.*r", client.name, DEBUG_COMMAND_CHARS, message)
                 except Exception as e:
-                    print(f"[DEBUG] Error processing message: {e}", file=sys.stderr, flush=True)
+                    log.error("Error processing message: %s", e)
         except websockets.exceptions.ConnectionClosed:
             pass  # Normal disconnection
 
-    async def process_command_queue(self, websocket):
-        """Process commands from Neovim and send to asbplayer"""
-        print(f"[DEBUG] Command queue processor started", file=sys.stderr, flush=True)
+    async def load_files(self, command: dict) -> dict:
+        """Index the files of a load-subtitles command; file paths become a pre-built frame.
+
+        Files given as {"path": ..., "name": ...} are read and encoded by the
+        bridge; files that already carry "base64" are passed through.
+        """
+        body = command.get('body') or {}
+        files = body.get('files') or []
+        loop = asyncio.get_running_loop()
+        fragments = []
+        tracks = []
+        for f in files:
+            if 'path' in f:
+                path = os.path.expanduser(f['path'])
+                name = f.get('name') or os.path.basename(path)
+                fragment, index = await loop.run_in_executor(None, self.file_cache.load, path, name)
+                fragments.append(fragment)
+            else:
+                fragments.append(None)
+                index = await loop.run_in_executor(None, index_base64, f.get('name') or '', f.get('base64') or '')
+            tracks.append(index)
+        self.set_cue_tracks(tracks)
+
+        if all(fragment is None for fragment in fragments):
+            return command
+        fragments = [fragment if fragment is not None else json_dumps(f) for fragment, f in zip(fragments, files)]
+
+        # Splice the cached fragments in instead of re-encoding them as part of the command
+        rest = {key: value for key, value in body.items() if key != 'files'}
+        frame_body = json_dumps(rest)[:-1] + (',' if rest else '') + '"files":[' + ','.join(fragments) + ']}'
+        head = {key: value for key, value in command.items() if key != 'body'}
+        frame = json_dumps(head)[:-1] + (',' if head else '') + '"body":' + frame_body + '}'
+        return PrebuiltCommand(head, frame)
+
+    def answer_locally(self, command: dict, display: Optional[DisplayFilter] = None) -> bool:
+        """Answer commands that need no browser round trip; returns True if handled"""
+        name = command.get('command')
+        body = command.get('body') or {}
         try:
-            while True:
-                try:
-                    # Wait for command from queue
-                    command = await asyncio.wait_for(
-                        self.command_queue.get(),
-                        timeout=1.0
-                    )
-
-                    print(f"[DEBUG] Dequeued command: {command.get('command')}", file=sys.stderr, flush=True)
-                    # Send command to asbplayer client
-                    command_json = json.dumps(command)
-                    print(f"[DEBUG] Sending to asbplayer: {command_json}", file=sys.stderr, flush=True)
-                    await websocket.send(command_json)
-                    print(f"[DEBUG] Sent successfully", file=sys.stderr, flush=True)
-
-                except asyncio.TimeoutError:
-                    # No command, continue waiting
-                    continue
-                except Exception as e:
-                    print(f"[DEBUG] Error sending command: {e}", file=sys.stderr, flush=True)
-                    import traceback
-                    traceback.print_exc(file=sys.stderr)
+            if name == 'current-subtitle' and self.relay is not None:
+                self.answer(command, {"subtitle": self.relay.current_subtitle()})
+            elif name == 'list-clients':
+                now = asyncio.get_running_loop().time()
+                active = self.active_client()
+                self.answer(command, {"clients": [
+                    {"client": client.name, "active": client is active, "idle": round(now - client.last_active, 1)}
+                    for client in self.clients.values()
+                ]})
+            elif name == 'select-client':
+                selected = body.get('client')
+                if selected is not None and selected not in self.clients:
+                    self.answer(command, error=f"No asbplayer client {selected}")
+                else:
+                    self.selected = selected
+                    active = self.active_client()
+                    self.answer(command, {"active": active.name if active is not None else None})
+            elif name == 'log':
+                self.answer(command, log_command(body))
+            elif name == 'spool-resolve':
+                self.resolve_unknown(command, body.get('card'), body.get('action'))
+            elif name == 'display-config':
+                self.display = DisplayFilter.from_command(command)
+            elif name == 'next-cues':
+                count = min(int(body.get('count', 8)), MAX_CUES_PER_REQUEST)
+                self.answer(command, {"cues": self.next_cues(int(body.get('timestamp', 0)), count, display)})
+            elif name == 'cues-around':
+                timestamp = int(body.get('timestamp', 0))
+                self.answer(command, {"tracks": self.cues_around(timestamp, int(body.get('before', 10000)),
+                                                                 int(body.get('after', 10000)))})
+            else:
+                return False
+        except (TypeError, ValueError, AttributeError) as e:
+            self.answer(command, error=f"Invalid {name} command: {e}")
+        return True
+
+    def set_cue_tracks(self, tracks: List[CueIndex]):
+        """Replace the cue indexes and tell Neovim"""
+        self.cue_tracks = tracks
+        self.cues_event = {"type": "asbplayer_cues_loaded", "tracks": [len(index) for index in tracks]}
+        self.writer.write_json(self.cues_event)
+
+    def cue_end(self, timestamp: int, tracks) -> Optional[int]:
+        """When the last of the cues showing at timestamp on tracks ends, or None"""
+        ends = [index.ends[i] for track, index in enumerate(self.cue_tracks) if track in tracks
+                for i in index.active(timestamp)]
+        return max(ends) if ends else None
+
+    def cue_display(self, display: Optional[DisplayFilter] = None) -> DisplayFilter:
+        """Display config applied to cues (the asking Neovim's, else the relay's in the daemon)"""
+        if display is None:
+            display = self.relay.display if self.relay is not None else self.display
+        return display or DisplayFilter(tracks='all', trim=False)
+
+    def next_cues(self, timestamp: int, count: int, display: Optional[DisplayFilter] = None) -> List[dict]:
+        """Display-ready subtitles for the next count cue starts after timestamp, all tracks merged"""
+        display = self.cue_display(display)
+        shown = [(track, index) for track, index in enumerate(self.cue_tracks)
+                 if display.tracks is None or track in display.tracks]
+
+        starts = sorted({index.starts[i] for _, index in shown for i in index.following(timestamp, count)})[:count]
+        cues = []
+        for start in starts:
+            lines = [{"text": index.texts[i], "track": track} for track, index in shown for i in index.active(start)]
+            event = display.prepare({"subtitle": {"lines": lines}, "video": {"currentTime": start / 1000}})
+            cues.append({"at": start, "subtitle": event})
+        return cues
+
+    def cues_around(self, timestamp: int, before: int, after: int) -> List[List[dict]]:
+        return [[index.cue(i) for i in index.between(timestamp - before, timestamp + after)]
+                for index in self.cue_tracks]
+
+    def resolve_seek(self, command: dict) -> Optional[dict]:
+        """Turn seek-cue into seek-timestamp by a local lookup; None if answered with an error"""
+        body = command.get('body') or {}
+        track = body.get('track', 0)
+        target = None
+        if isinstance(track, int) and 0 <= track < len(self.cue_tracks):
+            try:
+                target = self.cue_tracks[track].seek_target(int(body.get('timestamp', 0)),
+                                                            body.get('direction', 'next'))
+            except (TypeError, ValueError):
+                pass
+        if target is None:
+            self.answer(command, error='No cue to seek to')
+            return None
+        return {"command": "seek-timestamp", "messageId": command.get('messageId'), "body": {"timestamp": target}}
+
+    def answer(self, command: dict, body: Optional[dict] = None, error: Optional[str] = None):
+        """Respond to a command from Neovim without the client"""
+        response = {"command": "response", "messageId": command.get('messageId')}
+        if error is not None:
+            response["error"] = error
+        else:
+            response["body"] = body
+        self.writer.write_json({"type": "asbplayer_response", "data": response})
+
+    def track(self, command: dict) -> bool:
+        """Start the timeout of a command with a messageId; returns False if too many are pending"""
+        message_id = command['messageId']
+        if len(self.pending) >= MAX_TRACKED_COMMANDS:
+            self.writer.write_json({
+                "type": "asbplayer_timeout",
+                "messageId": message_id,
+                "command": command.get('command'),
+                "reason": "queue_full"
+            })
+            return False
+
+        now = asyncio.get_running_loop().time()
+        self.pending[message_id] = PendingCommand(command, now, now + self.command_timeout)
+        self.schedule_expiry()
+        return True
+
+    def settle(self, response) -> dict:
+        """Match a client response to its command; returns the event to forward it to Neovim as"""
+        message_id = response.get('messageId') if isinstance(response, dict) else None
+        if message_id is None:
+            return {"type": "asbplayer_response", "data": response}  # unsolicited message
+
+        pending = self.pending.pop(message_id, None)
+        if pending is None:
+            event = {"type": "asbplayer_late_response", "data": response}
+            if self.spool is not None and message_id in self.spool.unknown:
+                # A held card answered after all; Neovim reports the outcome
+                self.spool.done(message_id)
+                self.writer.write_json(self.spool_event())
+                self.feed_spool()
+                event["spooled"] = True
+                return event
+            # Neovim was already told it timed out; the command must not end twice
+            log.warning("Response to unknown or expired command %r", message_id)
+            return event
+
+        event = {"type": "asbplayer_response", "data": response}
+        self.round_trips.record((asyncio.get_running_loop().time() - pending.received) * 1000)
+        if self.in_flight.pop(message_id, None) is not None:
+            self.wake_sender()
+        if self.spool is not None and message_id in self.spool:
+            self.spool_settled(message_id, sent=True)
+            event["spooled"] = True
+        return event
+
+    def schedule_expiry(self):
+        """Arm the one timer for the earliest deadline, if it is not armed yet"""
+        if self.expiry_handle is None and self.pending:
+            deadline = next(iter(self.pending.values())).deadline
+            self.expiry_handle = asyncio.get_running_loop().call_at(deadline, self.expire)
+
+    def expire(self):
+        """Time out every command past its deadline and re-arm for the next one"""
+        self.expiry_handle = None
+        now = asyncio.get_running_loop().time()
+        while self.pending:
+            message_id, pending = next(iter(self.pending.items()))
+            if pending.deadline > now:
+                break
+            del self.pending[message_id]
+            sent = self.in_flight.pop(message_id, None) is not None
+            self.timeouts += 1
+            spooled = self.spool is not None and message_id in self.spool
+            # A command still in command_queue is skipped when its turn comes
+            self.writer.write_json({
+                "type": "asbplayer_timeout",
+                "messageId": message_id,
+                "command": pending.command.get('command'),
+                "reason": "timeout",
+                "sent": sent,
+                "spooled": spooled
+            })
+            if spooled and sent:
+                self.spool_unknown(message_id)
+            elif spooled:
+                self.spool_settled(message_id, sent=False)
+        self.schedule_expiry()
+        self.wake_sender()
+
+    def requeue_in_flight(self, client: AsbplayerClient):
+        """Put commands a lost client never answered back in front of the queue.
+
+        Mines are the exception: the client may have created the card before
+        it went away, so sending it again could add a duplicate. They fail
+        as "disconnected" (spooled ones are held as unknown) instead.
+        """
+        lost = {message_id for message_id, sent_to in self.in_flight.items() if sent_to is client}
+        if not lost:
+            return
+        for message_id in lost:
+            del self.in_flight[message_id]
+        unanswered = []
+        for message_id, pending in list(self.pending.items()):
+            if message_id not in lost:
+                continue
+            if pending.command.get('command') != 'mine-subtitle':
+                unanswered.append(pending.command)
+                continue
+            del self.pending[message_id]
+            spooled = self.spool is not None and message_id in self.spool
+            self.writer.write_json({
+                "type": "asbplayer_timeout",
+                "messageId": message_id,
+                "command": 'mine-subtitle',
+                "reason": "disconnected",
+                "sent": True,
+                "spooled": spooled
+            })
+            if spooled:
+                self.spool_unknown(message_id)
+        self.command_queue.extendleft(reversed(unanswered))
+        log.info("%d unanswered command(s) queued for the next client", len(unanswered))
+
+    def spool_event(self) -> dict:
+        unknown = [{"messageId": command['messageId'], "fields": (command.get('body') or {}).get('fields')}
+                   for command in self.spool.unknown_commands()]
+        return {"type": "asbplayer_spool", "depth": len(self.spool), "unknown": unknown}
+
+    def spool_unknown(self, message_id: str):
+        """Hold a spooled card that was sent but never answered until the user decides"""
+        log.warning("Spooled card %r was sent but not answered; holding it", message_id)
+        self.spool_sending.discard(message_id)
+        self.spool_attempts.pop(message_id, None)
+        self.spool.mark_unknown(message_id)
+        self.writer.write_json(self.spool_event())
+        if not self.spool_sending:
+            self.feed_spool()
+
+    def resolve_unknown(self, command: dict, card, action):
+        """spool-resolve: send an unknown card again, or drop it"""
+        if self.spool is None or card not in self.spool.unknown:
+            self.answer(command, error=f"No unknown spooled card {card}")
+            return
+        if action == 'resend':
+            self.spool.retry(card)
+        elif action == 'discard':
+            self.spool.done(card)
+        else:
+            self.answer(command, error=f"Invalid spool-resolve action {action}")
+            return
+        self.answer(command, {"depth": len(self.spool)})
+        self.writer.write_json(self.spool_event())
+        self.feed_spool()
+
+    def spool_settled(self, message_id: str, sent: bool):
+        """Record the outcome of a spooled card and send the next batch once this one is through.
+
+        An answered card is done even if asbplayer answered with an error;
+        only a card that timed out before it was sent is tried again.
+        """
+        self.spool_sending.discard(message_id)
+        if not sent:
+            self.spool_attempts[message_id] = self.spool_attempts.get(message_id, 0) + 1
+        else:
+            self.spool.done(message_id)
+            self.spool_attempts.pop(message_id, None)
+            self.writer.write_json(self.spool_event())
+        if not self.spool_sending:
+            self.feed_spool()
+
+    def feed_spool(self):
+        """Queue the next batch of spooled cards for the connected client.
+
+        A batch is one in-flight window, so every card is sent well before
+        its timeout; cards already pending (mined while connected) are
+        skipped.
+        """
+        if self.spool is None or not self.clients or self.spool_sending:
+            return
+        skip = set(self.pending)
+        skip.update(message_id for message_id, attempts in self.spool_attempts.items() if attempts >= SPOOL_ATTEMPTS)
+        for command in self.spool.batch(self.max_in_flight, skip):
+            if not self.track(command):
+                break
+            self.spool_sending.add(command['messageId'])
+            self.command_queue.append(command)
+        if self.spool_sending:
+            log.info("Sending %d spooled card(s)", len(self.spool_sending))
+            self.wake_sender()
+
+    def wake_sender(self):
+        if self.send_wakeup is not None:
+            self.send_wakeup.set()
+
+    async def send_commands(self):
+        """Hand queued commands to the active client in order while the window has room"""
+        while True:
+            await self.send_wakeup.wait()
+            self.send_wakeup.clear()
+
+            while self.command_queue and len(self.in_flight) < self.max_in_flight:
+                client = self.active_client()
+                if client is None:
                     break
-        except asyncio.CancelledError:
-            print(f"[DEBUG] Command queue processor cancelled", file=sys.stderr, flush=True)
-            raise
-
-    async def stdin_reader(self):
-        """Read commands from stdin (Neovim) and queue them"""
+                command = self.command_queue.popleft()
+                message_id = command.get('messageId')
+                if message_id is not None:
+                    if message_id not in self.pending:
+                        continue  # timed out while queued
+                    self.in_flight[message_id] = client
+
+                if isinstance(command, PrebuiltCommand):
+                    # Broadcasts were encoded once in dispatch_command; every client gets the same frame
+                    targets = list(self.clients.values()) if command.broadcast else [client]
+                    for target in targets:
+                        target.send(command.frame)
+                else:
+                    client.send(json_dumps(command))
+
+    def stats_event(self, elapsed: float) -> Optional[dict]:
+        """Command rate and round trips since the last stats event, or None if idle"""
+        commands = self.commands - self.reported_commands
+        timeouts = self.timeouts - self.reported_timeouts
+        if not commands and not timeouts and not self.round_trips.count:
+            return None
+        self.reported_commands = self.commands
+        self.reported_timeouts = self.timeouts
+        event = {
+            "type": "asbplayer_stats",
+            "commands_per_sec": round(commands / elapsed, 1),
+            "in_flight": len(self.in_flight),
+            "queued": len(self.command_queue),
+            "timeouts": timeouts,
+            "round_trip_ms": self.round_trips.snapshot()
+        }
+        if self.spool is not None:
+            event["spooled"] = len(self.spool)
+        # In the daemon the relay reports the shared writer
+        if self.relay is None:
+            event["write_ms"] = self.writer.write_times.snapshot()
+        return event
+
+    async def report_stats(self):
+        """Emit a stats event every stats_interval seconds while commands are flowing"""
         loop = asyncio.get_running_loop()
+        last = loop.time()
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            now = loop.time()
+            event = self.stats_event(now - last)
+            last = now
+            if event is not None:
+                self.writer.write_json(event)
+
+    async def dispatch_command(self, command: dict, display: Optional[DisplayFilter] = None):
+        """Queue a command for the client; it is sent as soon as the in-flight window has room"""
+        self.commands += 1
+        if self.answer_locally(command, display):
+            return
 
-        def read_stdin():
-            """Blocking stdin read in thread"""
-            print(f"[DEBUG] Stdin reader thread started", file=sys.stderr, flush=True)
-            while True:
-                try:
-                    line = sys.stdin.readline()
-                    if not line:
-                        print(f"[DEBUG] Stdin EOF", file=sys.stderr, flush=True)
-                        break
-                    line = line.strip()
-                    if line:
-                        print(f"[DEBUG] Stdin received: {line}", file=sys.stderr, flush=True)
-                        try:
-                            command = json.loads(line)
-                            print(f"[DEBUG] Queueing command: {command.get('command')}", file=sys.stderr, flush=True)
-                            # Queue command for sending to client
-                            asyncio.run_coroutine_threadsafe(
-                                self.command_queue.put(command),
-                                loop
-                            )
-                        except json.JSONDecodeError as e:
-                            print(f"[DEBUG] Invalid JSON from stdin: {e}", file=sys.stderr, flush=True)
-                except Exception as e:
-                    print(f"[DEBUG] Error reading stdin: {e}", file=sys.stderr, flush=True)
-                    import traceback
-                    traceback.print_exc(file=sys.stderr)
-                    break
+        broadcast = bool(command.pop('broadcast', False))
+        message_id = command.get('messageId')
+        if message_id is not None and message_id in self.pending:
+            log.warning("Rejecting duplicate messageId %r", message_id)
+            self.answer(command, error=f"Duplicate messageId {message_id}")
+            return
 
-        # Run stdin reader in thread to avoid blocking
-        thread = threading.Thread(target=read_stdin, daemon=True)
-        thread.start()
-        print(f"[DEBUG] Stdin reader thread launched", file=sys.stderr, flush=True)
+        if command.get('command') == 'mine-subtitle' and self.spool is not None and message_id is not None:
+            # On disk before anything is sent, so a reload or crash cannot lose the card
+            try:
+                await self.spool.add(message_id, command)
+            except OSError as e:
+                log.error("Cannot spool card: %s", e)
+            else:
+                if not self.clients:
+                    self.writer.write_json({"type": "asbplayer_spooled", "messageId": message_id,
+                                            "depth": len(self.spool)})
+                    return
+
+        if command.get('command') == 'load-subtitles':
+            try:
+                command = await self.load_files(command)
+            except (OSError, ValueError, TypeError) as e:
+                self.answer(command, error=f"Cannot load subtitles: {e}")
+                return
+        elif command.get('command') == 'seek-cue':
+            command = self.resolve_seek(command)
+            if command is None:
+                return
+
+        if broadcast:
+            frame = command.frame if isinstance(command, PrebuiltCommand) else json_dumps(command)
+            command = PrebuiltCommand(command, frame, broadcast=True)
+
+        if message_id is not None and not self.track(command):
+            return
 
-    async def start(self):
-        """Start WebSocket server"""
+        self.command_queue.append(command)
+        self.wake_sender()
+
+    async def read_commands(self):
+        """Read commands from stdin (Neovim) as they arrive and dispatch them"""
+        reader = await open_stdin_reader()
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError as e:
+                # Line longer than the reader limit
+                log.warning("Error reading stdin: %s", e)
+                continue
+
+            if not line:
+                log.info("Stdin EOF")
+                break
+
+            line = line.strip()
+            if not line:
+                continue
+
+            try:
+                command = json_loads(line)
+            except json.JSONDecodeError as e:
+                log.warning("Invalid JSON from stdin: %s", e)
+                continue
+            if not isinstance(command, dict):
+                log.warning("Ignoring non-object command from stdin: %.80r", line)
+                continue
+
+            await self.dispatch_command(command)
+
+    async def start(self, standalone: bool = True):
+        """Start WebSocket server
+
+        A standalone server owns the process: it reads commands from stdin and
+        exits on errors. Inside the daemon, commands are routed to
+        dispatch_command() and errors are reported without exiting.
+        """
         try:
-            # Start stdin reader
-            await self.stdin_reader()
+            await self.writer.start()
 
-            # Output ready event to stdout
-            ready_event = {
-                "type": "asbplayer_server_ready",
-                "url": f"ws://{self.host}:{self.port}/ws"
-            }
-            print(json.dumps(ready_event), flush=True)
+            self.send_wakeup = asyncio.Event()
+            self.send_task = asyncio.create_task(self.send_commands())
 
-            # Start WebSocket server (websockets 16.0 API)
-            async with websockets.asyncio.server.serve(self.handle_client, self.host, self.port):
+            # Start stdin reader
+            if standalone:
+                self.stdin_task = asyncio.create_task(self.read_commands())
+
+            # Sockets bound (and announced) before the imports when run as a script
+            sockets = fast_start.claim(self.host, self.port)
+            self.ready_event = fast_start.asbplayer_ready(self.host, self.port)
+            if sockets is None:
+                sockets = fast_start.bind_sockets(self.host, self.port)
+                self.writer.write_json(self.ready_event)
+            if self.spool is not None:
+                self.writer.write_json(self.spool_event())
+
+            # Start WebSocket server (websockets 16.0 API), one per bound address
+            async with contextlib.AsyncExitStack() as servers:
+                for sock in sockets:
+                    await servers.enter_async_context(websockets.asyncio.server.serve(self.handle_client, sock=sock))
                 await asyncio.Future()  # run forever
 
         except OSError as e:
@@ -201,26 +868,59 @@ class AsbplayerWebSocketServer:
                 "type": "asbplayer_server_error",
                 "error": str(e)
             }
-            print(json.dumps(error_event), flush=True)
-            sys.exit(1)
+            self.writer.write_json(error_event)
+            if standalone:
+                await self.writer.close()
+                sys.exit(1)
 
         except Exception as e:
             error_event = {
                 "type": "asbplayer_server_error",
                 "error": str(e)
             }
-            print(json.dumps(error_event), flush=True)
-            sys.exit(1)
+            self.writer.write_json(error_event)
+            if standalone:
+                await self.writer.close()
+                sys.exit(1)
+
+        finally:
+            if self.stats_task is not None:
+                self.stats_task.cancel()
+            if self.send_task is not None:
+                self.send_task.cancel()
+            if self.expiry_handle is not None:
+                self.expiry_handle.cancel()
+            if self.spool is not None:
+                self.spool.close()
 
 
 def main():
     """Main entry point"""
-    parser = argparse.ArgumentParser(description='asbplayer WebSocket server for subjoyer.nvim')
+    parser = argparse.ArgumentParser(description='asbplayer WebSocket server for subjoyer.nvim', allow_abbrev=False)
     parser.add_argument('--host', default='127.0.0.1', help='Host to bind to')
     parser.add_argument('--port', type=int, default=8766, help='Port to bind to')
-    args = parser.parse_args()
+    parser.add_argument('--overflow', choices=OVERFLOW_POLICIES, default='wait',
+                        help='What to do when the stdout queue is full')
+    parser.add_argument('--max-pending', type=int, default=1024, help='Max lines queued for stdout')
+    parser.add_argument('--max-in-flight', type=int, default=8, help='Max commands sent and awaiting a response')
+    parser.add_argument('--command-timeout', type=float, default=10.0,
+                        help='Seconds before an unanswered command times out')
+    parser.add_argument('--stats-interval', type=float, default=5.0, help='Seconds between stats events (0 = off)')
+    parser.add_argument('--spool', help='Journal mine-subtitle commands here until asbplayer acknowledges them')
+    parser.add_argument('--log-level', choices=LOG_LEVELS, default='off', help='Entries kept in the log buffer')
+    args = fast_start.parse_args(parser)
+    LOG.set_level(args.log_level)
 
-    server = AsbplayerWebSocketServer(host=args.host, port=args.port)
+    try:
+        spool = MiningSpool(os.path.expanduser(args.spool)) if args.spool else None
+    except OSError as e:
+        print(json.dumps({"type": "asbplayer_server_error", "error": f"Cannot open spool: {e}"}), flush=True)
+        sys.exit(1)
+
+    writer = StdoutWriter(max_pending=args.max_pending, overflow=args.overflow)
+    server = AsbplayerWebSocketServer(host=args.host, port=args.port, writer=writer, stats_interval=args.stats_interval,
+                                      max_in_flight=args.max_in_flight, command_timeout=args.command_timeout,
+                                      spool=spool)
 
     try:
         asyncio.run(server.start())